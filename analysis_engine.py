@@ -1,25 +1,39 @@
 # -*- coding: utf-8 -*-
 """
-核心分析引擎 v4.4 (支持单账户独立成本 + 财报期对比提示)
+核心分析引擎 v4.5 (支持单账户独立成本 + 财报期对比提示)
 更新日志：
+- [优化] 输入表指纹 (行数 + 最大时间戳) 与上次分析一致时直接跳过，`--force` 强制重算。
 - [优化] 变动分析文案增加对比日期，例如 "(较2025-06-30)".
+- [优化] 股东按 holder_id (nt_holders 维度表) 分组并关联考古成本，同一机构的不同写法合并为一条持仓线。
 """
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text, inspect
 import datetime
 from tqdm import tqdm
 import logging
+import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ================= 配置引用 =================
-from config import DB_URL, COST_DISCOUNT
+from config import COST_DISCOUNT
+from leaderboard import build_leaderboard, LEADERBOARD_TABLE
+import pipeline_state
+import metrics
+import db
+import market_store
+import fast_read
 MAX_WORKERS = 10
+LATEST_VIEW = "mv_nt_latest_positions"
+# 分析输入表；指纹与上次分析一致时跳过 (基本面参与物化视图关联, 一并纳入)
+INPUT_TABLES = ["nt_shareholders", "nt_history_cost", "nt_market_data", "stock_basic", "nt_stock_fundamentals"]
+STATE_KEY = "analysis_engine"
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
 class NationalTeamAnalyzer:
-    def __init__(self):
-        self.engine = create_engine(DB_URL, pool_size=20, max_overflow=0)
+    def __init__(self, engine=None):
+        self.engine = engine or db.get_engine("analysis")
+        metrics.instrument_engine(self.engine)
         
     def get_all_latest_prices(self):
         sql = "SELECT DISTINCT ON (ts_code) ts_code, close FROM nt_market_data ORDER BY ts_code, trade_date DESC"
@@ -30,25 +44,31 @@ class NationalTeamAnalyzer:
 
     def get_history_info(self):
         print(">>> 正在加载精细化考古档案...")
-        try:
-            sql = "SELECT ts_code, holder_name, hist_cost, first_buy_date FROM nt_history_cost"
-            df = pd.read_sql(sql, self.engine)
-            cost_map = {}
-            date_map = {}
-            for _, row in df.iterrows():
-                key = (row['ts_code'], row['holder_name'])
-                cost_map[key] = row['hist_cost']
-                if row['first_buy_date']:
-                    date_map[key] = pd.to_datetime(row['first_buy_date'])
-            return cost_map, date_map
-        except: return {}, {}
+        # nt_history_cost 仍按名称唯一, 同一机构的多种写法各有一行: 取建仓最早的一行
+        sql = """
+            SELECT DISTINCT ON (ts_code, holder_id) ts_code, holder_id, hist_cost, first_buy_date
+            FROM nt_history_cost WHERE holder_id IS NOT NULL
+            ORDER BY ts_code, holder_id, first_buy_date ASC NULLS LAST, holder_name
+        """
+        df = pd.read_sql(sql, self.engine)
+        cost_map = {}
+        date_map = {}
+        for _, row in df.iterrows():
+            key = (row['ts_code'], row['holder_id'])
+            cost_map[key] = row['hist_cost']
+            if row['first_buy_date']:
+                date_map[key] = pd.to_datetime(row['first_buy_date'])
+        return cost_map, date_map
 
     def get_quarter_vwap(self, ts_code, end_date):
         start_date = end_date - datetime.timedelta(days=90)
+        bars = market_store.read_stock(ts_code, columns=["amount", "vol"], start=start_date, end=end_date)
+        if bars is not None and not bars.empty:
+            vol = bars['vol'].sum()
+            return float(bars['amount'].sum()) / (float(vol) * 100) if vol > 0 else 0.0
         try:
             with self.engine.connect() as conn:
-                sql = text("SELECT sum(amount), sum(vol) FROM nt_market_data WHERE ts_code = :c AND trade_date >= :s AND trade_date <= :e")
-                res = conn.execute(sql, {"c": ts_code, "s": start_date, "e": end_date}).fetchone()
+                res = db.execute_prepared(conn, "quarter_vwap", ts_code, start_date, end_date).fetchone()
                 if res and res[1] and res[1] > 0: return float(res[0]) / (float(res[1]) * 100)
         except: pass
         return 0.0
@@ -102,7 +122,7 @@ class NationalTeamAnalyzer:
             ts_code = row['ts_code']
             holder = row['holder_name']
             
-            key = (ts_code, holder)
+            key = (ts_code, row['holder_id'])
             h_cost = hist_costs.get(key, 0)
             f_date = hist_dates.get(key, None)
             
@@ -113,6 +133,7 @@ class NationalTeamAnalyzer:
                 est_cost = float(h_cost)
                 cost_method = "⏳ 历史回溯"
             else:
+                metrics.inc("vwap_lookups_total")
                 vwap = self.get_quarter_vwap(ts_code, row['end_date'])
                 if vwap > 0:
                     est_cost = vwap * COST_DISCOUNT
@@ -131,7 +152,7 @@ class NationalTeamAnalyzer:
             analysis = self.generate_change_analysis(row, prev_row, h_cost, curr_price, f_date)
             
             results.append({
-                "ts_code": ts_code, "name": row.get('name', ''), "holder_name": holder,
+                "ts_code": ts_code, "name": row.get('name', ''), "holder_name": holder, "holder_id": row['holder_id'],
                 "period_end": row['end_date'], "hold_amount": row['hold_amount'],
                 "est_cost": round(est_cost, 2), "curr_price": curr_price,
                 "profit_rate": round(profit_rate, 4), "status": status,
@@ -142,23 +163,72 @@ class NationalTeamAnalyzer:
             prev_row = row
         return results
 
-    def analyze_positions(self):
+    @metrics.timed("stage_seconds", stage="analysis")
+    def analyze_positions(self, force=False):
+        fp = pipeline_state.fingerprint(self.engine, INPUT_TABLES)
+        if not force and fp == pipeline_state.last_fingerprint(self.engine, STATE_KEY):
+            print("⏩ 分析输入 (股东/考古成本/行情/股票名称/基本面) 自上次分析以来无变化，跳过。")
+            metrics.inc("analysis_skipped_total")
+            return
         print(">>> 🕵️‍♂️ 开始分析 (支持多账户独立成本)...")
         latest_prices = self.get_all_latest_prices()
         hist_costs, hist_dates = self.get_history_info()
         
-        df_all = pd.read_sql("SELECT s.*, b.name FROM nt_shareholders s LEFT JOIN stock_basic b ON s.ts_code = b.ts_code WHERE s.ann_date > '2022-01-01' ORDER BY s.ts_code, s.holder_name, s.end_date", self.engine)
+        df_all = fast_read.load_analysis_shareholders(self.engine)
         
+        metrics.inc("rows_read_total", len(df_all), table="nt_shareholders")
+        # 不同写法归并为同一 holder_id 后, 同一报告期可能出现多行: 保留最后公告的一行
+        df_all = df_all.sort_values(['ann_date', 'id']).drop_duplicates(['ts_code', 'holder_id', 'end_date'], keep='last')
         final_results = []
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = [executor.submit(self.process_group, group, latest_prices, hist_costs, hist_dates) for _, group in df_all.groupby(['ts_code', 'holder_name'])]
+            futures = [executor.submit(self.process_group, group, latest_prices, hist_costs, hist_dates) for _, group in df_all.groupby(['ts_code', 'holder_id'])]
             for future in tqdm(as_completed(futures), total=len(futures)):
                 final_results.extend(future.result())
 
         if final_results:
             df_res = pd.DataFrame(final_results)
-            df_res.to_sql('nt_positions_analysis', self.engine, if_exists='replace', index=False)
+            self.save_positions(df_res)
+            self.save_leaderboard(df_res[df_res['is_latest']])
+            self.refresh_latest_view()
+            pipeline_state.save_state(self.engine, STATE_KEY, "success", fp=fp)
             print("🚀 分析完成，数据已入库！")
 
+    def refresh_latest_view(self):
+        """刷新最新持仓物化视图；CONCURRENTLY 刷新期间前端仍可读取旧数据"""
+        with self.engine.connect() as conn:
+            populated = conn.execute(text("SELECT relispopulated FROM pg_class WHERE relname = :v AND relkind = 'm'"), {"v": LATEST_VIEW}).scalar()
+        if populated is None:
+            print(f"⚠️ 物化视图 {LATEST_VIEW} 不存在，请先执行 python migrate.py")
+            return
+        mode = "CONCURRENTLY " if populated else ""
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW {mode}{LATEST_VIEW}"))
+        print(f"🔄 物化视图 {LATEST_VIEW} 已刷新。")
+
+    def save_positions(self, df_res):
+        """
+        整表替换分析结果：在同一事务中 DELETE + 追加写入。
+        不再使用 to_sql(if_exists='replace')，否则每次都会 DROP 掉表上的索引。
+        """
+        with self.engine.begin() as conn:
+            if inspect(conn).has_table('nt_positions_analysis'):
+                conn.execute(text("DELETE FROM nt_positions_analysis"))
+            with metrics.timer("db_write_seconds", table="nt_positions_analysis"):
+                df_res.to_sql('nt_positions_analysis', conn, if_exists='append', index=False, method='multi', chunksize=1000)
+        metrics.inc("rows_written_total", len(df_res), table="nt_positions_analysis")
+
+    def save_leaderboard(self, latest_df):
+        """预计算全量战绩排行榜，前端无筛选时直接读取"""
+        rank_df = build_leaderboard(latest_df)
+        rank_df.to_sql(LEADERBOARD_TABLE, self.engine, if_exists='replace', index=False)
+        print(f"🏆 排行榜已更新，共 {len(rank_df)} 个机构。")
+
 if __name__ == "__main__":
-    NationalTeamAnalyzer().analyze_positions()
+    start_time = datetime.datetime.now()
+    analyzer = NationalTeamAnalyzer()
+    try:
+        analyzer.analyze_positions(force="--force" in sys.argv)
+    except Exception as e:
+        metrics.finish_run(analyzer.engine, "analysis_engine", start_time, "failed", str(e))
+        raise
+    metrics.finish_run(analyzer.engine, "analysis_engine", start_time)
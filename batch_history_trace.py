@@ -14,14 +14,17 @@ import os
 import time
 import random
 import sys
-from sqlalchemy import create_engine, text
 from tqdm import tqdm
 import logging
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+import metrics
+import db
+import market_store
+import fast_read
 
 # ================= 配置引用 =================
-from config import DB_URL, SSF_KEYWORDS, PUSHPLUS_TOKEN
+from config import SSF_KEYWORDS, PUSHPLUS_TOKEN, DATACENTER_URL
 
 LOG_DIR = "storage"
 if not os.path.exists(LOG_DIR): os.makedirs(LOG_DIR)
@@ -36,8 +39,8 @@ def send_pushplus(title, content):
     except: pass
 
 class HistoryTracer:
-    def __init__(self):
-        self.engine = create_engine(DB_URL)
+    def __init__(self, engine=None):
+        self.engine = engine or db.get_engine("etl")
         self.session = requests.Session()
         retries = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
         self.session.mount('http://', HTTPAdapter(max_retries=retries))
@@ -45,6 +48,8 @@ class HistoryTracer:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Referer": "https://data.eastmoney.com/"
         })
+        metrics.instrument_engine(self.engine)
+        metrics.instrument_session(self.session)
 
     def get_pending_tasks(self, mode='incremental'):
         """
@@ -63,8 +68,8 @@ class HistoryTracer:
             sql = """
             SELECT DISTINCT s.ts_code, s.holder_name 
             FROM nt_shareholders s
-            LEFT JOIN nt_history_cost h ON s.ts_code = h.ts_code AND s.holder_name = h.holder_name
-            WHERE h.hist_cost IS NULL OR h.hist_cost = 0
+            LEFT JOIN nt_history_cost h ON s.ts_code = h.ts_code AND s.holder_id = h.holder_id
+            WHERE h.hist_cost IS NULL OR h.hist_cost <= 0
             """
         
         df = pd.read_sql(sql, self.engine)
@@ -82,10 +87,11 @@ class HistoryTracer:
         else: return f"{c}.SZ"
 
     def get_market_data_from_db(self, ts_code):
-        """从数据库一次性拉取该股票的所有历史行情"""
+        """从数据库一次性拉取该股票的所有历史行情 (启用列式仓库时优先读本地文件)"""
+        df = market_store.read_stock(ts_code, columns=["trade_date", "amount", "vol"])
+        if df is not None and not df.empty: return df
         try:
-            sql = text("SELECT trade_date, amount, vol FROM nt_market_data WHERE ts_code = :code ORDER BY trade_date")
-            df = pd.read_sql(sql, self.engine, params={"code": ts_code})
+            df = fast_read.load_market_data(self.engine, ts_code)
             if not df.empty:
                 df['trade_date'] = pd.to_datetime(df['trade_date'])
                 # print(f"📊 [Debug] {ts_code} 加载了 {len(df)} 条日线数据")
@@ -97,7 +103,7 @@ class HistoryTracer:
             return pd.DataFrame()
 
     def get_history_holders(self, secucode):
-        url = "https://datacenter.eastmoney.com/securities/api/data/get"
+        url = DATACENTER_URL
         dfs = []
         for rpt_type in ["RPT_F10_EH_HOLDERS", "RPT_F10_EH_FREEHOLDERS"]:
             params = {
@@ -183,6 +189,13 @@ class HistoryTracer:
         if n_target in n_api or n_api in n_target: return True
         return False
 
+    def save_history_cost(self, ts_code, holder_name, cost, total_invest, total_shares, first_buy_date):
+        with metrics.timer("db_write_seconds", table="nt_history_cost"), self.engine.connect() as conn:
+            db.execute_prepared(conn, "history_cost_upsert", ts_code, holder_name, cost, total_invest, total_shares, first_buy_date)
+            conn.commit()
+        metrics.inc("rows_written_total", table="nt_history_cost")
+
+    @metrics.timed("stage_seconds", stage="history")
     def run(self, mode='incremental'):
         # 1. 获取任务清单
         pending_df = self.get_pending_tasks(mode)
@@ -195,7 +208,8 @@ class HistoryTracer:
         print(f"🚀 [任务启动] 共 {len(pending_df)} 条持仓记录待处理，涉及 {len(target_stocks)} 只股票。")
         
         count = 0
-        for code in tqdm(target_stocks, desc=f"Trace ({mode})"):
+        for done, code in enumerate(tqdm(target_stocks, desc=f"Trace ({mode})")):
+            metrics.set_gauge("queue_depth", len(target_stocks) - done, queue="history")
             try:
                 secucode = self.get_secucode(code)
                 
@@ -213,23 +227,19 @@ class HistoryTracer:
                     target_holders = pending_df[pending_df['ts_code'] == code]['holder_name'].unique().tolist()
                     
                     # --- 模糊匹配逻辑 ---
-                    # 找出 df_all 中哪些行是我们需要的目标股东
-                    matched_rows = []
-                    for _, row in df_all.iterrows():
-                        api_holder = row['HOLDER_NAME']
-                        for target in target_holders:
-                            if self.is_match(api_holder, target):
-                                # 为了后续 groupby 正确，这里统一把 HOLDER_NAME 改为数据库里的标准名称
-                                row['HOLDER_NAME'] = target 
-                                matched_rows.append(row)
-                                break
+                    # 每个接口名称只匹配一次 (接口返回多期数据, 名称大量重复)，再映射回整列
+                    # 为了后续 groupby 正确，这里统一把 HOLDER_NAME 改为数据库里的标准名称
+                    resolved = {}
+                    for api_holder in df_all['HOLDER_NAME'].unique():
+                        resolved[api_holder] = next((t for t in target_holders if self.is_match(api_holder, t)), None)
+                    mapped = df_all['HOLDER_NAME'].map(resolved)
+                    keep = mapped.notna()
+                    nt_df = df_all[keep].assign(HOLDER_NAME=mapped[keep].values)
                     
-                    if not matched_rows:
+                    if nt_df.empty:
                         print(f"⚠️ SKIP {code}: No matching holders found. Targets: {target_holders[:3]}... API Sample: {df_all['HOLDER_NAME'].iloc[:3].tolist()}")
 
-                    if matched_rows:
-                        nt_df = pd.DataFrame(matched_rows)
-                        
+                    if not nt_df.empty:
                         for holder_name, group in nt_df.groupby('HOLDER_NAME'):
                             # 2. 传入 market_df 进行内存计算
                             cost, f_date, t_shares, t_invest = self.calculate_single_holder(group, market_df)
@@ -240,22 +250,14 @@ class HistoryTracer:
                                 t_invest = float(t_invest)
                                 t_shares = int(t_shares)
 
-                                sql = text("""
-                                    INSERT INTO nt_history_cost (ts_code, holder_name, hist_cost, total_invest, total_shares, first_buy_date, calc_date)
-                                    VALUES (:c, :h, :cost, :inv, :sh, :fd, NOW())
-                                    ON CONFLICT (ts_code, holder_name) DO UPDATE 
-                                    SET hist_cost = EXCLUDED.hist_cost,
-                                        first_buy_date = EXCLUDED.first_buy_date,
-                                        calc_date = NOW();
-                                """)
-                                with self.engine.connect() as conn:
-                                    conn.execute(sql, {"c": code, "h": holder_name, "cost": cost, "inv": t_invest, "sh": t_shares, "fd": f_date})
-                                    conn.commit()
+                                self.save_history_cost(code, holder_name, cost, t_invest, t_shares, f_date)
                                 count += 1
                             else:
+                                metrics.inc("trace_skipped_total", reason="calc_failed")
                                 print(f"⚠️ SKIP {code} - {holder_name}: Calc failed (f_date is None). Shares: {t_shares}")
             except Exception as e:
                 err_msg = str(e)
+                metrics.inc("trace_errors_total", reason=type(e).__name__)
                 logging.error(f"Error {code}: {err_msg}")
                 # 🚨 严重错误报警并停止
                 if "RemoteDisconnected" in err_msg or "Connection aborted" in err_msg:
@@ -263,6 +265,7 @@ class HistoryTracer:
                     print("🛑 检测到严重连接错误，正在终止程序...")
                     sys.exit(1)
                 
+        metrics.set_gauge("queue_depth", 0, queue="history")
         print(f"✅ 考古完成！成功处理 {count} 条档案。")
 
 if __name__ == "__main__":
@@ -273,7 +276,9 @@ if __name__ == "__main__":
         if len(sys.argv) > 1 and sys.argv[1] == 'full':
             mode = 'full'
         
-        HistoryTracer().run(mode=mode)
+        tracer = HistoryTracer()
+        tracer.run(mode=mode)
+        metrics.finish_run(tracer.engine, "batch_history_trace", start_time)
         
         duration = datetime.datetime.now() - start_time
         send_pushplus("考古任务完成", f"历史持仓考古任务已成功执行完毕。\n模式: {mode}\n耗时: {duration}")
@@ -283,5 +288,6 @@ if __name__ == "__main__":
         err_msg = traceback.format_exc()
         logging.error(err_msg)
         print(err_msg)
+        metrics.finish_run(db.get_engine("etl"), "batch_history_trace", start_time, "failed", str(e))
         send_pushplus("考古任务崩溃", f"脚本发生严重错误，已停止。\n\n{str(e)}")
         sys.exit(1)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+单写入线程批量入库 v1.0
+功能：
+1. [单写入者] 采集线程只把行放进队列，由一个写入线程持有一个数据库连接统一写库，不再每只股票各自取连接、各自提交。
+2. [批量] 累计到 batch_size 行或距上次写入超过 flush_interval 秒时，execute_values 一次写入并只提交一次。
+3. [失败隔离] 整批失败时回滚，改为逐行 (SAVEPOINT) 重写，能写的照常提交，写不进去的行记入丢弃清单。
+4. [报告] close() 时打印写入/丢弃统计，丢弃的行连同错误原因写出到 storage/run_reports/dropped_<表>_<时间>.csv。
+
+用法：
+    writer = BatchWriter(engine, "nt_shareholders", cols, "ON CONFLICT (ts_code, holder_name, end_date) DO NOTHING").start()
+    writer.put(df)            # 任意线程调用
+    report = writer.close()   # 写完剩余数据并返回统计
+"""
+import datetime
+import os
+import queue
+import threading
+import time
+import pandas as pd
+
+import db
+import metrics
+
+REPORT_DIR = os.path.join("storage", "run_reports")
+_STOP = object()
+
+class BatchWriter:
+    def __init__(self, engine, table, columns, conflict_sql="", batch_size=2000, flush_interval=2.0):
+        self.engine = engine
+        self.table = table
+        self.columns = list(columns)
+        self.sql = f"INSERT INTO {table} ({', '.join(self.columns)}) VALUES %s {conflict_sql}"
+        self.row_sql = f"INSERT INTO {table} ({', '.join(self.columns)}) VALUES ({', '.join(['%s'] * len(self.columns))}) {conflict_sql}"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.thread = None
+        self.conn = None
+        self.written = 0
+        self.batches = 0
+        self.dropped = []  # [(row, 错误)]
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"writer-{self.table}", daemon=True)
+        self.thread.start()
+        return self
+
+    def put(self, rows):
+        """rows: DataFrame 或 dict 列表，按 columns 取列；NaN 写为 NULL"""
+        if isinstance(rows, pd.DataFrame):
+            frame = rows.reindex(columns=self.columns)
+            rows = list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+        else:
+            rows = [tuple(r.get(c) for c in self.columns) for r in rows]
+        if rows: self.queue.put(rows)
+        return len(rows)
+
+    def close(self):
+        """通知写入线程写完剩余数据并退出，返回统计"""
+        self.queue.put(_STOP)
+        self.thread.join()
+        return self.report()
+
+    # --- 写入线程 ---
+    def _run(self):
+        buffer, last_flush = [], time.monotonic()
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0.01)
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            stop = item is _STOP
+            if item is not None and not stop:
+                buffer.extend(item)
+            metrics.set_gauge("queue_depth", self.queue.qsize(), queue=f"writer_{self.table}")
+            if buffer and (stop or len(buffer) >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval):
+                self._flush(buffer)
+                buffer = []
+                last_flush = time.monotonic()
+            elif not buffer:
+                last_flush = time.monotonic()  # 空闲时不计时，从第一行到达开始算
+            if stop: break
+        if self.conn is not None:
+            self.conn.close()
+
+    def _discard(self):
+        """连接出错后丢弃，下次写入时重新获取"""
+        try: self.conn.close()
+        except Exception: pass
+        self.conn = None
+
+    def _connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = self.engine.raw_connection()
+        return self.conn
+
+    def _flush(self, rows):
+        for i in range(0, len(rows), self.batch_size):
+            batch = rows[i:i + self.batch_size]
+            try:
+                with metrics.timer("db_write_seconds", table=self.table):
+                    conn = self._connection()
+                    with conn.cursor() as cur:
+                        db.execute_values(cur, self.sql, batch, page_size=len(batch))
+                    conn.commit()
+                self._done(batch)
+            except Exception as e:
+                print(f"⚠️ [{self.table}] 批量写入失败 ({len(batch)} 行)，改为逐行写入: {e}")
+                self._flush_rows(batch)
+
+    def _flush_rows(self, batch):
+        """逐行写入，每行一个 SAVEPOINT；写不进去的行记入丢弃清单"""
+        try:
+            conn = self._connection()
+            try: conn.rollback()
+            except Exception:
+                self._discard()
+                conn = self._connection()
+            ok = []
+            with conn.cursor() as cur:
+                for row in batch:
+                    with metrics.raw_query("SAVEPOINT"):
+                        cur.execute("SAVEPOINT nt_row")
+                    try:
+                        with metrics.raw_query("INSERT"):
+                            cur.execute(self.row_sql, row)
+                        with metrics.raw_query("RELEASE"):
+                            cur.execute("RELEASE SAVEPOINT nt_row")
+                        ok.append(row)
+                    except Exception as e:
+                        with metrics.raw_query("ROLLBACK"):
+                            cur.execute("ROLLBACK TO SAVEPOINT nt_row")
+                        self._drop([row], e)
+            conn.commit()
+            self._done(ok)
+        except Exception as e:
+            # 连接本身不可用: 整批丢弃
+            self._discard()
+            self._drop(batch, e)
+
+    def _done(self, batch):
+        self.written += len(batch)
+        self.batches += 1
+        metrics.inc("rows_written_total", len(batch), table=self.table)
+        metrics.inc("writer_batches_total", table=self.table)
+
+    def _drop(self, rows, error):
+        # 异常信息可能为空 (如部分连接异常), 此时记录异常类型, 不能让写入线程因此退出
+        lines = str(error).strip().splitlines()
+        reason = lines[0] if lines else repr(error)
+        self.dropped.extend((row, reason) for row in rows)
+        metrics.inc("rows_dropped_total", len(rows), table=self.table)
+
+    # --- 报告 ---
+    def report(self):
+        path = None
+        if self.dropped:
+            os.makedirs(REPORT_DIR, exist_ok=True)
+            path = os.path.join(REPORT_DIR, f"dropped_{self.table}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+            df = pd.DataFrame([row for row, _ in self.dropped], columns=self.columns)
+            df["error"] = [err for _, err in self.dropped]
+            df.to_csv(path, index=False, encoding="utf-8-sig")
+            print(f"❌ [{self.table}] {len(self.dropped)} 行写入失败已丢弃，明细: {path}")
+        print(f"💾 [{self.table}] 批量写入 {self.written} 行，共 {self.batches} 批。")
+        return {"table": self.table, "written": self.written, "batches": self.batches, "dropped": len(self.dropped), "dropped_file": path}
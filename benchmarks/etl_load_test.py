@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+采集链路压测
+功能：启动本地替身服务 (mock_server)，把采集脚本的接口地址指向它，在基准测试库上按指定并发跑
+     股东采集 / 日线 / 基本面 / 考古 / 修复，统计吞吐、重试与错误，用于调整线程数和限速参数而不触碰真实接口。
+
+说明：
+    - 接口地址在导入采集模块之前通过环境变量注入 (config.DATACENTER_URL 等)，因此本脚本必须先于它们启动服务。
+    - 采集代码自带的客户端限速 (日线每次 0.5~1.2 秒、每 50 次暂停) 保持不变，压测结果包含这部分开销。
+    - 股东 / 日线 / 基本面接口在重试后仍遇到连接被断开时会 os._exit(1) 终止进程，--reset-rate 过高会导致压测中途退出，
+      这本身就是需要观察的行为。
+    - 日线阶段会先删除所选股票最近 --market-days 天的行情，保证走真实的抓取与写入路径 (基准测试库可随时重新生成)。
+
+用法：
+    export BENCH_DB_URL=postgresql+psycopg2://user@localhost/nt_bench
+    python benchmarks/etl_load_test.py --limit 50 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+    python benchmarks/etl_load_test.py --stages shareholders history --shareholder-workers 16 --rate-limit 30
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mock_server
+
+RESULT_DIR = os.path.join(ROOT_DIR, "storage", "benchmarks")
+STAGE_ORDER = ["shareholders", "market", "fundamentals", "history", "fix"]
+
+# ================= 阶段 =================
+# 每个阶段: run(ctx, codes) 返回处理的股票/任务数
+def pool_map(fn, codes, workers):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fn, code) for code in codes]
+        for future in as_completed(futures):
+            try: future.result()
+            except Exception as e: print(f"⚠️ {e}")
+    return len(codes)
+
+def run_shareholders(ctx, codes):
+    # 与 run_shareholder_sync 相同: 抓取线程只入队，单写入线程批量入库
+    de = ctx["data_engine"]
+    de.shareholder_writer = BatchWriter(de.engine, "nt_shareholders", SHAREHOLDER_COLS, SHAREHOLDER_CONFLICT).start()
+    try:
+        return pool_map(de.fetch_and_save_shareholders, codes, ctx["args"].shareholder_workers)
+    finally:
+        writer, de.shareholder_writer = de.shareholder_writer, None
+        writer.close()
+
+def run_market(ctx, codes):
+    with ctx["engine"].begin() as conn:
+        conn.execute(text("DELETE FROM nt_market_data WHERE ts_code = ANY(:codes) AND trade_date > CURRENT_DATE - :days"),
+                     {"codes": codes, "days": ctx["args"].market_days})
+    n = pool_map(ctx["data_engine"].fetch_and_save_daily_data, codes, ctx["args"].sensitive_workers)
+    ctx["data_engine"].refresh_derived_data()
+    return n
+
+def run_fundamentals(ctx, codes):
+    # 只计抓取；入库由 run_fundamentals_sync 的批量 upsert 完成，这里不重复实现
+    return pool_map(ctx["data_engine"].fetch_combined_data, codes, ctx["args"].sensitive_workers)
+
+def run_history(ctx, codes):
+    tracer = HistoryTracer(engine=ctx["engine"])
+    pending = pd.read_sql(text("SELECT DISTINCT ts_code, holder_name FROM nt_shareholders WHERE ts_code = ANY(:codes)"),
+                          ctx["engine"], params={"codes": codes})
+    tracer.get_pending_tasks = lambda mode='incremental': pending
+    tracer.run(mode="full")
+    return len(pending)
+
+def run_fix(ctx, codes):
+    fixer = AutoFixer(engine=ctx["engine"])
+    for code in codes: fixer.fix_one_stock(code)
+    return len(codes)
+
+STAGES = {"shareholders": run_shareholders, "market": run_market, "fundamentals": run_fundamentals,
+          "history": run_history, "fix": run_fix}
+
+def counter_total(snap, name, **labels):
+    return sum(c["value"] for c in snap["counters"]
+               if c["name"] == name and all(c["labels"].get(k) == v for k, v in labels.items()))
+
+def run_stages(ctx, codes, names):
+    results = {}
+    for name in names:
+        before = metrics.snapshot()
+        started = time.perf_counter()
+        items = STAGES[name](ctx, codes)
+        cost = time.perf_counter() - started
+        after = metrics.snapshot()
+        results[name] = {
+            "seconds": round(cost, 3), "items": items,
+            "items_per_s": round(items / cost, 3) if cost > 0 else None,
+            "http_requests": counter_total(after, "http_requests_total") - counter_total(before, "http_requests_total"),
+            "http_retries": counter_total(after, "http_retries_total") - counter_total(before, "http_retries_total"),
+            "http_errors": counter_total(after, "http_errors_total") - counter_total(before, "http_errors_total"),
+        }
+        print(f"⏱️ {name:<13} {cost:>8.2f}s  {items} 项  {results[name]['items_per_s']}/s  "
+              f"请求 {results[name]['http_requests']}  重试 {results[name]['http_retries']}  错误 {results[name]['http_errors']}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="采集链路压测 (本地替身服务)")
+    parser.add_argument("--db-url", help="独立的基准测试库 (默认读取 BENCH_DB_URL)")
+    parser.add_argument("--limit", type=int, default=20, help="参与压测的股票数")
+    parser.add_argument("--stages", nargs="*", default=STAGE_ORDER[:4], choices=STAGE_ORDER)
+    parser.add_argument("--shareholder-workers", type=int, help="股东采集线程数 (默认 config.SHAREHOLDER_WORKERS)")
+    parser.add_argument("--sensitive-workers", type=int, help="日线/基本面线程数 (默认 config.SENSITIVE_WORKERS)")
+    parser.add_argument("--market-days", type=int, default=10, help="日线阶段重新抓取的天数")
+    parser.add_argument("--port", type=int, default=0, help="替身服务端口 (0 为自动分配)")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--reset-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0)
+    parser.add_argument("--recordings", help="录制响应目录")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="结果 JSON 路径 (默认 storage/benchmarks/etl_load_<commit>_<时间>.json)")
+    args = parser.parse_args()
+
+    server, base_url = mock_server.start_in_thread(
+        args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        reset_rate=args.reset_rate, rate_limit=args.rate_limit, recordings=args.recordings, seed=args.seed)
+    os.environ.update(mock_server.client_env(base_url))
+    print(f"🧪 替身服务: {base_url}")
+
+    # 接口地址已注入，再导入采集模块
+    import pandas as pd
+    from sqlalchemy import create_engine, text
+    import metrics
+    import synthetic_data
+    from etl_ingest import DataEngine, SHAREHOLDER_COLS, SHAREHOLDER_CONFLICT
+    from batch_writer import BatchWriter
+    from batch_history_trace import HistoryTracer
+    from fix_stock import AutoFixer
+    from run_benchmarks import git_commit
+    from config import SHAREHOLDER_WORKERS, SENSITIVE_WORKERS
+
+    args.shareholder_workers = args.shareholder_workers or SHAREHOLDER_WORKERS
+    args.sensitive_workers = args.sensitive_workers or SENSITIVE_WORKERS
+    db_url = synthetic_data.resolve_db_url(args.db_url)
+    if not db_url.startswith("postgresql"):
+        sys.exit("❌ 仅支持 PostgreSQL 基准测试库。")
+    engine = create_engine(db_url, pool_size=20, max_overflow=10)
+    codes = pd.read_sql(text("SELECT ts_code FROM stock_basic ORDER BY ts_code LIMIT :n"), engine, params={"n": args.limit})['ts_code'].tolist()
+    if not codes:
+        sys.exit("❌ 基准测试库没有股票，请先运行 synthetic_data.py 生成数据。")
+
+    ctx = {"engine": engine, "data_engine": DataEngine(engine=engine), "args": args}
+    names = [s for s in STAGE_ORDER if s in args.stages]
+    print(f">>> 🚀 压测 {len(codes)} 只股票: {', '.join(names)}")
+    started = time.perf_counter()
+    results = run_stages(ctx, codes, names)
+    total = time.perf_counter() - started
+    server.shutdown()
+
+    commit = git_commit()
+    report = {
+        "created_at": datetime.datetime.now().isoformat(),
+        "git_commit": commit,
+        "database": f"{engine.url.get_backend_name()}/{engine.url.database}",
+        "stocks": len(codes),
+        "workers": {"shareholders": args.shareholder_workers, "sensitive": args.sensitive_workers},
+        "server": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+                   "reset_rate": args.reset_rate, "rate_limit": args.rate_limit, "recordings": args.recordings},
+        "total_s": round(total, 3),
+        "results": results,
+        "server_stats": server.RequestHandlerClass.state.stats,
+        "metrics": metrics.snapshot(),
+    }
+    path = args.save or os.path.join(RESULT_DIR, f"etl_load_{commit}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"💾 已保存: {path}")
@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+东方财富 / Tushare 本地替身服务
+功能：在本机模拟采集脚本用到的四类接口，用于离线压测并发与重试逻辑，避免请求真实接口被封。
+    GET  /securities/api/data/get   datacenter 十大股东 (RPT_F10_EH_HOLDERS / RPT_F10_EH_FREEHOLDERS)
+    GET  /api/qt/stock/kline/get     push2his 日K线 (按 fields2 输出列)
+    GET  /api/qt/stock/get           push2 实时行情 (JSONP)
+    POST /tushare[/daily]            tushare pro 的 daily 接口
+    GET  /__stats                    服务端统计 (各接口请求数 / 注入的错误数)
+
+响应优先回放 --recordings 目录下录制的原始响应 (<接口>/<键>.json，如 datacenter/RPT_F10_EH_HOLDERS_600000.SH.json)，
+没有录制文件时按股票代码生成确定性的合成数据。可注入延迟、非 200 状态码、连接重置和按接口限速。
+
+用法：
+    python benchmarks/mock_server.py --port 18080 --latency-ms 80 --jitter-ms 40 --error-rate 0.02 --reset-rate 0.005 --rate-limit 50
+    export DATACENTER_URL=http://127.0.0.1:18080/securities/api/data/get
+    export KLINE_URL=http://127.0.0.1:18080/api/qt/stock/kline/get
+    export QUOTE_URL=http://127.0.0.1:18080/api/qt/stock/get
+    export TUSHARE_API_URL=http://127.0.0.1:18080/tushare
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ROUTES = {
+    "/securities/api/data/get": "datacenter",
+    "/api/qt/stock/kline/get": "kline",
+    "/api/qt/stock/get": "quote",
+}
+HISTORY_START = datetime.date(2006, 1, 2)
+NT_HOLDERS = ["中央汇金资产管理有限责任公司", "中国证券金融股份有限公司", "全国社保基金一一八组合", "基本养老保险基金八零二组合"]
+OTHER_HOLDERS = ["香港中央结算有限公司", "招商银行股份有限公司-某某混合型证券投资基金", "某某集团有限公司", "张三", "李四", "某某资产管理计划"]
+KLINE_FIELDS = {"f51": "date", "f52": "open", "f53": "close", "f54": "high", "f55": "low", "f56": "vol", "f57": "amount"}
+
+# ================= 合成数据 (按股票代码确定性生成) =================
+def _seed(code):
+    return int(re.sub(r"\D", "", code) or 0)
+
+@functools.lru_cache(maxsize=4096)
+def daily_bars(code):
+    """2006 年至今的工作日K线 [(date, open, close, high, low, vol(手), amount(元))]"""
+    rng = random.Random(_seed(code))
+    price = rng.uniform(5, 80)
+    bars, day, today = [], HISTORY_START, datetime.date.today()
+    while day <= today:
+        if day.weekday() < 5:
+            open_ = price
+            price = max(price * (1 + rng.gauss(0, 0.02)), 0.5)
+            high = max(open_, price) * (1 + abs(rng.gauss(0, 0.01)))
+            low = min(open_, price) * (1 - abs(rng.gauss(0, 0.01)))
+            vol = round(rng.lognormvariate(11, 0.6))
+            bars.append((day, round(open_, 2), round(price, 2), round(high, 2), round(low, 2), vol, round(vol * 100 * price, 2)))
+        day += datetime.timedelta(days=1)
+    return bars
+
+def bars_between(code, beg, end):
+    return [b for b in daily_bars(code) if beg <= b[0] <= end]
+
+def holder_rows(secucode, report_type):
+    """最近 20 个季度的十大股东，国家队与普通股东混合 (用于检验关键词过滤)"""
+    rng = random.Random(f"{secucode}-{report_type}")
+    holders = rng.sample(NT_HOLDERS, 2) + rng.sample(OTHER_HOLDERS, 4)
+    quarter_ends = []
+    d = datetime.date.today()
+    for _ in range(20):
+        d = (d.replace(day=1) - datetime.timedelta(days=1))
+        while d.month not in (3, 6, 9, 12):
+            d = d.replace(day=1) - datetime.timedelta(days=1)
+        quarter_ends.append(d)
+    rows = []
+    for holder in holders:
+        shares = rng.uniform(1e6, 5e8)
+        for end in sorted(quarter_ends):
+            chg = 0 if rng.random() < 0.5 else shares * rng.gauss(0, 0.1)
+            shares = max(shares + chg, 1e5)
+            rows.append({
+                "END_DATE": f"{end} 00:00:00", "HOLDER_NAME": holder, "HOLD_NUM": round(shares),
+                "HOLD_RATIO": round(rng.uniform(0.1, 5), 4), "HOLD_NUM_CHANGE": round(chg) if chg else "不变",
+            })
+    return rows
+
+def _parse_date(value, default):
+    try: return datetime.datetime.strptime(str(value), "%Y%m%d").date()
+    except Exception: return default
+
+def code_from_secid(secid):
+    return secid.split(".", 1)[-1]
+
+# ================= 服务 =================
+class MockState:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, reset_rate=0.0, rate_limit=0, limit_status=429, recordings=None, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.reset_rate = reset_rate
+        self.rate_limit = rate_limit  # 每个接口每秒允许的请求数, 0 为不限
+        self.limit_status = limit_status
+        self.recordings = recordings
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.buckets = {}  # route -> (tokens, last_refill)
+        self.stats = {}
+
+    def count(self, route, outcome):
+        with self.lock:
+            self.stats.setdefault(route, {}).setdefault(outcome, 0)
+            self.stats[route][outcome] += 1
+
+    def roll(self):
+        with self.lock:
+            return self.rng.random()
+
+    def delay(self):
+        with self.lock:
+            ms = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if ms > 0: time.sleep(ms / 1000)
+
+    def allow(self, route):
+        """令牌桶限速"""
+        if not self.rate_limit: return True
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(route, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            if tokens < 1:
+                self.buckets[route] = (tokens, now)
+                return False
+            self.buckets[route] = (tokens - 1, now)
+            return True
+
+    def recorded(self, route, key):
+        if not self.recordings: return None
+        path = os.path.join(self.recordings, route, f"{key}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+        return None
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # 由 make_server 注入
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self, route):
+        """返回 True 表示已注入错误 (调用方不再处理请求)"""
+        state = self.state
+        state.delay()
+        if not state.allow(route):
+            state.count(route, f"http_{state.limit_status}")
+            self._send(state.limit_status, json.dumps({"message": "rate limited"}))
+            return True
+        roll = state.roll()
+        if roll < state.reset_rate:
+            state.count(route, "reset")
+            # 不返回任何响应直接断开, 客户端表现为 RemoteDisconnected / Connection aborted
+            self.close_connection = True
+            try: self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            return True
+        if roll < state.reset_rate + state.error_rate:
+            status = state.rng.choice([500, 502, 503])
+            state.count(route, f"http_{status}")
+            self._send(status, "<html>Service Unavailable</html>", "text/html")
+            return True
+        return False
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/__stats":
+            return self._send(200, json.dumps(self.state.stats, ensure_ascii=False))
+        route = ROUTES.get(parsed.path)
+        if route is None:
+            return self._send(404, json.dumps({"message": "not found"}))
+        if self._inject(route): return
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        body = getattr(self, f"_{route}")(params)
+        self.state.count(route, "ok")
+        ctype = "application/javascript; charset=utf-8" if route == "quote" else "application/json; charset=utf-8"
+        self._send(200, body, ctype)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if not parsed.path.startswith("/tushare"):
+            return self._send(404, json.dumps({"message": "not found"}))
+        length = int(self.headers.get("Content-Length", 0))
+        req = json.loads(self.rfile.read(length) or b"{}")
+        if self._inject("tushare"): return
+        self.state.count("tushare", "ok")
+        self._send(200, self._tushare(req))
+
+    # --- 各接口 ---
+    def _datacenter(self, params):
+        secucode = (re.search(r'SECUCODE="([^"]+)"', params.get("filter", "")) or [None, ""])[1]
+        report_type = params.get("type", "")
+        recorded = self.state.recorded("datacenter", f"{report_type}_{secucode}")
+        if recorded: return recorded
+        rows = holder_rows(secucode, report_type)
+        rows.sort(key=lambda r: r["END_DATE"], reverse=params.get("sr") == "-1")
+        rows = rows[:int(params.get("ps", 50))]
+        return json.dumps({"success": True, "result": {"pages": 1, "count": len(rows), "data": rows}}, ensure_ascii=False)
+
+    def _kline(self, params):
+        secid = params.get("secid", "")
+        recorded = self.state.recorded("kline", secid)
+        if recorded: return recorded
+        code = code_from_secid(secid)
+        bars = bars_between(code, _parse_date(params.get("beg"), HISTORY_START), _parse_date(params.get("end"), datetime.date.today()))
+        bars = bars[-int(params.get("lmt", 1000)):]
+        fields = [KLINE_FIELDS[f] for f in params.get("fields2", "f51,f52,f53,f54,f55,f56,f57").split(",") if f in KLINE_FIELDS]
+        lines = []
+        for d, o, c, h, l, v, a in bars:
+            row = {"date": d.isoformat(), "open": o, "close": c, "high": h, "low": l, "vol": v, "amount": a}
+            lines.append(",".join(str(row[f]) for f in fields))
+        return json.dumps({"rc": 0, "data": {"code": code, "klines": lines}})
+
+    def _quote(self, params):
+        secid = params.get("secid", "")
+        cb = params.get("cb", "jQuery")
+        recorded = self.state.recorded("quote", secid)
+        if recorded: return recorded
+        code = code_from_secid(secid)
+        rng = random.Random(_seed(code))
+        price = daily_bars(code)[-1][2]
+        data = {
+            "f43": price, "f57": code, "f58": f"合成{code}", "f116": round(price * rng.uniform(1e8, 1e10), 2),
+            "f162": round(rng.uniform(5, 60), 2), "f163": round(rng.uniform(5, 60), 2), "f164": round(rng.uniform(5, 60), 2),
+            "f167": round(rng.uniform(0.5, 8), 2), "f170": round(rng.uniform(-3, 3), 2), "f173": round(rng.uniform(-5, 25), 2),
+            "f183": round(rng.uniform(1e8, 1e11), 2), "f184": round(rng.uniform(-30, 50), 2), "f185": round(rng.uniform(-50, 80), 2),
+            "f186": round(rng.uniform(5, 60), 2), "f187": round(rng.uniform(-10, 30), 2),
+        }
+        return f"{cb}({json.dumps({'rc': 0, 'data': data})});"
+
+    def _tushare(self, req):
+        api_name = req.get("api_name", "daily")
+        params = req.get("params", {})
+        if api_name != "daily":
+            return json.dumps({"code": 40101, "msg": f"mock server 不支持接口 {api_name}", "data": None})
+        ts_code = params.get("ts_code", "")
+        recorded = self.state.recorded("tushare", f"daily_{ts_code}")
+        if recorded: return recorded
+        fields = req.get("fields") or "ts_code,trade_date,open,high,low,close,vol,amount"
+        fields = fields.split(",") if isinstance(fields, str) else fields
+        bars = bars_between(ts_code.split(".")[0], _parse_date(params.get("start_date"), HISTORY_START), _parse_date(params.get("end_date"), datetime.date.today()))
+        items = []
+        for d, o, c, h, l, v, a in reversed(bars):  # tushare 按日期倒序返回, amount 单位千元
+            row = {"ts_code": ts_code, "trade_date": d.strftime("%Y%m%d"), "open": o, "high": h, "low": l, "close": c, "vol": v, "amount": round(a / 1000, 3)}
+            items.append([row.get(f) for f in fields])
+        return json.dumps({"code": 0, "msg": "", "data": {"fields": fields, "items": items, "has_more": False}})
+
+def make_server(port=18080, host="127.0.0.1", **options):
+    """创建服务 (未启动)；options 见 MockState"""
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_in_thread(port=0, host="127.0.0.1", **options):
+    """在后台线程启动，返回 (server, base_url)；port=0 时自动分配端口"""
+    server = make_server(port, host, **options)
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock-server").start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def client_env(base_url):
+    """将采集脚本指向替身服务所需的环境变量"""
+    return {
+        "DATACENTER_URL": f"{base_url}/securities/api/data/get",
+        "KLINE_URL": f"{base_url}/api/qt/stock/kline/get",
+        "QUOTE_URL": f"{base_url}/api/qt/stock/get",
+        "TUSHARE_API_URL": f"{base_url}/tushare",
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="东方财富 / Tushare 本地替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500/502/503 的比例")
+    parser.add_argument("--reset-rate", type=float, default=0.0, help="直接断开连接的比例")
+    parser.add_argument("--rate-limit", type=float, default=0, help="每个接口每秒请求上限, 0 为不限")
+    parser.add_argument("--limit-status", type=int, default=429, help="超过限速时返回的状态码")
+    parser.add_argument("--recordings", help="录制响应目录")
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.host, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                         error_rate=args.error_rate, reset_rate=args.reset_rate, rate_limit=args.rate_limit,
+                         limit_status=args.limit_status, recordings=args.recordings)
+    print(f"🧪 替身服务已启动: http://{args.host}:{args.port}")
+    for k, v in client_env(f"http://{args.host}:{args.port}").items():
+        print(f"    export {k}={v}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+热点查询执行计划对比
+功能：对项目中的热点查询执行 EXPLAIN (ANALYZE, BUFFERS)，记录耗时、扫描方式与缓冲区读取量，
+     可保存为 JSON 并对比迁移前后的差异。
+
+用法：
+    python benchmarks/query_plans.py --save storage/benchmarks/plans_before.json
+    python migrate.py
+    python benchmarks/query_plans.py --save storage/benchmarks/plans_after.json
+    python benchmarks/query_plans.py --compare storage/benchmarks/plans_before.json storage/benchmarks/plans_after.json
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DB_URL
+
+# 名称 -> (SQL, 需要的采样参数)
+QUERIES = {
+    "dashboard_latest": ("""
+        SELECT a.ts_code, b.name, a.holder_name, a.est_cost, a.curr_price, a.profit_rate, a.status,
+               a.period_end, a.hold_amount, f.pe_ttm, f.pb, f.total_mv
+        FROM nt_positions_analysis a
+        LEFT JOIN stock_basic b ON a.ts_code = b.ts_code
+        LEFT JOIN nt_stock_fundamentals f ON a.ts_code = f.ts_code
+        WHERE a.is_latest = true
+    """, []),
+    "dashboard_latest_mv": ("SELECT * FROM mv_nt_latest_positions", []),
+    "position_history": ("""
+        SELECT * FROM nt_positions_analysis WHERE ts_code = :code AND holder_name = :holder ORDER BY period_end ASC
+    """, ["code", "holder"]),
+    "analysis_shareholders": ("""
+        SELECT s.*, b.name FROM nt_shareholders s LEFT JOIN stock_basic b ON s.ts_code = b.ts_code
+        WHERE s.ann_date > '2022-01-01' ORDER BY s.ts_code, s.holder_name, s.end_date
+    """, []),
+    "report_max_end_date": ("SELECT MAX(end_date) FROM nt_shareholders", []),
+    "report_max_ann_date": ("SELECT MAX(ann_date) FROM nt_shareholders", []),
+    "report_end_date_details": ("""
+        SELECT DISTINCT t.ts_code, b.name FROM nt_shareholders t
+        LEFT JOIN stock_basic b ON t.ts_code = b.ts_code WHERE t.end_date = :end_date
+    """, ["end_date"]),
+    "fundamentals_today": ("SELECT ts_code FROM nt_stock_fundamentals WHERE update_date = :today", ["today"]),
+    "history_cost_missing": ("SELECT DISTINCT ts_code FROM nt_history_cost WHERE hist_cost = 0", []),
+    "market_existing_today": ("SELECT DISTINCT ts_code FROM nt_market_data WHERE trade_date = :today", ["today"]),
+    "quarter_vwap": ("""
+        SELECT sum(amount), sum(vol) FROM nt_market_data WHERE ts_code = :code AND trade_date >= :q_start AND trade_date <= :end_date
+    """, ["code", "q_start", "end_date"]),
+}
+
+def sample_params(conn):
+    """从库中取一组真实存在的参数, 保证计划具有代表性"""
+    row = conn.execute(text("SELECT ts_code, holder_name FROM nt_positions_analysis WHERE is_latest LIMIT 1")).fetchone()
+    end_date = conn.execute(text("SELECT MAX(end_date) FROM nt_shareholders")).scalar() or datetime.date.today()
+    today = conn.execute(text("SELECT MAX(trade_date) FROM nt_market_data")).scalar() or datetime.date.today()
+    return {
+        "code": row[0] if row else "600000",
+        "holder": row[1] if row else "",
+        "end_date": end_date,
+        "q_start": end_date - datetime.timedelta(days=90),
+        "today": today,
+    }
+
+def _walk(node, out):
+    label = node["Node Type"]
+    if node.get("Index Name"): label += f" using {node['Index Name']}"
+    elif node.get("Relation Name"): label += f" on {node['Relation Name']}"
+    out.append(label)
+    for child in node.get("Plans", []): _walk(child, out)
+    return out
+
+def explain_all(engine, names=None):
+    results = {}
+    with engine.connect() as conn:
+        params = sample_params(conn)
+        for name, (sql, keys) in QUERIES.items():
+            if names and name not in names: continue
+            try:
+                plan = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), {k: params[k] for k in keys}).scalar()
+                plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+                root = plan["Plan"]
+                results[name] = {
+                    "execution_ms": round(plan["Execution Time"], 3),
+                    "planning_ms": round(plan["Planning Time"], 3),
+                    "shared_hit": root.get("Shared Hit Blocks", 0),
+                    "shared_read": root.get("Shared Read Blocks", 0),
+                    "nodes": _walk(root, []),
+                }
+            except Exception as e:
+                conn.rollback()
+                results[name] = {"error": str(e).splitlines()[0]}
+    return results
+
+def print_results(results):
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<26} ❌ {r['error']}")
+            continue
+        print(f"{name:<26} {r['execution_ms']:>10.3f} ms  buffers={r['shared_hit'] + r['shared_read']:<8} {' > '.join(r['nodes'][:3])}")
+
+def compare(before, after):
+    print(f"{'query':<26} {'before(ms)':>12} {'after(ms)':>12} {'speedup':>9}")
+    for name in before:
+        b, a = before.get(name, {}), after.get(name, {})
+        if "execution_ms" not in b or "execution_ms" not in a: continue
+        speedup = b["execution_ms"] / a["execution_ms"] if a["execution_ms"] > 0 else float("inf")
+        print(f"{name:<26} {b['execution_ms']:>12.3f} {a['execution_ms']:>12.3f} {speedup:>8.1f}x")
+        if b["nodes"] != a["nodes"]:
+            print(f"    before: {' > '.join(b['nodes'])}")
+            print(f"    after : {' > '.join(a['nodes'])}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="热点查询执行计划对比")
+    parser.add_argument("--save", help="将结果保存为 JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="对比两次保存的结果")
+    parser.add_argument("--only", nargs="*", help="只运行指定查询")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f: before = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f: after = json.load(f)
+        compare(before["queries"], after["queries"])
+        sys.exit(0)
+
+    results = explain_all(create_engine(DB_URL), args.only)
+    print_results(results)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"created_at": datetime.datetime.now().isoformat(), "queries": results}, f, ensure_ascii=False, indent=2, default=str)
+        print(f"💾 已保存: {args.save}")
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+功能：在独立的基准测试库 (合成数据) 上计时分析、成本计算、看板读取与各入库写入路径，
+     结果保存为 JSON (含 git commit)，可对比不同提交之间的差异。
+
+说明：分析与入库代码依赖 PostgreSQL 专有语法 (DISTINCT ON、物化视图、execute_values、COPY)，
+     因此只支持 PostgreSQL，不提供 SQLite 替身。
+
+用法：
+    export BENCH_DB_URL=postgresql+psycopg2://user@localhost/nt_bench
+    python benchmarks/run_benchmarks.py --generate --stocks 5000 --years 20   # 首次生成合成数据
+    python benchmarks/run_benchmarks.py                                        # 运行全部用例
+    python benchmarks/run_benchmarks.py --only get_quarter_vwap --repeat 5
+    python benchmarks/run_benchmarks.py --compare storage/benchmarks/a.json storage/benchmarks/b.json
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from analysis_engine import NationalTeamAnalyzer
+from batch_history_trace import HistoryTracer
+from etl_ingest import DataEngine
+from query_plans import QUERIES
+import fast_read
+import synthetic_data
+
+RESULT_DIR = os.path.join(ROOT_DIR, "storage", "benchmarks")
+SAMPLE_SIZE = 200
+
+# ================= 用例 =================
+# 每个用例: setup(ctx) 返回本用例的输入 (不计时)，run(ctx, data, i) 为计时部分 (i 为第几次重复)，返回操作数
+def setup_vwap(ctx):
+    sql = text("SELECT ts_code, end_date FROM nt_shareholders ORDER BY random() LIMIT :n")
+    return [tuple(r) for r in ctx["engine"].connect().execute(sql, {"n": SAMPLE_SIZE})]
+
+def run_vwap(ctx, data, i):
+    for code, end_date in data: ctx["analyzer"].get_quarter_vwap(code, end_date)
+    return len(data)
+
+def setup_single_holder(ctx):
+    sql = text("""
+        SELECT ts_code, holder_name FROM (SELECT DISTINCT ts_code, holder_name FROM nt_shareholders) t
+        ORDER BY random() LIMIT :n
+    """)
+    pairs = pd.read_sql(sql, ctx["engine"], params={"n": SAMPLE_SIZE // 4})
+    shareholders = pd.read_sql(text("""
+        SELECT s.ts_code, s.holder_name AS "HOLDER_NAME", s.end_date AS "END_DATE", s.hold_amount * 10000 AS "HOLD_NUM"
+        FROM nt_shareholders s JOIN unnest(CAST(:codes AS text[]), CAST(:holders AS text[])) AS p(ts_code, holder_name)
+          ON s.ts_code = p.ts_code AND s.holder_name = p.holder_name
+    """), ctx["engine"], params={"codes": pairs['ts_code'].tolist(), "holders": pairs['holder_name'].tolist()})
+    shareholders['HOLD_NUM'] = shareholders['HOLD_NUM'].astype(float)
+    market = {code: ctx["tracer"].get_market_data_from_db(code) for code in pairs['ts_code'].unique()}
+    return [(group, market[code]) for (code, _), group in shareholders.groupby(['ts_code', 'HOLDER_NAME'])]
+
+def run_single_holder(ctx, data, i):
+    for holder_df, market_df in data: ctx["tracer"].calculate_single_holder(holder_df, market_df)
+    return len(data)
+
+def run_analyze(ctx, data, i):
+    ctx["analyzer"].analyze_positions(force=True)
+    return 1
+
+def run_latest_view(ctx, data, i):
+    return len(pd.read_sql("SELECT * FROM mv_nt_latest_positions", ctx["engine"]))
+
+def run_latest_view_copy(ctx, data, i):
+    return len(fast_read.load_latest_positions(ctx["engine"]))
+
+def run_analysis_read(ctx, data, i):
+    return len(pd.read_sql(fast_read.ANALYSIS_SHAREHOLDERS_SQL, ctx["engine"]))
+
+def run_analysis_read_copy(ctx, data, i):
+    return len(fast_read.load_analysis_shareholders(ctx["engine"]))
+
+def run_latest_join(ctx, data, i):
+    return len(pd.read_sql(QUERIES["dashboard_latest"][0], ctx["engine"]))
+
+def setup_write_shareholders(ctx):
+    return pd.read_sql(text("SELECT ts_code, ann_date, end_date, holder_name, hold_amount, hold_ratio, chg_amount FROM nt_shareholders ORDER BY random() LIMIT :n"),
+                       ctx["engine"], params={"n": SAMPLE_SIZE * 5})
+
+def run_write_shareholders(ctx, data, i):
+    # 每次重复使用不同的未来报告期，保证走插入路径；结束后由 cleanup 删除
+    df = data.copy()
+    df['end_date'] = pd.to_datetime(df['end_date']) + pd.DateOffset(years=100 + i)
+    df['end_date'] = df['end_date'].dt.date
+    ctx["data_engine"].save_shareholders(df)
+    return len(df)
+
+def cleanup_write_shareholders(ctx, data):
+    with ctx["engine"].begin() as conn:
+        conn.execute(text("DELETE FROM nt_shareholders WHERE end_date > :d"), {"d": datetime.date.today() + datetime.timedelta(days=3650)})
+
+def setup_write_market(ctx):
+    df = pd.read_sql(text("""
+        SELECT m.* FROM nt_market_data m
+        JOIN (SELECT ts_code FROM stock_basic ORDER BY random() LIMIT :n) s ON m.ts_code = s.ts_code
+        WHERE m.trade_date >= CURRENT_DATE - 30
+    """), ctx["engine"], params={"n": SAMPLE_SIZE // 4})
+    return [(code, g.to_dict(orient='records')) for code, g in df.groupby('ts_code')]
+
+def run_write_market(ctx, data, i):
+    for code, rows in data: ctx["data_engine"].save_daily_rows(code, rows)
+    return sum(len(rows) for _, rows in data)
+
+def setup_write_history(ctx):
+    sql = text("SELECT ts_code, holder_name, hist_cost, first_buy_date FROM nt_history_cost ORDER BY random() LIMIT :n")
+    return [tuple(r) for r in ctx["engine"].connect().execute(sql, {"n": SAMPLE_SIZE})]
+
+def run_write_history(ctx, data, i):
+    for code, holder, cost, f_date in data:
+        ctx["tracer"].save_history_cost(code, holder, float(cost or 0), 0.0, 0, f_date)
+    return len(data)
+
+# 名称 -> (setup, run, cleanup)；顺序执行，analyze_positions 需在读取物化视图之前
+BENCHMARKS = {
+    "get_quarter_vwap": (setup_vwap, run_vwap, None),
+    "calculate_single_holder": (setup_single_holder, run_single_holder, None),
+    "analyze_positions": (None, run_analyze, None),
+    "load_data_latest_view": (None, run_latest_view, None),
+    "load_data_latest_copy": (None, run_latest_view_copy, None),
+    "load_data_latest_join": (None, run_latest_join, None),
+    "analysis_read_sql": (None, run_analysis_read, None),
+    "analysis_read_copy": (None, run_analysis_read_copy, None),
+    "write_shareholders": (setup_write_shareholders, run_write_shareholders, cleanup_write_shareholders),
+    "write_market_data": (setup_write_market, run_write_market, None),
+    "write_history_cost": (setup_write_history, run_write_history, None),
+}
+
+def run_all(ctx, names=None, repeat=3):
+    results = {}
+    for name, (setup, run, cleanup) in BENCHMARKS.items():
+        if names and name not in names: continue
+        data = setup(ctx) if setup else None
+        runs, ops = [], 0
+        for i in range(repeat):
+            started = time.perf_counter()
+            ops = run(ctx, data, i)
+            runs.append(time.perf_counter() - started)
+        if cleanup: cleanup(ctx, data)
+        median = statistics.median(runs)
+        results[name] = {
+            "runs_s": [round(r, 4) for r in runs], "min_s": round(min(runs), 4), "median_s": round(median, 4),
+            "max_s": round(max(runs), 4), "ops": ops, "per_op_ms": round(median / ops * 1000, 3) if ops else None,
+        }
+        print(f"⏱️ {name:<26} median {median:>9.3f}s  ({ops} ops, {results[name]['per_op_ms']} ms/op)")
+    return results
+
+def dataset_scale(engine):
+    with engine.connect() as conn:
+        return {t: conn.execute(text(f"SELECT count(*) FROM {t}")).scalar()
+                for t in ["stock_basic", "nt_market_data", "nt_shareholders", "nt_history_cost"]}
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def compare(before, after):
+    print(f"{'benchmark':<26} {'before(s)':>11} {'after(s)':>11} {'speedup':>9}")
+    for name, b in before["results"].items():
+        a = after["results"].get(name)
+        if not a: continue
+        speedup = b["median_s"] / a["median_s"] if a["median_s"] > 0 else float("inf")
+        print(f"{name:<26} {b['median_s']:>11.3f} {a['median_s']:>11.3f} {speedup:>8.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    parser.add_argument("--db-url", help="独立的基准测试库 (默认读取 BENCH_DB_URL)")
+    parser.add_argument("--generate", action="store_true", help="先重新生成合成数据")
+    parser.add_argument("--stocks", type=int, default=200)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--holders", type=int, default=3)
+    parser.add_argument("--only", nargs="*", help="只运行指定用例")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="结果 JSON 路径 (默认 storage/benchmarks/bench_<commit>_<时间>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="对比两次保存的结果")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f: before = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f: after = json.load(f)
+        compare(before, after)
+        sys.exit(0)
+
+    db_url = synthetic_data.resolve_db_url(args.db_url)
+    if not db_url.startswith("postgresql"):
+        sys.exit("❌ 仅支持 PostgreSQL 基准测试库。")
+    engine = create_engine(db_url, pool_size=20, max_overflow=0)
+    if args.generate:
+        synthetic_data.generate(engine, args.stocks, args.years, args.holders)
+
+    ctx = {
+        "engine": engine,
+        "analyzer": NationalTeamAnalyzer(engine=engine),
+        "tracer": HistoryTracer(engine=engine),
+        "data_engine": DataEngine(engine=engine),
+    }
+    results = run_all(ctx, args.only, args.repeat)
+
+    commit = git_commit()
+    report = {
+        "created_at": datetime.datetime.now().isoformat(),
+        "git_commit": commit,
+        "database": f"{engine.url.get_backend_name()}/{engine.url.database}",
+        "scale": dataset_scale(engine),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    path = args.save or os.path.join(RESULT_DIR, f"bench_{commit}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"💾 已保存: {path}")
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+合成数据生成器
+功能：按指定规模生成 stock_basic / nt_market_data / nt_shareholders / nt_history_cost / nt_stock_fundamentals，
+     用 COPY 批量导入独立的基准测试库，随后执行 migrations/ 保证索引与物化视图和生产一致。
+
+用法：
+    python benchmarks/synthetic_data.py --db-url postgresql+psycopg2://user@host/nt_bench --stocks 5000 --years 20
+"""
+import argparse
+import datetime
+import io
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import migrate
+from config import DB_URL
+
+SCHEMA_FILE = os.path.join(ROOT_DIR, "database_onlyTables.sql")
+TRADING_DAYS_PER_YEAR = 245
+SHAREHOLDER_YEARS = 5  # 股东明细只生成最近 5 年的季度数据 (分析只读取 2022 年之后的公告)
+HOLDER_POOL = [
+    "中央汇金资产管理有限责任公司", "中央汇金投资有限责任公司", "中国证券金融股份有限公司",
+    "全国社保基金一零一组合", "全国社保基金一一八组合", "全国社保基金四一三组合", "全国社保基金五零三组合",
+    "基本养老保险基金八零二组合", "基本养老保险基金一二零三组合", "国新投资有限公司",
+    "国家集成电路产业投资基金股份有限公司", "梧桐树投资平台有限责任公司",
+]
+
+def resolve_db_url(db_url):
+    """基准测试必须使用独立数据库，禁止指向 config.DB_URL"""
+    db_url = db_url or os.getenv("BENCH_DB_URL")
+    if not db_url:
+        sys.exit("❌ 请通过 --db-url 或环境变量 BENCH_DB_URL 指定独立的基准测试库。")
+    if db_url == DB_URL:
+        sys.exit("❌ 基准测试库不能与 config.DB_URL 相同 (生成数据会清空整个 public schema)。")
+    return db_url
+
+def stock_codes(n):
+    """一半沪市 6xxxxx, 一半深市 00xxxx"""
+    half = n // 2
+    return [f"{600000 + i:06d}" for i in range(half)] + [f"{1 + i:06d}" for i in range(n - half)]
+
+def gen_market_data(code, days, rng):
+    """几何随机游走生成日线；vol 单位为手, amount 单位为元 (与 ETL 入库口径一致)"""
+    n = len(days)
+    close = rng.uniform(5, 80) * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    vol = rng.lognormal(11, 0.6, n).round()
+    amount = vol * 100 * (high + low + close) / 3
+    return pd.DataFrame({
+        "ts_code": code, "trade_date": days, "open": open_.round(2), "high": high.round(2),
+        "low": low.round(2), "close": close.round(2), "vol": vol, "amount": amount.round(2),
+    })
+
+def gen_shareholders(code, quarters, holders_per_stock, rng):
+    """每只股票随机选若干机构，按季度生成持股数 (万股)，期间可能减仓、加仓或清仓后重新进入"""
+    rows = []
+    for holder in rng.choice(HOLDER_POOL, size=min(holders_per_stock, len(HOLDER_POOL)), replace=False):
+        start = rng.integers(0, len(quarters) - 1)
+        amount = rng.uniform(100, 5000)
+        for end_date in quarters[start:]:
+            if rng.random() < 0.05: break  # 退出十大股东
+            chg = 0.0 if rng.random() < 0.5 else amount * rng.normal(0, 0.15)
+            amount = max(amount + chg, 1.0)
+            rows.append((code, end_date + datetime.timedelta(days=30), end_date, holder, round(amount, 2), round(rng.uniform(0.1, 5), 4), round(chg, 2)))
+    return rows
+
+def copy_frame(raw_conn, table, df):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    with raw_conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH CSV", buf)
+
+def create_schema(engine):
+    """重建 public schema 并执行 database_onlyTables.sql (去掉 psql 元命令与 OWNER 语句)"""
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        sql = "\n".join(l for l in f.read().splitlines() if not l.startswith("\\"))
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+        for stmt in migrate.split_statements(sql):
+            if "OWNER TO" in stmt or "set_config('search_path'" in stmt: continue
+            conn.execute(text(stmt))
+
+def generate(engine, stocks=200, years=5, holders_per_stock=3, history_ratio=0.7, seed=42, batch=100):
+    rng = np.random.default_rng(seed)
+    today = datetime.date.today()
+    days = pd.bdate_range(end=today, periods=years * TRADING_DAYS_PER_YEAR).date
+    quarters = [d.date() for d in pd.date_range(end=today, periods=SHAREHOLDER_YEARS * 4, freq="QE")]
+    codes = stock_codes(stocks)
+
+    print(f">>> 🧪 正在生成合成数据: {stocks} 只股票 × {years} 年日线 ...")
+    create_schema(engine)
+    raw = engine.raw_connection()
+    try:
+        copy_frame(raw, "stock_basic", pd.DataFrame({"ts_code": codes, "name": [f"合成{c}" for c in codes]}))
+        sh_rows, hc_rows, fund_rows = [], [], []
+        for i in range(0, len(codes), batch):
+            chunk = codes[i:i + batch]
+            market = pd.concat([gen_market_data(c, days, rng) for c in chunk], ignore_index=True)
+            copy_frame(raw, "nt_market_data", market)
+            last_close = market.groupby("ts_code")["close"].last()
+            mean_close = market.groupby("ts_code")["close"].mean()
+            for code in chunk:
+                rows = gen_shareholders(code, quarters, holders_per_stock, rng)
+                sh_rows.extend(rows)
+                for holder in {r[3] for r in rows}:
+                    if rng.random() < history_ratio:
+                        first = min(r[2] for r in rows if r[3] == holder)
+                        cost = mean_close[code] * rng.uniform(0.7, 1.1)
+                        hc_rows.append((code, holder, round(cost, 4), 0, 0, first, datetime.datetime.now()))
+                fund_rows.append((code, float(last_close[code]), round(rng.uniform(5, 60), 2), round(rng.uniform(0.5, 8), 2),
+                                  round(rng.uniform(0, 6), 2), today))
+            print(f"    日线 {min(i + batch, len(codes))}/{len(codes)}")
+        copy_frame(raw, "nt_shareholders", pd.DataFrame(sh_rows, columns=["ts_code", "ann_date", "end_date", "holder_name", "hold_amount", "hold_ratio", "chg_amount"]))
+        copy_frame(raw, "nt_history_cost", pd.DataFrame(hc_rows, columns=["ts_code", "holder_name", "hist_cost", "total_invest", "total_shares", "first_buy_date", "calc_date"]))
+        copy_frame(raw, "nt_stock_fundamentals", pd.DataFrame(fund_rows, columns=["ts_code", "curr_price", "pe_ttm", "pb", "div_rate", "update_date"]))
+        raw.commit()
+    finally:
+        raw.close()
+
+    migrate.run(engine)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+    scale = {"stocks": stocks, "years": years, "holders_per_stock": holders_per_stock, "seed": seed,
+             "market_rows": stocks * len(days), "shareholder_rows": len(sh_rows), "history_cost_rows": len(hc_rows)}
+    print(f"✅ 合成数据就绪: {scale}")
+    return scale
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成基准测试用合成数据")
+    parser.add_argument("--db-url", help="独立的基准测试库 (默认读取 BENCH_DB_URL)")
+    parser.add_argument("--stocks", type=int, default=200)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--holders", type=int, default=3, help="每只股票的机构数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(create_engine(resolve_db_url(args.db_url)), args.stocks, args.years, args.holders, seed=args.seed)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+图表数据准备 v1.0 (与 Streamlit 解耦，可供后台任务复用)
+功能：
+1. [向量化] 由持仓历史一次性计算 建仓/加仓/减仓 区间，相邻同类区间自动合并。
+2. [批量绘制] 区间转换为 Plotly shapes 列表，一次性写入 layout，替代逐个 add_vrect。
+3. [视图] K线默认可见区间与 Y 轴范围、简易技术指标，看板与深度扫描预计算 (drilldown.py) 共用。
+"""
+import numpy as np
+import pandas as pd
+
+# K线展示区间: (默认可见年数, 采样粒度)。None 表示全部历史
+KLINE_RANGES = {
+    "近1年": (1, "day"),
+    "近3年": (3, "day"),
+    "近5年": (5, "week"),
+    "全部": (None, "month"),
+}
+DEFAULT_KLINE_RANGE = "近3年"
+KLINE_BUFFER_MONTHS = 6  # 可见区间之外多取的缓冲, 平移时不至于露白
+
+SEGMENT_COLORS = {
+    "build": "rgba(52, 152, 219, 0.15)",   # 🔵 建仓 - 蓝色
+    "add": "rgba(231, 76, 60, 0.15)",      # 🔴 加仓 - 红色
+    "reduce": "rgba(46, 204, 113, 0.15)",  # 🟢 减仓 - 绿色
+}
+
+def position_segments(pos_history):
+    """
+    计算持仓变动区间: 上个报告期(或建仓日) -> 当前报告期
+    返回列: start, end, action (build/add/reduce)，持仓未动的区间不返回
+    """
+    if pos_history is None or pos_history.empty:
+        return pd.DataFrame(columns=['start', 'end', 'action'])
+
+    df = pos_history.sort_values('period_end')
+    end = pd.to_datetime(df['period_end']).reset_index(drop=True)
+    hold = pd.to_numeric(df['hold_amount'], errors='coerce').reset_index(drop=True)
+    prev_hold = hold.shift(1)
+
+    # 第一条记录从建仓日开始, 没有建仓日则向前推一个季度
+    first_buy = pd.to_datetime(df['first_buy_date']).reset_index(drop=True)
+    start = end.shift(1)
+    start.iloc[0] = first_buy.iloc[0] if pd.notnull(first_buy.iloc[0]) else end.iloc[0] - pd.DateOffset(months=3)
+
+    is_first = np.arange(len(df)) == 0
+    action = pd.Series(np.select(
+        [is_first, hold > prev_hold, hold < prev_hold],
+        ["build", "add", "reduce"],
+        default="",
+    ))
+
+    # 合并相邻的同类区间 (区间首尾相接)
+    block = (action != action.shift(1)).cumsum()
+    seg = pd.DataFrame({'start': start, 'end': end, 'action': action, 'block': block})
+    seg = seg[seg['action'] != ""]
+    seg = seg.groupby('block', sort=True).agg(start=('start', 'min'), end=('end', 'max'), action=('action', 'first'))
+    return seg.reset_index(drop=True)
+
+def segments_to_shapes(segments):
+    """区间 -> Plotly 背景矩形 (铺满纵轴, 置于K线下方)"""
+    return [
+        dict(
+            type="rect", xref="x", yref="paper", y0=0, y1=1,
+            x0=s.start, x1=s.end, fillcolor=SEGMENT_COLORS[s.action],
+            opacity=1, layer="below", line_width=0,
+        )
+        for s in segments.itertuples(index=False)
+    ]
+
+def kline_view(k_df, years):
+    """
+    默认可见区间 (最近 years 年, None 为全部) 及该区间内的 Y 轴范围
+    缓冲区只用于平移, 不参与 Y 轴计算；返回 (x_start, x_end, y_min, y_max)，区间内无数据时 y 为 None
+    """
+    max_date = k_df['trade_date'].max()
+    min_date_view = max_date - pd.DateOffset(years=years) if years else k_df['trade_date'].min()
+    df_view = k_df[k_df['trade_date'] >= min_date_view]
+    if df_view.empty:
+        return min_date_view, max_date, None, None
+    return min_date_view, max_date, df_view['low'].min() * 0.95, df_view['high'].max() * 1.05
+
+def simple_indicators(df):
+    """由日线收盘价现场计算 MA20/MA60/RSI/乖离率 (预计算指标缺失时的退路)"""
+    if df.empty: return {}
+    close = df['close']
+    ma20 = close.rolling(window=20).mean().iloc[-1]
+    ma60 = close.rolling(window=60).mean().iloc[-1]
+    curr = close.iloc[-1]
+    delta = close.diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rs = gain / loss
+    rsi = 100 - (100 / (1 + rs)).iloc[-1]
+    bias20 = (curr - ma20) / ma20 * 100
+    return { "MA20": ma20, "MA60": ma60, "RSI": rsi, "Bias20": bias20, "Trend": "多头排列" if ma20 > ma60 else "空头排列" }
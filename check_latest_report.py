@@ -5,11 +5,12 @@
 """
 import requests
 import datetime
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+import db
 import os
 
 # ================= 配置引用 =================
-from config import DB_URL, PUSHPLUS_TOKEN
+from config import PUSHPLUS_TOKEN
 # ===========================================
 
 def send_pushplus(title, content):
@@ -37,7 +38,7 @@ def check_latest_report():
     print(f"🔍 正在扫描数据库最新财报期... (当前时间: {datetime.datetime.now()})")
     
     try:
-        engine = create_engine(DB_URL)
+        engine = db.get_engine()
         today = datetime.date.today()
         
         with engine.connect() as conn:
@@ -10,13 +10,37 @@ PUSHPLUS_TOKEN = os.getenv('PUSHPLUS_TOKEN', "your_pushplus_token_here")
 # Tushare Token (仅 etl_ingest_tushare.py 使用)
 TUSHARE_TOKEN = os.getenv('TUSHARE_TOKEN', "your_tushare_token_here")
 
+# 数据接口地址 (默认为官方地址；压测时可通过环境变量指向 benchmarks/mock_server.py)
+DATACENTER_URL = os.getenv('DATACENTER_URL', "https://datacenter.eastmoney.com/securities/api/data/get")  # 十大股东
+KLINE_URL = os.getenv('KLINE_URL', "http://push2his.eastmoney.com/api/qt/stock/kline/get")               # 日K线
+QUOTE_URL = os.getenv('QUOTE_URL', "http://push2.eastmoney.com/api/qt/stock/get")                        # 实时行情/估值
+TUSHARE_API_URL = os.getenv('TUSHARE_API_URL', "")  # 为空时使用 tushare 默认地址
+
 # ================= 业务参数配置 =================
 # 国家队/机构识别关键词
 SSF_KEYWORDS = ["社保", "梧桐树投资", "证金", "中央汇金", "全国社保", "基本养老", "中国证券金融", "社保基金", "汇金资管", "国新投资", "国家集成电路"]
 
+# 🏷️ 机构分组 (支持 * 通配符)：采集时为股东打上分组标签，看板按分组筛选
+TAG_GROUPS = {
+    "👑 国家队核心": ["*中央汇金*", "*证券金融*"],
+    "🛡️ 社保大军": ["全国社保基金*"],
+    "👴 养老金战队": ["基本养老保险基金*"],
+    "📈 产业孵化与战略投资": ["国新投资*", "国家集成电路*"],
+    #"💲梧桐树投资（外汇管理局）": ["梧桐树投资*"],
+    #"🏦 险资/银行/公募": ["中国人寿*", "新华人寿*", "*银行*", "易方达*", "华夏基金*"]
+}
+
 # 🚀 并发配置
 SHAREHOLDER_WORKERS = 8  # 股东数据抓取：极速
 SENSITIVE_WORKERS = 2     # K线/基本面抓取：慢速 (防封)
 
 # 💰 成本估算策略
 COST_DISCOUNT = 0.95      # 估算成交价相对于 VWAP 的折扣
+
+# 📡 运行指标 (Prometheus)
+METRICS_TEXTFILE_DIR = os.getenv('METRICS_TEXTFILE_DIR', "storage/metrics")  # 运行结束写出 .prom 文件, 置空则不写
+METRICS_PORT = int(os.getenv('METRICS_PORT', "0"))                        # 流水线运行期间的 /metrics 端口, 0 为关闭
+DASHBOARD_METRICS_PORT = int(os.getenv('DASHBOARD_METRICS_PORT', "0"))    # 看板进程的 /metrics 端口, 0 为关闭
+
+# 🗄️ 本地列式日线仓库 (market_store.py，需要 pyarrow)
+MARKET_STORE_DIR = os.getenv('MARKET_STORE_DIR', "")  # 例如 storage/market_store，置空则不启用 (全部读数据库)
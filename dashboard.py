@@ -3,114 +3,165 @@
 🇨🇳 国家队持仓透视系统 v1.1
 更新内容：
 1. [Sidebar] 增加 GitHub 跳转链接。
+2. [查询下推] 机构/状态/关键词筛选、排序、分页与各项汇总交由 query_service 在数据库中完成，
+   看板不再加载全量最新持仓，持仓明细只读取当前页。
+3. [内存] 查询结果为紧凑类型 (category / float32)，以 cache_resource 在全进程只保留一份、各会话只读共享；
+   会话需要的派生列通过写时复制生成，不会改写共享数据。
 """
 
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import plotly.graph_objects as go
 import plotly.express as px
-import fnmatch
+import market_rollup
+import metrics
+import db
+import holder_match
+import query_service
+import drilldown
+from chart_data import position_segments, segments_to_shapes, kline_view, KLINE_RANGES, DEFAULT_KLINE_RANGE, KLINE_BUFFER_MONTHS
+from leaderboard import aggregate_holder_stats, LEADERBOARD_TABLE, LEADERBOARD_COLS
 
 st.set_page_config(page_title="国家队持仓透视系统 v1.1", layout="wide", page_icon="🇨🇳")
+# 写时复制: 各会话从共享结果派生的 DataFrame 不会改写共享数据
+pd.set_option("mode.copy_on_write", True)
 # ================= 配置引用 =================
-from config import DB_URL
-TAG_GROUPS = {
-    "👑 国家队核心": ["*中央汇金*", "*证券金融*"],
-    "🛡️ 社保大军": ["全国社保基金*"],
-    "👴 养老金战队": ["基本养老保险基金*"],
-    "📈 产业孵化与战略投资": ["国新投资*", "国家集成电路*"],
-    #"💲梧桐树投资（外汇管理局）": ["梧桐树投资*"],
-    #"🏦 险资/银行/公募": ["中国人寿*", "新华人寿*", "*银行*", "易方达*", "华夏基金*"]
-}
+from config import DASHBOARD_METRICS_PORT, TAG_GROUPS
 
 @st.cache_resource
 def get_engine():
-    return create_engine(DB_URL)
+    return db.get_engine("dashboard")
 
-def load_data_latest():
-    engine = get_engine()
-    
-    sql = """
-    SELECT 
-        a.ts_code, b.name, a.holder_name, a.est_cost, a.curr_price, 
-        a.profit_rate, a.status, a.period_end, a.hold_amount,
-        a.cost_source, a.first_buy_date, a.change_analysis, a.update_time,
-        f.pe_ttm, f.pe_dyn, f.pe_static, f.pb, f.div_rate, f.total_mv, f.div_rate_static,
-        f.eps, f.roe, f.revenue_growth, f.net_profit_growth,
-        f.revenue, f.gross_margin, f.net_margin
-    FROM nt_positions_analysis a
-    LEFT JOIN stock_basic b ON a.ts_code = b.ts_code
-    LEFT JOIN nt_stock_fundamentals f ON a.ts_code = f.ts_code
-    WHERE a.is_latest = true
-    """
+@st.cache_resource
+def start_metrics_server():
+    """看板进程内只启动一次 /metrics 端点 (DASHBOARD_METRICS_PORT 为 0 时不启动)"""
+    return metrics.start_http_server(DASHBOARD_METRICS_PORT)
+
+start_metrics_server()
+
+# 看板加载函数埋点: counted 在缓存外层统计总调用次数, timed 在缓存内层只统计实际查询,
+# 两者之比即缓存命中率 (nt_dashboard_cache_hit_ratio)
+# 返回 DataFrame 的加载函数用 cache_resource: 所有会话共享同一对象 (cache_data 每次命中都会反序列化出一份副本)，调用方只读
+
+# 最新持仓的筛选/排序/分页/汇总在数据库中完成 (query_service)；筛选条件为 (机构, 状态, 关键词) 元组，同时作为缓存键
+PAGE_SIZES = [50, 100, 200]
+SORT_OPTIONS = {
+    "最新财报期": "period_end", "持仓市值": "position_val", "盈亏率": "profit_rate_pct",
+    "盈亏金额": "profit_val", "代码": "ts_code", "机构": "holder_name",
+}
+
+def _filter_args(filters):
+    holders, statuses, keyword = filters
+    return {"holders": list(holders), "statuses": list(statuses), "keyword": keyword}
+
+@metrics.counted("dashboard_loader_calls_total", loader="options")
+@st.cache_data(ttl=600, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="options")
+def load_filter_options():
+    """侧边栏选项 (机构及分组、状态、数据更新时间)"""
     try:
-        df = pd.read_sql(sql, engine)
+        options = query_service.filter_options(get_engine())
     except Exception as e:
         st.error(f"数据库读取失败: {e}")
-        return pd.DataFrame()
-    
-    if not df.empty:
-        df['hold_amount'] = df['hold_amount'].fillna(0)
-        df['profit_rate_pct'] = df['profit_rate'] * 100
-        df['period_end'] = pd.to_datetime(df['period_end'])
-        df['first_buy_date'] = pd.to_datetime(df['first_buy_date'])
-        df['update_time'] = pd.to_datetime(df['update_time'])
-        
-        df['first_buy_date'] = df['first_buy_date'].fillna(df['period_end'])
-        
-        def clean_status(s):
-            if isinstance(s, str) and "(" in s:
-                return s.split("(")[1].replace(")", "")
-            return s
-        df['status'] = df['status'].apply(clean_status)
-
-        numeric_cols = [
-            'div_rate', 'div_rate_static', 'pe_ttm', 'pe_dyn', 'pe_static', 'pb', 
-            'total_mv', 'est_cost', 'curr_price', 'eps', 'roe', 
-            'revenue_growth', 'net_profit_growth', 'revenue', 'gross_margin', 'net_margin'
-        ]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df['div_rate'] = df['div_rate'].fillna(0)
-        if 'div_rate_static' in df.columns:
-            df['div_rate_static'] = df['div_rate_static'].fillna(0)
-            
-        df['position_val'] = df['hold_amount'] * 10000 * df['curr_price']
-        df['profit_val'] = (df['curr_price'] - df['est_cost']) * df['hold_amount'] * 10000
-        
-    return df
+        return {"holders": pd.DataFrame(columns=['holder_name', 'holder_group']), "statuses": [], "update_time": None}
+    # 分组标签采集时已写入; 历史数据尚未回填时按名称现场计算
+    holders = options["holders"]
+    missing = holders['holder_group'].isna()
+    if missing.any():
+        holders.loc[missing, 'holder_group'] = holder_match.groups_of(holders.loc[missing, 'holder_name'])
+    return options
+
+@metrics.counted("dashboard_loader_calls_total", loader="summary")
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="summary")
+def load_summary(filters):
+    try: return query_service.summary(get_engine(), **_filter_args(filters))
+    except: return {"count": 0, "win": 0, "loss": 0, "position_sum": 0.0, "profit_sum": 0.0, "avg_profit_pct": None}
+
+@metrics.counted("dashboard_loader_calls_total", loader="top_positions")
+@st.cache_resource(ttl=600, max_entries=256, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="top_positions")
+def load_top_positions(filters, n=15):
+    try: return query_service.top_positions(get_engine(), n, **_filter_args(filters))
+    except: return pd.DataFrame(), 0.0
+
+@metrics.counted("dashboard_loader_calls_total", loader="page")
+@st.cache_resource(ttl=600, max_entries=256, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="page")
+def load_page(filters, page_no, page_size, sort, descending):
+    try: return query_service.page(get_engine(), page_no, page_size, sort, descending, **_filter_args(filters))
+    except: return query_service.empty_page()
+
+@metrics.counted("dashboard_loader_calls_total", loader="holder_rows")
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="holder_rows")
+def load_holder_rows(filters):
+    try: return query_service.holder_rows(get_engine(), **_filter_args(filters))
+    except: return pd.DataFrame()
 
-def load_kline_data(ts_code):
+@metrics.counted("dashboard_loader_calls_total", loader="leaderboard")
+@st.cache_data(ttl=600, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="leaderboard")
+def load_leaderboard():
+    """读取分析任务预计算的全量排行榜"""
+    try:
+        return pd.read_sql(f"SELECT {', '.join(LEADERBOARD_COLS)} FROM {LEADERBOARD_TABLE}", get_engine())
+    except: return pd.DataFrame()
+
+@metrics.counted("dashboard_loader_calls_total", loader="kline")
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="kline")
+def load_kline_data(ts_code, years=3, freq="day"):
+    """按窗口加载K线: 只取 (最近 years 年 + 缓冲) 的数据, 周/月线读取预聚合表"""
     engine = get_engine()
-    sql = text("SELECT trade_date, open, high, low, close, vol FROM nt_market_data WHERE ts_code = :code ORDER BY trade_date ASC")
     try:
-        return pd.read_sql(sql, engine, params={"code": ts_code})
+        start = None
+        if years is not None:
+            # 以该股自身最新交易日为锚点 (停牌/退市股也能取到数据)
+            latest = market_rollup.get_latest_trade_date(engine, ts_code)
+            if latest is None: return pd.DataFrame()
+            start = pd.Timestamp(latest) - pd.DateOffset(years=years, months=KLINE_BUFFER_MONTHS)
+        try:
+            df = market_rollup.load_bars(engine, ts_code, start=start, resolution=freq)
+            if not df.empty or freq == "day": return df
+        except Exception: pass
+        # 汇总表尚未生成 (或该股尚无汇总记录) 时退回日线
+        return market_rollup.load_bars(engine, ts_code, start=start, resolution="day")
     except: return pd.DataFrame()
 
-def load_position_history(ts_code, holder_name):
+@metrics.counted("dashboard_loader_calls_total", loader="position_history")
+@st.cache_resource(ttl=600, max_entries=256, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="position_history")
+def load_position_history(ts_code, holder_id):
+    """持仓变动区间所需的历史持仓 (只取 chart_data.position_segments 用到的列)"""
     engine = get_engine()
-    sql = text("SELECT * FROM nt_positions_analysis WHERE ts_code = :code AND holder_name = :holder ORDER BY period_end ASC")
+    sql = text("SELECT period_end, hold_amount, first_buy_date FROM nt_positions_analysis WHERE ts_code = :code AND holder_id = :holder ORDER BY period_end ASC")
     try:
-        return pd.read_sql(sql, engine, params={"code": ts_code, "holder": holder_name})
+        return pd.read_sql(sql, engine, params={"code": ts_code, "holder": int(holder_id)})
     except: return pd.DataFrame()
 
-def calculate_technical_indicators(df):
-    if df.empty: return {}
-    close = df['close']
-    ma20 = close.rolling(window=20).mean().iloc[-1]
-    ma60 = close.rolling(window=60).mean().iloc[-1]
-    curr = close.iloc[-1]
-    delta = close.diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-    rs = gain / loss
-    rsi = 100 - (100 / (1 + rs)).iloc[-1]
-    bias20 = (curr - ma20) / ma20 * 100
-    return { "MA20": ma20, "MA60": ma60, "RSI": rsi, "Bias20": bias20, "Trend": "多头排列" if ma20 > ma60 else "空头排列" }
+@metrics.counted("dashboard_loader_calls_total", loader="tech_indicators")
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="tech_indicators")
+def load_tech_indicators(ts_code):
+    """优先读取 ETL 预计算的技术指标, 尚未生成时退回现场计算"""
+    return drilldown.indicator_snapshot(get_engine(), ts_code)
+
+@metrics.counted("dashboard_loader_calls_total", loader="drilldown")
+@st.cache_resource(ttl=600, max_entries=256, show_spinner=False)
+@metrics.timed("dashboard_query_seconds", loader="drilldown")
+def load_drilldown(ts_code, holder_name):
+    """
+    分析任务预计算的深度扫描数据包 (默认区间)，不存在时返回 None
+    K线与持仓区间在加载时转为紧凑 DataFrame (kline_df / segments_df)，原始列表不再保留
+    """
+    try: bundle = drilldown.load_bundle(get_engine(), ts_code, holder_name)
+    except: return None
+    if not bundle: return None
+    rest = {k: v for k, v in bundle.items() if k not in ("kline", "segments")}
+    return {**rest, "kline_df": drilldown.bundle_kline(bundle), "segments_df": drilldown.bundle_segments(bundle)}
 
 def get_eastmoney_url(ts_code):
     code = str(ts_code)
@@ -126,29 +177,23 @@ def safe_fmt(val, unit="", mult=1, default="N/A"):
 
 # ================= 侧边栏 =================
 st.sidebar.title("🎛️ 战术控制台")
-df_all = load_data_latest()
+options = load_filter_options()
+holder_options = options["holders"]
 
 update_time_str = "未知"
-if not df_all.empty and 'update_time' in df_all.columns:
-    latest_dt = df_all['update_time'].max()
-    if pd.notna(latest_dt):
-        update_time_str = latest_dt.strftime("%m月%d日 %H:%M")
+if options["update_time"] is not None and pd.notna(options["update_time"]):
+    update_time_str = pd.Timestamp(options["update_time"]).strftime("%m月%d日 %H:%M")
 
 tag_options = ["(全部)"] + list(TAG_GROUPS.keys())
 selected_tag = st.sidebar.selectbox("🏷️ 选择机构分组", tag_options)
 
-available_holders = sorted(df_all['holder_name'].unique().tolist()) if not df_all.empty else []
+available_holders = holder_options['holder_name'].tolist()
 default_holders = []
 if selected_tag != "(全部)":
-    patterns = TAG_GROUPS[selected_tag]
-    for holder in available_holders:
-        for pattern in patterns:
-            if fnmatch.fnmatch(holder, pattern):
-                default_holders.append(holder)
-                break
+    default_holders = holder_options.loc[holder_options['holder_group'] == selected_tag, 'holder_name'].tolist()
 sidebar_selection = st.sidebar.multiselect("🏛️ 机构名称", available_holders, default=default_holders)
 
-status_list = df_all['status'].unique().tolist() if not df_all.empty else []
+status_list = options["statuses"]
 selected_status = st.sidebar.multiselect("📊 盈亏状态", status_list, default=status_list)
 search_keyword = st.sidebar.text_input("🔍 搜索代码/名称", "")
 
@@ -178,11 +223,9 @@ else:
     current_holders = sidebar_selection
     is_drill_mode = False
 
-filtered_df = df_all.copy()
-if not df_all.empty:
-    if current_holders: filtered_df = filtered_df[filtered_df['holder_name'].isin(current_holders)]
-    if selected_status: filtered_df = filtered_df[filtered_df['status'].isin(selected_status)]
-    if search_keyword: filtered_df = filtered_df[filtered_df['ts_code'].str.contains(search_keyword) | filtered_df['name'].str.contains(search_keyword)]
+filters = (tuple(current_holders), tuple(selected_status), search_keyword.strip())
+stats = load_summary(filters)
+has_data = stats["count"] > 0
 
 # ================= 主界面 =================
 st.title("🇨🇳 国家队持仓透视系统 v1.1")
@@ -209,30 +252,29 @@ if selected_tab == "🔍 核心看板":
         with col_msg: st.warning(f"当前正在查看单体机构：**{st.session_state.drill_target}**。")
     
     st.markdown("### 🎯 战况总览")
-    if not filtered_df.empty:
-        CUR_TOTAL_VAL = filtered_df['position_val'].sum()
-        cur_profit = filtered_df['profit_val'].sum()
+    if has_data:
+        CUR_TOTAL_VAL = stats['position_sum']
+        cur_profit = stats['profit_sum']
         real_yield = (cur_profit / CUR_TOTAL_VAL * 100) if CUR_TOTAL_VAL != 0 else 0
-        avg_yield = filtered_df['profit_rate_pct'].mean()
+        avg_yield = stats['avg_profit_pct'] or 0
         
         col_m1, col_m2, col_m3, col_m4, col_m5 = st.columns(5)
-        col_m1.metric("当前持有", f"{len(filtered_df)} 只")
-        col_m2.metric("盈利 / 被套", f"{len(filtered_df[filtered_df['profit_rate'] > 0])} / {len(filtered_df[filtered_df['profit_rate'] <= 0])}")
+        col_m1.metric("当前持有", f"{stats['count']} 只")
+        col_m2.metric("盈利 / 被套", f"{stats['win']} / {stats['loss']}")
         col_m3.metric("持仓收益率", f"{real_yield:.2f}%", delta_color="normal")
         col_m4.metric("平均收益率", f"{avg_yield:.2f}%")
         col_m5.metric("筛选总盈亏", f"{cur_profit/100000000:.2f} 亿", help=f"筛选持仓市值: {CUR_TOTAL_VAL/100000000:.2f} 亿")
     else: st.info("暂无数据。")
 
     st.divider()
-    if not filtered_df.empty and CUR_TOTAL_VAL > 0:
+    if has_data and CUR_TOTAL_VAL > 0:
+        top_df, others_val = load_top_positions(filters)
         st.subheader("🍰 资金分布")
         col_pie, col_top = st.columns([2, 1])
 
         with col_pie:
-            pie_df = filtered_df.copy().sort_values('position_val', ascending=False)
-            plot_data = pie_df.iloc[:15] if len(pie_df) > 15 else pie_df
-            if len(pie_df) > 15:
-                others_val = pie_df.iloc[15:]['position_val'].sum()
+            plot_data = top_df
+            if others_val > 0:
                 plot_data = pd.concat([plot_data, pd.DataFrame([{'name': '其他', 'position_val': others_val}])])
 
             fig_pie = px.pie(plot_data, values='position_val', names='name', title=f"市值分布 (筛选总额: {CUR_TOTAL_VAL/100000000:.2f}亿)", hole=0.45)
@@ -243,7 +285,7 @@ if selected_tab == "🔍 核心看板":
         with col_top:
             st.markdown("#### 💎 重仓 Top 5 ")
             st.markdown("---")
-            top5_df = filtered_df.sort_values('position_val', ascending=False).head(5)
+            top5_df = top_df.head(5)
             for i, row in top5_df.iterrows():
                 rel_ratio = (row['position_val'] / CUR_TOTAL_VAL) * 100
                 val_yi = row['position_val'] / 100000000
@@ -269,14 +311,23 @@ if selected_tab == "🔍 核心看板":
     st.divider()
     st.subheader("📋 持仓明细")
     
-    if not filtered_df.empty:
-        display_df = filtered_df.copy()
-        display_df = display_df.sort_values('period_end', ascending=False)
-        display_df['rel_weight'] = (display_df['position_val'] / CUR_TOTAL_VAL) * 100
-        display_df['display_val'] = display_df['position_val'] / 100000000 
-        display_df['display_amount'] = display_df['hold_amount'] * 100 
-        display_df['period_end_str'] = display_df['period_end'].dt.strftime('%Y-%m-%d')
-        display_df['first_buy_str'] = display_df['first_buy_date'].dt.strftime('%Y-%m-%d')
+    if has_data:
+        col_sort, col_dir, col_size, col_page = st.columns([2, 1, 1, 2])
+        sort_label = col_sort.selectbox("排序", list(SORT_OPTIONS.keys()), key="detail_sort")
+        descending = col_dir.selectbox("顺序", ["降序", "升序"], key="detail_order") == "降序"
+        page_size = col_size.selectbox("每页", PAGE_SIZES, key="detail_page_size")
+        n_pages = max(1, -(-stats['count'] // page_size))
+        page_no = col_page.selectbox(f"页码 (共 {n_pages} 页, {stats['count']} 条)", range(1, n_pages + 1), key="detail_page") - 1
+
+        # 共享的当前页只读, 展示列在会话自己的副本上生成
+        page_df = load_page(filters, page_no, page_size, SORT_OPTIONS[sort_label], descending)
+        display_df = page_df.assign(
+            rel_weight=(page_df['position_val'] / CUR_TOTAL_VAL) * 100,
+            display_val=page_df['position_val'] / 100000000,
+            display_amount=page_df['hold_amount'] * 100,
+            period_end_str=page_df['period_end'].dt.strftime('%Y-%m-%d'),
+            first_buy_str=page_df['first_buy_date'].dt.strftime('%Y-%m-%d'),
+        )
 
         view_cols = [
             'ts_code', 'name', 'holder_name', 'status',
@@ -312,71 +363,38 @@ if selected_tab == "🔍 核心看板":
             col_chart, col_data = st.columns([2.5, 1])
 
             with col_chart:
-                k_df = load_kline_data(code)
-                pos_history = load_position_history(code, row['holder_name'])
+                range_label = st.radio("K线区间", list(KLINE_RANGES.keys()), index=list(KLINE_RANGES).index(DEFAULT_KLINE_RANGE), horizontal=True, key="kline_range", label_visibility="collapsed")
+                range_years, range_freq = KLINE_RANGES[range_label]
+                # 默认区间优先使用分析任务预计算的数据包, 其它区间实时查询
+                bundle = load_drilldown(code, row['holder_name']) if range_label == DEFAULT_KLINE_RANGE else None
+                if bundle:
+                    k_df = bundle["kline_df"]
+                    segments = bundle["segments_df"]
+                else:
+                    k_df = load_kline_data(code, range_years, range_freq)
+                    segments = position_segments(load_position_history(code, row['holder_id']))
                 
                 if not k_df.empty:
-                    # --- 1. 计算默认展示区间 (近3年) ---
-                    k_df['trade_date'] = pd.to_datetime(k_df['trade_date'])
-                    max_date = k_df['trade_date'].max()
-                    min_date_3y = max_date - pd.DateOffset(years=3)
-                    
-                    # --- 2. 计算该区间内的 Y 轴范围 ---
-                    # 只有在缩放时这一步才真正有效用于初始视图
-                    mask_3y = k_df['trade_date'] >= min_date_3y
-                    df_3y = k_df[mask_3y]
-                    if not df_3y.empty:
-                        y_min = df_3y['low'].min() * 0.95
-                        y_max = df_3y['high'].max() * 1.05
+                    # --- 1/2. 默认展示区间及其 Y 轴范围 (缓冲区只用于平移, 不参与 Y 轴计算) ---
+                    if bundle and bundle.get("view"):
+                        (min_date_view, max_date), y_range = bundle["view"]["x"], bundle["view"]["y"]
+                        y_min, y_max = y_range if y_range else (None, None)
                     else:
-                        y_min, y_max = None, None
+                        min_date_view, max_date, y_min, y_max = kline_view(k_df, range_years)
 
                     # --- 3. 绘制 K线图 ---
+                    freq_name = {"day": "日线", "week": "周线", "month": "月线"}[range_freq]
                     fig = go.Figure(data=[go.Candlestick(
                         x=k_df['trade_date'], open=k_df['open'], high=k_df['high'], low=k_df['low'], close=k_df['close'], 
-                        name="日线", increasing_line_color='#ef5350', decreasing_line_color='#26a69a'
+                        name=freq_name, increasing_line_color='#ef5350', decreasing_line_color='#26a69a'
                     )])
                     
+                    # --- 4. 添加持仓背景色 (建仓/加仓/减仓)，一次性批量写入 shapes ---
+                    fig.update_layout(shapes=segments_to_shapes(segments))
+
                     line_color = "#ef5350" if row['profit_rate_pct'] > 0 else "#26a69a"
                     fig.add_hline(y=row['est_cost'], line_dash="dash", line_color=line_color, annotation_text=f"成本: {row['est_cost']:.2f}")
 
-                    # --- 4. 添加持仓背景色 (建仓/加仓/减仓) ---
-                    if not pos_history.empty:
-                        # 转换日期格式
-                        pos_history['period_end'] = pd.to_datetime(pos_history['period_end'])
-                        pos_history = pos_history.sort_values('period_end')
-                        
-                        prev_row = None
-                        for _, p_row in pos_history.iterrows():
-                            # 确定区间: 上个报告期(或建仓日) -> 当前报告期
-                            end_dt = p_row['period_end']
-                            start_dt = prev_row['period_end'] if prev_row is not None else (p_row['first_buy_date'] if pd.notnull(p_row['first_buy_date']) else end_dt - pd.DateOffset(months=3))
-                            start_dt = pd.to_datetime(start_dt) # 确保也是 datetime
-                            
-                            # 颜色逻辑
-                            rect_color = None
-                            
-                            # 获取持股变动
-                            hold_now = p_row['hold_amount']
-                            # 如果是第一条记录，视为建仓
-                            if prev_row is None:
-                                rect_color = "rgba(52, 152, 219, 0.15)" # 🔵 建仓 - 蓝色
-                            else:
-                                hold_prev = prev_row['hold_amount']
-                                if hold_now > hold_prev:
-                                    rect_color = "rgba(231, 76, 60, 0.15)"  # 🔴 加仓 - 红色
-                                elif hold_now < hold_prev:
-                                    rect_color = "rgba(46, 204, 113, 0.15)" # 🟢 减仓 - 绿色
-                            
-                            # 绘制矩形
-                            if rect_color:
-                                fig.add_vrect(
-                                    x0=start_dt, x1=end_dt,
-                                    fillcolor=rect_color, opacity=1, layer="below", line_width=0,
-                                )
-                            
-                            prev_row = p_row
-
                     # --- 5. 更新布局 (核心: 默认 Range) ---
                     layout_update = dict(height=500) # 稍微调高一点
                     if y_min and y_max:
@@ -384,7 +402,7 @@ if selected_tab == "🔍 核心看板":
                     
                     # 设置默认 X 轴范围
                     layout_update['xaxis'] = dict(
-                        range=[min_date_3y, max_date],
+                        range=[min_date_view, max_date],
                         rangeslider=dict(visible=False), # 隐藏自带的下方滑块节省空间，或者设置为 True 看个人喜好
                         tickformat="%Y-%m-%d"
                     )
@@ -445,32 +463,34 @@ if selected_tab == "🔍 核心看板":
 
                 st.markdown("<hr>", unsafe_allow_html=True)
                 
-                tech = calculate_technical_indicators(k_df)
+                tech = bundle["indicators"] if bundle and bundle.get("indicators") else load_tech_indicators(code)
                 st.write("#### 📈 技术面")
                 if tech:
                     t1, t2 = st.columns(2)
-                    t1.metric("RSI (14)", f"{tech['RSI']:.1f}")
-                    t2.metric("乖离率", f"{tech['Bias20']:.1f}%")
+                    t1.metric("RSI (14)", safe_fmt(tech['RSI']))
+                    t2.metric("乖离率", safe_fmt(tech['Bias20'], "%"))
+                    if 'MACD' in tech:
+                        t3, t4 = st.columns(2)
+                        t3.metric("MACD 柱", safe_fmt(tech['MACD']), help=tech['Trend'])
+                        t4.metric("ATR (14)", safe_fmt(tech['ATR']), help=f"布林上轨: {safe_fmt(tech['BollUpper'])}\n布林下轨: {safe_fmt(tech['BollLower'])}")
     else: st.info("💡 暂无持仓分析数据。")
 
 elif selected_tab == "🏆 战绩排行榜":
     st.markdown("### 🏆 各大机构操盘能力排行榜")
-    if not filtered_df.empty:
+    if has_data:
         col_ctrl, col_hint = st.columns([2, 5])
         with col_ctrl: sort_metric = st.radio("📊 排序依据", ["持仓收益率", "平均收益率"], horizontal=True)
         with col_hint: st.markdown("<br>", unsafe_allow_html=True); st.info("💡 **提示**：点击页面底部的 **“详细战绩数据”** 表格行，即可查看该机构的详细持仓！")
 
-        rank_df = filtered_df.groupby('holder_name').apply(lambda x: pd.Series({
-            'avg_profit': x['profit_rate_pct'].mean(), 
-            'real_yield': (x['profit_val'].sum() / x['position_val'].sum() * 100) if x['position_val'].sum() != 0 else 0,
-            'total_val_yi': x['position_val'].sum() / 100000000,
-            'count': len(x)
-        })).reset_index()
+        # 无任何筛选时直接读取分析任务预计算的排行榜，否则对筛选结果做向量化聚合
+        is_unfiltered = not current_holders and not search_keyword and set(selected_status) == set(status_list)
+        rank_df = load_leaderboard() if is_unfiltered else pd.DataFrame()
+        if rank_df.empty:
+            rank_df = aggregate_holder_stats(load_holder_rows(filters))
         
         target_col = 'real_yield' if sort_metric == "持仓收益率" else 'avg_profit'
-        rank_df = rank_df.sort_values(target_col, ascending=True) 
-        plot_df = rank_df 
-        plot_df['color'] = plot_df[target_col].apply(lambda x: '#e53935' if x > 0 else '#43a047')
+        plot_df = rank_df.sort_values(target_col, ascending=True)
+        plot_df['color'] = np.where(plot_df[target_col] > 0, '#e53935', '#43a047')
         dynamic_height = max(600, len(plot_df) * 30 + 100)
 
         fig_bar = px.bar(plot_df, x=target_col, y='holder_name', orientation='h', text_auto='.2f', title=f"机构{sort_metric}分布 (全榜单)")
@@ -479,16 +499,7 @@ elif selected_tab == "🏆 战绩排行榜":
         st.plotly_chart(fig_bar, use_container_width=True)
 
         st.markdown("---"); st.subheader("📊 详细战绩数据")
-        clean_rank = filtered_df.groupby('holder_name').apply(lambda x: pd.Series({
-            'count': len(x),
-            'win': (x['profit_rate'] > 0).sum(),
-            'loss': (x['profit_rate'] <= 0).sum(),
-            'real_yield': (x['profit_val'].sum() / x['position_val'].sum() * 100) if x['position_val'].sum() != 0 else 0,
-            'avg_profit': x['profit_rate_pct'].mean(),
-            'total_val': x['position_val'].sum() / 100000000
-        })).reset_index()
-        clean_rank['win_loss'] = clean_rank.apply(lambda row: f"{int(row['win'])} / {int(row['loss'])}", axis=1)
-        clean_rank = clean_rank.sort_values(target_col, ascending=False)
+        clean_rank = rank_df.sort_values(target_col, ascending=False)
         
         rank_event = st.dataframe(clean_rank[['holder_name', 'count', 'win_loss', 'real_yield', 'avg_profit', 'total_val']], column_config={
             "holder_name": "机构名称 (点击跳转)", "count": st.column_config.NumberColumn("持仓数", format="%d"),
@@ -105,12 +105,12 @@ ALTER TABLE public.nt_history_cost OWNER TO quant_user;
 CREATE TABLE public.nt_market_data (
     ts_code character varying(10) NOT NULL,
     trade_date date NOT NULL,
-    open numeric(10,2),
-    high numeric(10,2),
-    low numeric(10,2),
-    close numeric(10,2),
-    vol numeric(18,2),
-    amount numeric(18,2)
+    open double precision,
+    high double precision,
+    low double precision,
+    close double precision,
+    vol double precision,
+    amount double precision
 );
 
 
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+数据库访问层 v1.0
+功能：
+1. [连接池] get_engine(workload) 每个进程、每类负载只创建一个 engine，连接池参数集中在 POOL_SETTINGS 维护。
+2. [预编译] 热点参数化查询 (季度 VWAP / 最新交易日 / 考古成本 upsert) 在每个数据库连接上只 PREPARE 一次，
+   之后只发送 EXECUTE，省去每次调用的解析与规划。
+3. [埋点] engine 统一注册 metrics 查询计时；预编译语句另按名称记录耗时 (db_prepared_seconds)；
+   原生游标的批量写入经 execute_values() 按实际语句数计入 db_queries_total。
+
+说明：预编译语句属于数据库会话，若经 pgbouncer 的 transaction 模式连接，请将 USE_PREPARED 置为 False。
+"""
+import threading
+import psycopg2.extras
+from sqlalchemy import create_engine, text
+
+import metrics
+
+# ================= 配置引用 =================
+from config import DB_URL, SHAREHOLDER_WORKERS
+
+# 负载 -> create_engine 参数
+POOL_SETTINGS = {
+    "default":   {"pool_size": 5, "max_overflow": 10},
+    "etl":       {"pool_size": SHAREHOLDER_WORKERS + 2, "max_overflow": 5},                       # 股东入库由单写入线程完成, 其余阶段抓取线程各自写库
+    "analysis":  {"pool_size": 20, "max_overflow": 0},                                             # 分析线程池 (MAX_WORKERS) + 主线程
+    "pipeline":  {"pool_size": 20, "max_overflow": 10},                                            # 各阶段并发共享
+    "dashboard": {"pool_size": 5, "max_overflow": 5, "pool_recycle": 1800, "pool_pre_ping": True},  # 常驻进程, 回收长时间空闲的连接
+}
+USE_PREPARED = True
+
+# 名称 -> (参数类型, 语句)
+PREPARED = {
+    "quarter_vwap": (
+        "text, date, date",
+        "SELECT sum(amount), sum(vol) FROM nt_market_data WHERE ts_code = $1 AND trade_date >= $2 AND trade_date <= $3",
+    ),
+    "max_trade_date": (
+        "text",
+        "SELECT max(trade_date) FROM nt_market_data WHERE ts_code = $1",
+    ),
+    "history_cost_upsert": (
+        "text, text, numeric, numeric, numeric, date",
+        """INSERT INTO nt_history_cost (ts_code, holder_name, hist_cost, total_invest, total_shares, first_buy_date, calc_date)
+           VALUES ($1, $2, $3, $4, $5, $6, NOW())
+           ON CONFLICT (ts_code, holder_name) DO UPDATE
+           SET hist_cost = EXCLUDED.hist_cost, first_buy_date = EXCLUDED.first_buy_date, calc_date = NOW()""",
+    ),
+}
+
+_engines = {}
+_lock = threading.Lock()
+
+def get_engine(workload="default"):
+    """按负载返回进程内共享的 engine (首次调用时创建)"""
+    with _lock:
+        if workload not in _engines:
+            _engines[workload] = metrics.instrument_engine(create_engine(DB_URL, **POOL_SETTINGS[workload]))
+        return _engines[workload]
+
+def _plain_sql(name):
+    """预编译语句的普通参数化版本 ($n -> :pn)，USE_PREPARED 为 False 时使用"""
+    sql = PREPARED[name][1]
+    for i in range(sql.count("$"), 0, -1):
+        sql = sql.replace(f"${i}", f":p{i}")
+    return text(sql)
+
+def execute_values(cursor, sql, values, page_size=100):
+    """psycopg2.extras.execute_values 的埋点版本：每 page_size 行一条语句，按条数计入 db_queries_total"""
+    round_trips = max(1, -(-len(values) // page_size))
+    with metrics.raw_query("INSERT", round_trips):
+        psycopg2.extras.execute_values(cursor, sql, values, page_size=page_size)
+
+def execute_prepared(conn, name, *params):
+    """
+    在 SQLAlchemy Connection 上执行预编译语句，返回结果对象
+    每个数据库连接第一次使用时 PREPARE (记录在连接的 info 中，连接重建后自动重新 PREPARE)
+    """
+    with metrics.timer("db_prepared_seconds", statement=name):
+        if not USE_PREPARED:
+            return conn.execute(_plain_sql(name), {f"p{i}": v for i, v in enumerate(params, 1)})
+        prepared = conn.info.setdefault("nt_prepared", set())
+        if name not in prepared:
+            types, sql = PREPARED[name]
+            conn.exec_driver_sql(f"PREPARE {name} ({types}) AS {sql}")
+            prepared.add(name)
+        placeholders = ", ".join(["%s"] * len(params))
+        return conn.exec_driver_sql(f"EXECUTE {name} ({placeholders})", tuple(params))
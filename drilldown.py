@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+深度扫描预计算 v1.0
+功能：
+1. [预计算] 每次持仓分析之后，为每个最新持仓 (ts_code, holder_name) 生成一份深度扫描数据包，写入 nt_drilldown_bundle (JSONB)。
+2. [内容] 默认区间 (近3年日线) 的 OHLC、默认可见区间与 Y 轴范围、建仓/加仓/减仓区间、技术指标快照、关键持仓指标。
+3. [读取] 看板打开深度扫描时按主键读取一行，不再现场查询K线/持仓历史并重算区间和指标；切换到其它区间时仍走实时查询。
+
+说明：价格保留 3 位小数，日期为 ISO 字符串；JSONB 超过约 2KB 时由数据库自动压缩 (TOAST)。
+
+用法：
+    python drilldown.py        # 按当前分析结果全量重建
+"""
+import json
+import pandas as pd
+from sqlalchemy import text
+from tqdm import tqdm
+
+import db
+import metrics
+import market_rollup
+import tech_indicators
+from chart_data import position_segments, kline_view, simple_indicators, KLINE_RANGES, DEFAULT_KLINE_RANGE, KLINE_BUFFER_MONTHS
+
+BUNDLE_TABLE = "nt_drilldown_bundle"
+BUNDLE_VERSION = 1
+
+def ensure_tables(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {BUNDLE_TABLE} (
+                ts_code character varying(10) NOT NULL,
+                holder_name character varying(255) NOT NULL,
+                bundle jsonb NOT NULL,
+                update_time timestamp without time zone DEFAULT now(),
+                PRIMARY KEY (ts_code, holder_name)
+            )
+        """))
+
+def _num(v, digits=3):
+    """float 或 None (NaN / 空值)，便于 JSON 序列化"""
+    if v is None or pd.isna(v): return None
+    return round(float(v), digits)
+
+def _date(v):
+    return None if v is None or pd.isna(v) else pd.Timestamp(v).strftime("%Y-%m-%d")
+
+# ================= 组成部分 =================
+def load_default_bars(engine, ts_code):
+    """默认区间的K线 (与看板 load_kline_data 的默认参数一致)"""
+    years, freq = KLINE_RANGES[DEFAULT_KLINE_RANGE]
+    latest = market_rollup.get_latest_trade_date(engine, ts_code)
+    if latest is None: return pd.DataFrame()
+    start = pd.Timestamp(latest) - pd.DateOffset(years=years, months=KLINE_BUFFER_MONTHS)
+    return market_rollup.load_bars(engine, ts_code, start=start, resolution=freq)
+
+def indicator_snapshot(engine, ts_code):
+    """优先读取 ETL 预计算的技术指标, 尚未生成时由近1年日线现场计算"""
+    try:
+        ind = tech_indicators.load_latest(engine, ts_code)
+    except: ind = pd.DataFrame()
+    if ind.empty or pd.isna(ind['ma60'].iloc[0]):
+        try:
+            latest = market_rollup.get_latest_trade_date(engine, ts_code)
+            if latest is None: return {}
+            start = pd.Timestamp(latest) - pd.DateOffset(years=1, months=KLINE_BUFFER_MONTHS)
+            return simple_indicators(market_rollup.load_bars(engine, ts_code, start=start, resolution="day"))
+        except: return {}
+    r = ind.iloc[0]
+    return {
+        "MA20": r['ma20'], "MA60": r['ma60'], "RSI": r['rsi14'], "Bias20": r['bias20'],
+        "Trend": "多头排列" if r['ma20'] > r['ma60'] else "空头排列",
+        "MACD": r['macd_hist'], "ATR": r['atr14'], "BollUpper": r['boll_upper'], "BollLower": r['boll_lower'],
+    }
+
+def build_bundle(bars, pos_history, position, indicators):
+    """
+    bars: 默认区间K线；pos_history: 该机构在该股的历史持仓 (nt_positions_analysis)；
+    position: 最新持仓行 (dict)；indicators: indicator_snapshot 的结果
+    """
+    years, freq = KLINE_RANGES[DEFAULT_KLINE_RANGE]
+    bundle = {"version": BUNDLE_VERSION, "range": DEFAULT_KLINE_RANGE, "kline": None, "view": None}
+    if not bars.empty:
+        bundle["kline"] = {
+            "resolution": freq,
+            "trade_date": pd.to_datetime(bars['trade_date']).dt.strftime("%Y-%m-%d").tolist(),
+            **{col: [_num(v) for v in bars[col]] for col in ["open", "high", "low", "close"]},
+        }
+        x0, x1, y0, y1 = kline_view(bars.assign(trade_date=pd.to_datetime(bars['trade_date'])), years)
+        bundle["view"] = {"x": [_date(x0), _date(x1)], "y": [_num(y0), _num(y1)] if y0 is not None else None}
+
+    segments = position_segments(pos_history)
+    bundle["segments"] = [{"start": _date(s.start), "end": _date(s.end), "action": s.action} for s in segments.itertuples(index=False)]
+    bundle["indicators"] = {k: (v if isinstance(v, str) else _num(v, 4)) for k, v in indicators.items()}
+    profit_rate = _num(position.get('profit_rate'), 6)
+    bundle["metrics"] = {
+        "est_cost": _num(position.get('est_cost')), "curr_price": _num(position.get('curr_price')),
+        "profit_rate_pct": round(profit_rate * 100, 2) if profit_rate is not None else None,
+        "hold_amount": _num(position.get('hold_amount'), 2), "first_buy_date": _date(position.get('first_buy_date')),
+        "period_end": _date(position.get('period_end')), "periods": len(pos_history),
+    }
+    return bundle
+
+# ================= 批量重建 =================
+@metrics.timed("stage_seconds", stage="drilldown")
+def refresh(engine):
+    """按最新分析结果重建全部数据包 (同一事务内替换，看板读取不受影响)，返回数据包数"""
+    ensure_tables(engine)
+    history = pd.read_sql(text("""
+        SELECT ts_code, holder_name, holder_id, period_end, hold_amount, first_buy_date, est_cost, curr_price, profit_rate, is_latest
+        FROM nt_positions_analysis ORDER BY ts_code, holder_id, period_end
+    """), engine)
+    if history.empty: return 0
+
+    rows = []
+    by_stock = dict(tuple(history.groupby('ts_code', sort=False)))
+    latest = history[history['is_latest']]
+    for ts_code, positions in tqdm(latest.groupby('ts_code', sort=False), desc="Drilldown"):
+        try:
+            bars = load_default_bars(engine, ts_code)
+            indicators = indicator_snapshot(engine, ts_code)
+        except Exception as e:
+            print(f"⚠️ [深度扫描] {ts_code}: {e}")
+            continue
+        stock_history = by_stock[ts_code]
+        for position in positions.to_dict('records'):
+            # 按 holder_id 取历史, 机构名称写法变化前后的持仓连成一条
+            pos_history = stock_history[stock_history['holder_id'] == position['holder_id']]
+            bundle = build_bundle(bars, pos_history, position, indicators)
+            rows.append((ts_code, position['holder_name'], json.dumps(bundle, ensure_ascii=False)))
+
+    raw = engine.raw_connection()
+    try:
+        with metrics.timer("db_write_seconds", table=BUNDLE_TABLE), raw.cursor() as cur:
+            with metrics.raw_query("DELETE"):
+                cur.execute(f"DELETE FROM {BUNDLE_TABLE}")
+            db.execute_values(cur, f"INSERT INTO {BUNDLE_TABLE} (ts_code, holder_name, bundle) VALUES %s", rows, page_size=500)
+        raw.commit()
+    finally:
+        raw.close()
+    metrics.inc("rows_written_total", len(rows), table=BUNDLE_TABLE)
+    return len(rows)
+
+# ================= 查询接口 =================
+def load_bundle(engine, ts_code, holder_name):
+    """按主键读取数据包；不存在或版本不符时返回 None (由调用方走实时查询)"""
+    with engine.connect() as conn:
+        bundle = conn.execute(text(f"SELECT bundle FROM {BUNDLE_TABLE} WHERE ts_code = :code AND holder_name = :holder"),
+                              {"code": ts_code, "holder": holder_name}).scalar()
+    if not bundle or bundle.get("version") != BUNDLE_VERSION: return None
+    return bundle
+
+def bundle_kline(bundle):
+    """数据包中的K线 -> DataFrame (列与 market_rollup.load_bars 一致的 trade_date/open/high/low/close)"""
+    k = bundle.get("kline")
+    if not k: return pd.DataFrame()
+    df = pd.DataFrame({col: k[col] for col in ["trade_date", "open", "high", "low", "close"]})
+    df['trade_date'] = pd.to_datetime(df['trade_date'])
+    # 价格已按 3 位小数存储, float32 足够
+    return df.astype({col: 'float32' for col in ["open", "high", "low", "close"]})
+
+def bundle_segments(bundle):
+    """数据包中的持仓区间 -> DataFrame (chart_data.segments_to_shapes 的输入)"""
+    seg = pd.DataFrame(bundle.get("segments") or [], columns=['start', 'end', 'action'])
+    seg['start'] = pd.to_datetime(seg['start'])
+    seg['end'] = pd.to_datetime(seg['end'])
+    seg['action'] = seg['action'].astype('category')
+    return seg
+
+if __name__ == "__main__":
+    engine = db.get_engine()
+    print(">>> 🔭 正在重建深度扫描数据包...")
+    n = refresh(engine)
+    print(f"✅ 深度扫描数据包已生成 {n} 个。")
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+异步采集 v1.0 (aiohttp + asyncpg，可选)
+功能：
+1. [单事件循环] 股东与日线用 aiohttp 并发请求，写库用 asyncpg 连接池，抓取与入库在同一个事件循环中重叠，不再占用线程等待数据库。
+2. [批量写入] 股东明细 executemany (已存在的跳过)；日线 copy_records_to_table 写入临时表后一次 upsert。
+3. [限速] 并发数沿用 SHAREHOLDER_WORKERS / SENSITIVE_WORKERS；日线保留与同步版一致的请求间隔和每 50 次暂停。
+4. [复用] 请求参数与解析沿用 etl_ingest.DataEngine；日线结束后同样刷新周/月线、技术指标与列式仓库。
+
+用法：
+    pip install aiohttp asyncpg
+    python etl_async.py                 # 股东 + 日线 + 基本面 (基本面仍走同步版)
+    python etl_async.py shareholders    # 只跑指定阶段 (shareholders / market / fundamentals)
+"""
+import asyncio
+import datetime
+import json
+import os
+import random
+import sys
+import time
+import traceback
+import pandas as pd
+from sqlalchemy.engine import make_url
+
+try:
+    import aiohttp
+    import asyncpg
+    HAS_ASYNC = True
+except ImportError:
+    HAS_ASYNC = False
+
+import metrics
+import db
+import market_partition
+from etl_ingest import DataEngine, send_pushplus
+
+# ================= 配置引用 =================
+from config import DB_URL, SHAREHOLDER_WORKERS, SENSITIVE_WORKERS, DATACENTER_URL, KLINE_URL
+
+REPORT_TYPES = ["RPT_F10_EH_FREEHOLDERS", "RPT_F10_EH_HOLDERS"]
+SHAREHOLDER_COLS = ["ts_code", "ann_date", "end_date", "holder_name", "hold_amount", "hold_ratio", "chg_amount", "ssf_keyword", "holder_group"]
+MARKET_COLS = ["ts_code", "trade_date", "open", "close", "high", "low", "vol", "amount"]
+FATAL_ERRORS = (aiohttp.ServerDisconnectedError, ConnectionResetError) if HAS_ASYNC else ()
+
+def asyncpg_dsn(url=DB_URL):
+    """SQLAlchemy URL (postgresql+psycopg2://...) -> asyncpg DSN"""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+class AsyncDataEngine:
+    def __init__(self, engine=None):
+        # 同步版引擎: 复用参数/解析逻辑、股票列表与日线后的派生数据刷新
+        self.sync = DataEngine(engine=engine or db.get_engine("etl"))
+        self.today = self.sync.today
+        self.pool = None
+        self.http = None
+        self.daily_count = 0
+        self.daily_resume_time = 0
+
+    async def __aenter__(self):
+        self.pool = await asyncpg.create_pool(asyncpg_dsn(), min_size=2, max_size=SHAREHOLDER_WORKERS + 2)
+        self.http = aiohttp.ClientSession(headers=dict(self.sync.session.headers), timeout=aiohttp.ClientTimeout(total=10))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.http.close()
+        await self.pool.close()
+
+    async def get_json(self, url, params):
+        """GET 并解析 JSON (东方财富部分接口返回 text/plain)，返回 (状态码, 数据)"""
+        started = time.perf_counter()
+        endpoint = metrics.endpoint_of(url)
+        try:
+            async with self.http.get(url, params=params) as res:
+                body = await res.text()
+        except Exception as e:
+            metrics.inc("http_errors_total", endpoint=endpoint, reason=type(e).__name__)
+            raise
+        metrics.inc("http_requests_total", endpoint=endpoint, status=res.status)
+        metrics.observe("http_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+        if res.status >= 400:
+            metrics.inc("http_errors_total", endpoint=endpoint, reason=f"http_{res.status}")
+            return res.status, None
+        return res.status, json.loads(body)
+
+    def fatal(self, title, code, err):
+        send_pushplus(title, f"检测到底层连接被断开 (curl 52)。\nCode: {code}\n详情: {err}")
+        print("🛑 检测到严重连接错误，正在终止程序...")
+        os._exit(1)
+
+    # --- 股东数据 ---
+    async def fetch_holders(self, code, report_type):
+        for attempt in range(3):
+            if attempt > 0:
+                await asyncio.sleep(0.5)
+                metrics.inc("http_retries_total", endpoint=metrics.endpoint_of(DATACENTER_URL))
+            try:
+                status, data = await self.get_json(DATACENTER_URL, self.sync.shareholder_params(code, report_type))
+                if status == 200:
+                    if data.get('result') and data['result'].get('data'):
+                        return pd.DataFrame(data['result']['data'])
+                    return pd.DataFrame()
+                print(f"⚠️ [股东接口] HTTP {status} | Code: {code}")
+            except Exception as e:
+                if attempt == 2:
+                    print(f"❌ [网络错误] 股东抓取失败 {code}: {e}")
+                    if isinstance(e, FATAL_ERRORS): self.fatal("股东接口连接中断", code, e)
+        return pd.DataFrame()
+
+    async def sync_one_shareholder(self, code, sem):
+        async with sem:
+            dfs = await asyncio.gather(*(self.fetch_holders(code, t) for t in REPORT_TYPES))
+        clean_df = self.sync.build_shareholder_frame(code, pd.concat(dfs))
+        if clean_df.empty: return 0
+        records = [tuple(None if pd.isna(v) else v for v in r) for r in clean_df[SHAREHOLDER_COLS].itertuples(index=False)]
+        sql = f"""
+            INSERT INTO nt_shareholders ({', '.join(SHAREHOLDER_COLS)})
+            VALUES ({', '.join(f'${i}' for i in range(1, len(SHAREHOLDER_COLS) + 1))})
+            ON CONFLICT (ts_code, holder_name, end_date) DO NOTHING
+        """
+        with metrics.timer("db_write_seconds", table="nt_shareholders"):
+            async with self.pool.acquire() as conn:
+                await conn.executemany(sql, records)
+        metrics.inc("rows_written_total", len(records), table="nt_shareholders")
+        return len(records)
+
+    @metrics.timed("stage_seconds", stage="shareholders")
+    async def run_shareholder_sync(self, stock_list=None):
+        stock_list = stock_list if stock_list is not None else self.sync.get_stock_list()
+        print(f">>> 🚀 [异步] 扫描股东数据 (并发 {SHAREHOLDER_WORKERS}, 共 {len(stock_list)} 只)...")
+        sem = asyncio.Semaphore(SHAREHOLDER_WORKERS)
+        results = await asyncio.gather(*(self.sync_one_shareholder(c, sem) for c in stock_list), return_exceptions=True)
+        count = sum(1 for r in results if isinstance(r, int) and r > 0)
+        for r in results:
+            if isinstance(r, Exception): print(f"⚠️ 股东入库失败: {r}")
+        print(f"✅ 股东扫描结束，捕获 {count} 只。")
+
+    # --- 日线 ---
+    async def throttle_daily(self):
+        """与同步版一致: 每次请求前随机等待，每 50 次整体暂停 5~15 秒"""
+        if time.time() < self.daily_resume_time:
+            await asyncio.sleep(self.daily_resume_time - time.time())
+        else:
+            self.daily_count += 1
+            if self.daily_count % 50 == 0:
+                pause_duration = random.randint(5, 15)
+                self.daily_resume_time = time.time() + pause_duration
+                print(f"😴 [日线] 已抓取 {self.daily_count} 次，触发反爬保护，暂停 {pause_duration} 秒...")
+                await asyncio.sleep(pause_duration)
+        await asyncio.sleep(random.uniform(0.5, 1.2))
+
+    async def save_daily_rows(self, ts_code, rows):
+        records = [(r["ts_code"], datetime.date.fromisoformat(r["trade_date"]), r["open"], r["close"], r["high"], r["low"], r["vol"], r["amount"]) for r in rows]
+        with metrics.timer("db_write_seconds", table="nt_market_data"):
+            async with self.pool.acquire() as conn, conn.transaction():
+                await conn.execute("CREATE TEMP TABLE IF NOT EXISTS tmp_market_rows (LIKE nt_market_data) ON COMMIT DELETE ROWS")
+                await conn.copy_records_to_table("tmp_market_rows", records=records, columns=MARKET_COLS)
+                await conn.execute(f"""
+                    INSERT INTO nt_market_data ({', '.join(MARKET_COLS)})
+                    SELECT {', '.join(MARKET_COLS)} FROM tmp_market_rows
+                    ON CONFLICT (ts_code, trade_date) DO UPDATE SET
+                        open = EXCLUDED.open, close = EXCLUDED.close, high = EXCLUDED.high,
+                        low = EXCLUDED.low, vol = EXCLUDED.vol, amount = EXCLUDED.amount
+                """)
+        metrics.inc("rows_written_total", len(records), table="nt_market_data")
+        with self.sync.lock:
+            self.sync.touched_market[ts_code] = min(r[1] for r in records)
+
+    async def sync_one_daily(self, ts_code, last_date, sem):
+        start_date = (last_date + datetime.timedelta(days=1)).strftime("%Y%m%d") if last_date else "20060101"
+        if start_date > self.today: return
+        async with sem:
+            await self.throttle_daily()
+            try:
+                status, data = await self.get_json(KLINE_URL, self.sync.kline_params(ts_code, start_date, self.today))
+            except Exception as e:
+                metrics.inc("market_sync_errors_total", reason=type(e).__name__)
+                print(f"❌ [连接中断] 日线同步出错 {ts_code}: {e}")
+                if isinstance(e, FATAL_ERRORS) and self.sync.check_alert("daily_conn_err"): self.fatal("日线连接中断", ts_code, e)
+                return
+        if status != 200:
+            print(f"🚨 [日线接口] HTTP {status} | Code: {ts_code}")
+            if self.sync.check_alert("daily_block"):
+                send_pushplus("日线接口被封", f"状态码异常。\n详情: HTTP {status} | Code: {ts_code}")
+            return
+        if not (data.get('data') and data['data'].get('klines')): return
+        rows = self.sync.parse_klines(ts_code, data['data']['klines'])
+        if rows: await self.save_daily_rows(ts_code, rows)
+
+    @metrics.timed("stage_seconds", stage="market")
+    async def run_market_data_sync(self, stock_list=None):
+        async with self.pool.acquire() as conn:
+            if stock_list is None:
+                stock_list = [r[0] for r in await conn.fetch("SELECT DISTINCT ts_code FROM nt_shareholders")]
+            # 一次查询所有股票的最新交易日 (同步版为每只股票一次查询)
+            last = dict(await conn.fetch(
+                "SELECT ts_code, max(trade_date) FROM nt_market_data WHERE ts_code = ANY($1::text[]) GROUP BY ts_code", stock_list))
+        today = datetime.datetime.strptime(self.today, "%Y%m%d").date()
+        pending = [c for c in stock_list if not last.get(c) or last[c] < today]
+        if len(pending) < len(stock_list):
+            print(f"⏩ 已跳过 {len(stock_list) - len(pending)} 只今日已更新的股票，剩余 {len(pending)} 只待处理。")
+        if not pending:
+            print("✅ 所有目标股票今日数据均已存在，无需更新。")
+            return
+        print(f">>> 🛡️ [异步] 同步日线数据 (并发 {SENSITIVE_WORKERS})...")
+        try:
+            # 分区表: 提前建好今年/明年的年度分区 (未分区时无操作)，否则新数据会落入默认分区
+            await asyncio.to_thread(market_partition.ensure_partitions, self.sync.engine)
+        except Exception as e:
+            print(f"⚠️ 分区检查失败: {e}")
+        sem = asyncio.Semaphore(SENSITIVE_WORKERS)
+        results = await asyncio.gather(*(self.sync_one_daily(c, last.get(c), sem) for c in pending), return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception): print(f"⚠️ 日线入库失败: {r}")
+        await asyncio.to_thread(self.sync.refresh_derived_data)
+
+async def main(stages):
+    async with AsyncDataEngine() as engine:
+        if "shareholders" in stages: await engine.run_shareholder_sync()
+        if "market" in stages: await engine.run_market_data_sync()
+        if "fundamentals" in stages: await asyncio.to_thread(engine.sync.run_fundamentals_sync)
+        return engine.sync.engine
+
+if __name__ == "__main__":
+    if not HAS_ASYNC:
+        sys.exit("❌ 未安装异步依赖：pip install aiohttp asyncpg")
+    stages = sys.argv[1:] or ["shareholders", "market", "fundamentals"]
+    start_time = datetime.datetime.now()
+    try:
+        engine = asyncio.run(main(stages))
+        metrics.finish_run(engine, "etl_async", start_time)
+        send_pushplus("任务完成", f"异步 ETL 任务已成功执行完毕。\n耗时: {datetime.datetime.now() - start_time}")
+    except Exception as e:
+        print(traceback.format_exc())
+        metrics.finish_run(db.get_engine("etl"), "etl_async", start_time, "failed", str(e))
+        send_pushplus("任务崩溃", f"异步 ETL 发生严重错误，已停止。\n\n{str(e)}")
+        os._exit(1)
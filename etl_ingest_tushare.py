@@ -9,7 +9,7 @@
 
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import datetime
 import logging
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -22,15 +22,28 @@ import os
 import json
 import re
 import traceback
-import psycopg2.extras
+import market_rollup
+import market_store
+import market_partition
+import tech_indicators
+import metrics
+import holder_match
+from batch_writer import BatchWriter
+import db
 import tushare as ts
 
 # ================= 配置引用 =================
-from config import DB_URL, SSF_KEYWORDS, PUSHPLUS_TOKEN, TUSHARE_TOKEN, SHAREHOLDER_WORKERS, SENSITIVE_WORKERS
+from config import PUSHPLUS_TOKEN, TUSHARE_TOKEN, SHAREHOLDER_WORKERS, SENSITIVE_WORKERS, DATACENTER_URL, QUOTE_URL, TUSHARE_API_URL
 pro = ts.pro_api(TUSHARE_TOKEN)
+if TUSHARE_API_URL:
+    # tushare 未提供公开的地址配置项，只能覆盖 DataApi 的私有属性
+    pro._DataApi__http_url = TUSHARE_API_URL
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
+SHAREHOLDER_COLS = ["ts_code", "ann_date", "end_date", "holder_name", "hold_amount", "hold_ratio", "chg_amount", "ssf_keyword", "holder_group"]
+SHAREHOLDER_CONFLICT = "ON CONFLICT (ts_code, holder_name, end_date) DO NOTHING"
+
 def send_pushplus(title, content):
     """发送 PushPlus 通知"""
     if not PUSHPLUS_TOKEN or "YOUR_" in PUSHPLUS_TOKEN: return
@@ -40,14 +53,16 @@ def send_pushplus(title, content):
     except: pass
 
 class DataEngine:
-    def __init__(self):
-        self.engine = create_engine(DB_URL)
+    def __init__(self, engine=None):
+        self.engine = engine or db.get_engine("etl")
         self.session = requests.Session()
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Referer": "https://data.eastmoney.com/",
             "Connection": "keep-alive"
         })
+        metrics.instrument_engine(self.engine)
+        metrics.instrument_session(self.session)
         self.today = datetime.datetime.now().strftime("%Y%m%d")
         self.alert_cache = {} 
         
@@ -57,6 +72,8 @@ class DataEngine:
         self.daily_resume_time = 0
         self.fund_count = 0
         self.fund_resume_time = 0 
+        self.shareholder_writer = None  # 股东扫描期间的单写入线程 (run_shareholder_sync 内创建)
+        self.touched_market = {}  # {ts_code: 本次写入的最早交易日}，供周/月线增量汇总使用
 
     def check_alert(self, error_type):
         """防止同一分钟内发送大量重复报警"""
@@ -94,7 +111,7 @@ class DataEngine:
 
     # --- 模块1: 股东数据 (极速) ---
     def fetch_eastmoney_api_safe(self, code, report_type):
-        url = "https://datacenter.eastmoney.com/securities/api/data/get"
+        url = DATACENTER_URL
         secucode = self.get_secucode(code)
         params = {
             "type": report_type,
@@ -106,7 +123,9 @@ class DataEngine:
         }
         
         for attempt in range(3):
-            if attempt > 0: time.sleep(0.5)
+            if attempt > 0:
+                time.sleep(0.5)
+                metrics.inc("http_retries_total", endpoint=metrics.endpoint_of(url))
             try:
                 res = self.session.get(url, params=params, timeout=10)
                 if res.status_code == 200:
@@ -136,7 +155,7 @@ class DataEngine:
         if df.empty: return 0
         
         df = df.drop_duplicates(subset=['END_DATE', 'HOLDER_NAME'])
-        mask = df['HOLDER_NAME'].apply(lambda x: any(k in str(x) for k in SSF_KEYWORDS))
+        mask = holder_match.is_target(df['HOLDER_NAME'])
         target_df = df[mask].copy().reset_index(drop=True)
         if target_df.empty: return 0
 
@@ -152,18 +171,26 @@ class DataEngine:
             try: return float(x) / 10000
             except: return 0
         clean_df['chg_amount'] = target_df['HOLD_NUM_CHANGE'].apply(parse_chg)
+        holder_match.tag_frame(clean_df)
 
         try:
-            data_list = clean_df.to_dict(orient='records')
-            cols = list(data_list[0].keys())
-            values_str = ", ".join([f":{c}" for c in cols])
-            sql = text(f"INSERT INTO nt_shareholders ({','.join(cols)}) VALUES ({values_str}) ON CONFLICT (ts_code, holder_name, end_date) DO NOTHING")
-            with self.engine.connect() as conn:
-                conn.execute(sql, data_list)
-                conn.commit()
-            return len(clean_df)
+            if self.shareholder_writer is not None:
+                return self.shareholder_writer.put(clean_df)
+            return self.save_shareholders(clean_df)
         except: return 0
 
+    def save_shareholders(self, clean_df):
+        """写入股东明细 (ts_code + holder_name + end_date 已存在的跳过)，返回提交的行数"""
+        data_list = clean_df.to_dict(orient='records')
+        cols = list(data_list[0].keys())
+        values_str = ", ".join([f":{c}" for c in cols])
+        sql = text(f"INSERT INTO nt_shareholders ({','.join(cols)}) VALUES ({values_str}) ON CONFLICT (ts_code, holder_name, end_date) DO NOTHING")
+        with metrics.timer("db_write_seconds", table="nt_shareholders"), self.engine.connect() as conn:
+            conn.execute(sql, data_list)
+            conn.commit()
+        metrics.inc("rows_written_total", len(clean_df), table="nt_shareholders")
+        return len(clean_df)
+
     # --- 模块2: 日线数据 (Tushare 高速版) ---
     def fetch_and_save_daily_data(self, ts_code):
         try:
@@ -171,9 +198,8 @@ class DataEngine:
             start_date = "20060101"
             try:
                 # 查询该股票在数据库中的最新日期
-                max_date_sql = text("SELECT max(trade_date) FROM nt_market_data WHERE ts_code = :code")
                 with self.engine.connect() as conn:
-                    result = conn.execute(max_date_sql, {"code": ts_code}).scalar()
+                    result = db.execute_prepared(conn, "max_trade_date", ts_code).scalar()
                 
                 if result:
                     # 如果有数据，从最新日期的下一天开始抓
@@ -192,14 +218,16 @@ class DataEngine:
             tushare_code = self.get_secucode(ts_code)
             
             try:
-                df = pro.daily(**{
-                    "ts_code": tushare_code,
-                    "start_date": start_date,
-                    "end_date": end_date
-                }, fields=[
-                    "ts_code", "trade_date", "open", "high", "low", "close", "vol", "amount"
-                ])
+                with metrics.timer("tushare_call_seconds", api="daily"):
+                    df = pro.daily(**{
+                        "ts_code": tushare_code,
+                        "start_date": start_date,
+                        "end_date": end_date
+                    }, fields=[
+                        "ts_code", "trade_date", "open", "high", "low", "close", "vol", "amount"
+                    ])
             except Exception as e:
+                metrics.inc("tushare_errors_total", api="daily")
                 print(f"⚠️ [Tushare报错] {ts_code}: {e}")
                 time.sleep(1) # 稍微休息一下避免触发 Tushare 频率限制（如果有的话）
                 return
@@ -226,30 +254,38 @@ class DataEngine:
             rows = df.to_dict(orient='records')
             
             if rows:
-                # 🚀 [优化] 使用 execute_values 进行批量插入
-                cols = ["ts_code", "trade_date", "open", "close", "high", "low", "vol", "amount"]
-                values = [[row[c] for c in cols] for row in rows]
-                
-                insert_sql = """
-                    INSERT INTO nt_market_data (ts_code, trade_date, open, close, high, low, vol, amount)
-                    VALUES %s
-                    ON CONFLICT (ts_code, trade_date) DO UPDATE SET
-                        open = EXCLUDED.open,
-                        close = EXCLUDED.close,
-                        high = EXCLUDED.high,
-                        low = EXCLUDED.low,
-                        vol = EXCLUDED.vol,
-                        amount = EXCLUDED.amount
-                """
-                
-                with self.engine.connect() as conn:
-                    cursor = conn.connection.cursor()
-                    psycopg2.extras.execute_values(cursor, insert_sql, values)
-                    conn.connection.commit()
+                self.save_daily_rows(ts_code, rows)
                     
         except Exception as e:
+            metrics.inc("market_sync_errors_total", reason=type(e).__name__)
             print(f"❌ [同步错误] {ts_code}: {e}")
 
+    def save_daily_rows(self, ts_code, rows):
+        """批量 upsert 日线，并登记本次写入的最早交易日 (供周/月线与技术指标增量刷新)"""
+        # 🚀 [优化] 使用 execute_values 进行批量插入
+        cols = ["ts_code", "trade_date", "open", "close", "high", "low", "vol", "amount"]
+        values = [[row[c] for c in cols] for row in rows]
+
+        insert_sql = """
+            INSERT INTO nt_market_data (ts_code, trade_date, open, close, high, low, vol, amount)
+            VALUES %s
+            ON CONFLICT (ts_code, trade_date) DO UPDATE SET
+                open = EXCLUDED.open,
+                close = EXCLUDED.close,
+                high = EXCLUDED.high,
+                low = EXCLUDED.low,
+                vol = EXCLUDED.vol,
+                amount = EXCLUDED.amount
+        """
+
+        with metrics.timer("db_write_seconds", table="nt_market_data"), self.engine.connect() as conn:
+            cursor = conn.connection.cursor()
+            db.execute_values(cursor, insert_sql, values)
+            conn.connection.commit()
+        metrics.inc("rows_written_total", len(values), table="nt_market_data")
+        with self.lock:
+            self.touched_market[ts_code] = min(row['trade_date'] for row in rows)
+
     # --- 模块3: 基本面 (慢速+报警) ---
     def fetch_combined_data(self, ts_code):
         # --- 🛑 速率限制逻辑 (基本面) ---
@@ -269,7 +305,7 @@ class DataEngine:
             time.sleep(sleep_needed)
         # ---------------------------
 
-        url = "http://push2.eastmoney.com/api/qt/stock/get"
+        url = QUOTE_URL
         params = {
             "invt": "2", "fltt": "2",
             "fields": "f43,f57,f58,f162,f164,f167,f170,f163,f116,f173,f183,f184,f185,f186,f187", 
@@ -283,7 +319,7 @@ class DataEngine:
 
         try:
             time.sleep(random.uniform(0.3, 0.8))
-            res = requests.get(url, params=params, headers=self.session.headers, timeout=5)
+            res = requests.get(url, params=params, headers=self.session.headers, timeout=5, hooks={"response": metrics.http_response_hook})
             
             if res.status_code != 200:
                 msg = f"HTTP {res.status_code} | Code: {ts_code}"
@@ -317,6 +353,7 @@ class DataEngine:
                     if data['curr_price'] and data['pe_ttm']: 
                         data['eps'] = round(data['curr_price'] / data['pe_ttm'], 2)
         except Exception as e:
+            metrics.inc("http_errors_total", endpoint=metrics.endpoint_of(url), reason=type(e).__name__)
             # 🟢 [修复] 同样改为打印
             print(f"❌ [连接中断] 基本面同步出错 {ts_code}: {e}")
             if self.check_alert("fundamental_conn_err"):
@@ -326,21 +363,37 @@ class DataEngine:
         return data
 
     # --- 执行入口 ---
+    @metrics.timed("stage_seconds", stage="shareholders")
     def run_shareholder_sync(self):
         print(f">>> 🚀 [1/3] 扫描股东数据 (极速: {SHAREHOLDER_WORKERS}线程)...")
         stock_list = self.get_stock_list()
         count = 0
-        with ThreadPoolExecutor(max_workers=SHAREHOLDER_WORKERS) as executor:
-            future_to_code = {executor.submit(self.fetch_and_save_shareholders, code): code for code in stock_list}
-            for future in tqdm(as_completed(future_to_code), total=len(stock_list)):
-                try:
-                    found = future.result()
-                    if found > 0: count += 1
-                except: pass
+        # 抓取线程只负责请求与解析，入库统一交给一个写入线程按批提交
+        self.shareholder_writer = BatchWriter(self.engine, "nt_shareholders", SHAREHOLDER_COLS, SHAREHOLDER_CONFLICT).start()
+        try:
+            with ThreadPoolExecutor(max_workers=SHAREHOLDER_WORKERS) as executor:
+                future_to_code = {executor.submit(self.fetch_and_save_shareholders, code): code for code in stock_list}
+                for done, future in enumerate(tqdm(as_completed(future_to_code), total=len(stock_list)), 1):
+                    metrics.set_gauge("queue_depth", len(stock_list) - done, queue="shareholders")
+                    try:
+                        found = future.result()
+                        if found > 0: count += 1
+                    except: pass
+        finally:
+            writer, self.shareholder_writer = self.shareholder_writer, None
+            report = writer.close()
         print(f"✅ 股东扫描结束，捕获 {count} 只。")
+        if report["dropped"]:
+            send_pushplus("股东数据写入失败", f"{report['dropped']} 行未能入库。\n明细: {report['dropped_file']}")
 
+    @metrics.timed("stage_seconds", stage="market")
     def run_market_data_sync(self):
         print(f">>> 🛡️ [2/3] 同步日线数据 (安全: {SENSITIVE_WORKERS}线程)...")
+        try:
+            # 分区表: 提前建好今年/明年的年度分区 (未分区时无操作)
+            market_partition.ensure_partitions(self.engine)
+        except Exception as e:
+            print(f"⚠️ 分区检查失败: {e}")
         try:
             target_stocks = pd.read_sql("SELECT DISTINCT ts_code FROM nt_shareholders", self.engine)
             stock_list = target_stocks['ts_code'].tolist()
@@ -369,8 +422,33 @@ class DataEngine:
         
         with ThreadPoolExecutor(max_workers=SENSITIVE_WORKERS) as executor:
             futures = {executor.submit(self.fetch_and_save_daily_data, code): code for code in stock_list}
-            for _ in tqdm(as_completed(futures), total=len(stock_list)): pass
+            for done, _ in enumerate(tqdm(as_completed(futures), total=len(stock_list)), 1):
+                metrics.set_gauge("queue_depth", len(stock_list) - done, queue="market")
+
+        self.refresh_derived_data()
+
+    @metrics.timed("stage_seconds", stage="derived")
+    def refresh_derived_data(self):
+        """日线入库后增量刷新周线/月线汇总表、技术指标与列式日线仓库"""
+        if not self.touched_market: return
+        try:
+            n = market_rollup.refresh(self.engine, self.touched_market)
+            print(f"📦 周线/月线汇总已刷新 ({len(self.touched_market)} 只股票, {n} 行)。")
+        except Exception as e:
+            print(f"⚠️ 周线/月线汇总刷新失败: {e}")
+        try:
+            n = tech_indicators.refresh(self.engine, self.touched_market)
+            print(f"📈 技术指标已更新，共 {n} 行。")
+        except Exception as e:
+            print(f"⚠️ 技术指标计算失败: {e}")
+        if market_store.enabled():
+            try:
+                n = market_store.refresh(self.engine, self.touched_market)
+                print(f"🗄️ 列式日线仓库已同步，共 {n} 行。")
+            except Exception as e:
+                print(f"⚠️ 列式日线仓库同步失败: {e}")
 
+    @metrics.timed("stage_seconds", stage="fundamentals")
     def run_fundamentals_sync(self):
         print(f">>> 🛡️ [3/3] 同步基本面数据 (安全: {SENSITIVE_WORKERS}线程)...")
         try:
@@ -404,7 +482,8 @@ class DataEngine:
         final_data_list = []
         with ThreadPoolExecutor(max_workers=SENSITIVE_WORKERS) as executor:
             future_to_code = {executor.submit(self.fetch_combined_data, code): code for code in stock_list}
-            for future in tqdm(as_completed(future_to_code), total=len(stock_list)):
+            for done, future in enumerate(tqdm(as_completed(future_to_code), total=len(stock_list)), 1):
+                metrics.set_gauge("queue_depth", len(stock_list) - done, queue="fundamentals")
                 res = future.result()
                 if 'curr_price' in res and res['curr_price']: 
                     res['update_date'] = self.today  # ✅ 增加更新日期
@@ -416,9 +495,10 @@ class DataEngine:
             values_str = ", ".join([f":{c}" for c in cols])
             update_set = ", ".join([f"{c} = EXCLUDED.{c}" for c in cols if c != 'ts_code'])
             sql = text(f"INSERT INTO nt_stock_fundamentals ({','.join(cols)}) VALUES ({values_str}) ON CONFLICT (ts_code) DO UPDATE SET {update_set}")
-            with self.engine.connect() as conn:
+            with metrics.timer("db_write_seconds", table="nt_stock_fundamentals"), self.engine.connect() as conn:
                 conn.execute(sql, df.to_dict(orient='records'))
                 conn.commit()
+            metrics.inc("rows_written_total", len(df), table="nt_stock_fundamentals")
             print(f"🎉 基本面更新完成，共 {len(df)} 条。")
 
 if __name__ == "__main__":
@@ -433,11 +513,13 @@ if __name__ == "__main__":
         engine.run_market_data_sync()
         engine.run_fundamentals_sync()
         
+        metrics.finish_run(engine.engine, "etl_ingest_tushare", start_time)
         duration = datetime.datetime.now() - start_time
         send_pushplus("任务完成", f"ETL 任务已成功执行完毕。\n耗时: {duration}")
         
     except Exception as e:
         err_msg = traceback.format_exc()
         print(err_msg)
+        metrics.finish_run(db.get_engine("etl"), "etl_ingest_tushare", start_time, "failed", str(e))
         send_pushplus("任务崩溃", f"脚本发生严重错误，已停止。\n\n{str(e)}")
         os._exit(1)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+大结果集快速读取 v1.0 (COPY ... TO STDOUT)
+功能：
+1. [COPY] 查询结果以 COPY (FORMAT csv) 一次性流式导出，不再由 psycopg2 逐格创建 Python 对象。
+2. [列式解析] 安装了 pyarrow 时用其多线程 CSV 解析器直接生成列式数据，否则使用 pandas 的 C 解析器。
+3. [类型对齐] 按查询结果的列类型 (pg OID) 指定解析类型：数值 -> float64/int64，date -> datetime.date，
+   timestamp -> datetime64，布尔 -> bool，与 pd.read_sql 的结果保持一致 (numeric 直接为 float64 而非 Decimal)。
+4. [可选依赖] 未安装 pyarrow 时退回 pandas 解析，结果相同 (空字符串与 NULL 均为 None)。
+
+提供热点查询的替换函数：
+    load_latest_positions(engine)       看板最新持仓 (物化视图)
+    load_analysis_shareholders(engine)  持仓分析的股东明细关联
+    load_market_data(engine, ts_code)   考古用的单股全部日线
+"""
+import io
+import pandas as pd
+
+import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+# ================= 查询 =================
+LATEST_POSITIONS_SQL = "SELECT * FROM mv_nt_latest_positions"
+ANALYSIS_SHAREHOLDERS_SQL = """
+    SELECT s.id, s.ts_code, s.ann_date, s.end_date, s.holder_id, h.holder_name,
+           s.hold_amount, s.hold_ratio, s.chg_amount, b.name
+    FROM nt_shareholders s
+    JOIN nt_holders h ON h.holder_id = s.holder_id
+    LEFT JOIN stock_basic b ON s.ts_code = b.ts_code
+    WHERE s.ann_date > '2022-01-01' ORDER BY s.ts_code, s.holder_id, s.end_date
+"""
+MARKET_DATA_SQL = "SELECT trade_date, amount, vol FROM nt_market_data WHERE ts_code = %(code)s ORDER BY trade_date"
+
+# pg 类型 OID -> 解析类型
+INT_OIDS = {20, 21, 23}                # int8 / int2 / int4
+FLOAT_OIDS = {700, 701, 1700}          # float4 / float8 / numeric
+BOOL_OIDS = {16}
+DATE_OIDS = {1082}
+TIMESTAMP_OIDS = {1114}                # timestamp without time zone
+TIMESTAMPTZ_OIDS = {1184}
+
+def _column_types(cursor, sql):
+    cursor.execute(f"SELECT * FROM ({sql}) t LIMIT 0")
+    return [(d.name, d.type_code) for d in cursor.description]
+
+def _parse_arrow(buf, columns):
+    types = {}
+    for name, oid in columns:
+        if oid in INT_OIDS: types[name] = pa.int64()
+        elif oid in FLOAT_OIDS: types[name] = pa.float64()
+        elif oid in BOOL_OIDS: types[name] = pa.bool_()
+        elif oid in DATE_OIDS: types[name] = pa.date32()
+        elif oid in TIMESTAMP_OIDS: types[name] = pa.timestamp("us")
+        else: types[name] = pa.string()  # timestamptz 等其它类型先按字符串读取，再由 pandas 转换
+    table = pa_csv.read_csv(
+        buf,
+        read_options=pa_csv.ReadOptions(column_names=[n for n, _ in columns], skip_rows=1),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=types, true_values=["t"], false_values=["f"],
+            strings_can_be_null=True, quoted_strings_can_be_null=False,  # 未加引号的空值为 NULL, "" 为空字符串
+        ),
+    )
+    df = table.to_pandas(date_as_object=True)
+    for name, oid in columns:
+        if oid in TIMESTAMP_OIDS: df[name] = df[name].astype("datetime64[ns]")
+    return df
+
+def _parse_pandas(buf, columns):
+    dtypes, dates, stamps = {}, [], []
+    for name, oid in columns:
+        if oid in FLOAT_OIDS: dtypes[name] = "float64"
+        elif oid in DATE_OIDS: dates.append(name)
+        elif oid in TIMESTAMP_OIDS: stamps.append(name)
+        elif oid not in INT_OIDS | BOOL_OIDS: dtypes[name] = "object"
+    df = pd.read_csv(buf, dtype=dtypes, keep_default_na=False, na_values=[""], true_values=["t"], false_values=["f"])
+    for name, dtype in dtypes.items():
+        if dtype == "object": df[name] = df[name].where(df[name].notna(), None)
+    for name in dates:
+        df[name] = pd.to_datetime(df[name]).dt.date
+    for name in stamps:
+        df[name] = pd.to_datetime(df[name])
+    return df
+
+def read_frame(engine, sql, params=None):
+    """
+    pd.read_sql 的替换：sql 为 psycopg2 风格参数 (%(name)s) 的 SELECT 语句
+    参数在客户端由 cursor.mogrify 安全地内联 (COPY 不支持绑定参数)
+    """
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            sql = cur.mogrify(sql, params).decode() if params else sql
+            with metrics.raw_query("SELECT"):
+                columns = _column_types(cur, sql)
+            buf = io.BytesIO()
+            with metrics.raw_query("COPY"):
+                cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf)
+        raw.commit()
+    finally:
+        raw.close()
+
+    buf.seek(0)
+    df = _parse_arrow(buf, columns) if HAS_ARROW else _parse_pandas(buf, columns)
+    for name, oid in columns:
+        if oid in TIMESTAMPTZ_OIDS: df[name] = pd.to_datetime(df[name], utc=True)
+    return df
+
+# ================= 热点查询 =================
+def load_latest_positions(engine):
+    return read_frame(engine, LATEST_POSITIONS_SQL)
+
+def load_analysis_shareholders(engine):
+    return read_frame(engine, ANALYSIS_SHAREHOLDERS_SQL)
+
+def load_market_data(engine, ts_code):
+    return read_frame(engine, MARKET_DATA_SQL, {"code": ts_code})
@@ -10,13 +10,15 @@ import datetime
 import logging
 import os
 import time
-from sqlalchemy import create_engine, text
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from tqdm import tqdm
+import metrics
+import db
+import holder_match
 
 # ================= 配置引用 =================
-from config import DB_URL, SSF_KEYWORDS, PUSHPLUS_TOKEN
+from config import PUSHPLUS_TOKEN, DATACENTER_URL, KLINE_URL
 
 def send_pushplus(title, content):
     """发送 PushPlus 通知"""
@@ -32,8 +34,8 @@ logging.basicConfig(level=logging.INFO, handlers=[logging.FileHandler(os.path.jo
 logger = logging.getLogger("AutoFixer")
 
 class AutoFixer:
-    def __init__(self):
-        self.engine = create_engine(DB_URL)
+    def __init__(self, engine=None):
+        self.engine = engine or db.get_engine("etl")
         self.session = requests.Session()
         retries = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
         self.session.mount('http://', HTTPAdapter(max_retries=retries))
@@ -41,6 +43,8 @@ class AutoFixer:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
             "Referer": "https://data.eastmoney.com/"
         })
+        metrics.instrument_engine(self.engine)
+        metrics.instrument_session(self.session)
 
     def get_secid(self, code):
         return f"1.{code}" if str(code).startswith('6') else f"0.{code}"
@@ -64,7 +68,7 @@ class AutoFixer:
     def get_kline_vwap_api(self, secid, start_date, end_date):
         s_str = start_date.replace("-", "")
         e_str = end_date.replace("-", "")
-        url = "http://push2his.eastmoney.com/api/qt/stock/kline/get"
+        url = KLINE_URL
         params = {"secid": secid, "klt": "101", "fqt": "1", "lmt": "1000", "beg": s_str, "end": e_str, "fields1": "f1", "fields2": "f51,f56,f57"}
         try:
             res = self.session.get(url, params=params, timeout=5)
@@ -114,7 +118,7 @@ class AutoFixer:
         # 🟢 使用修复后的逻辑
         secucode = self.get_secucode(ts_code)
         
-        url = "https://datacenter.eastmoney.com/securities/api/data/get"
+        url = DATACENTER_URL
         dfs = []
         for rpt in ["RPT_F10_EH_HOLDERS", "RPT_F10_EH_FREEHOLDERS"]:
             try:
@@ -126,7 +130,7 @@ class AutoFixer:
         if not dfs: return 0
         
         df_all = pd.concat(dfs).drop_duplicates(subset=['END_DATE', 'HOLDER_NAME'])
-        mask = df_all['HOLDER_NAME'].apply(lambda x: any(k in str(x) for k in SSF_KEYWORDS))
+        mask = holder_match.is_target(df_all['HOLDER_NAME'])
         nt_df = df_all[mask].copy()
         
         fixed_count = 0
@@ -139,19 +143,15 @@ class AutoFixer:
                     t_invest = float(t_invest)
                     t_shares = int(t_shares)
 
-                    sql = text("""
-                        INSERT INTO nt_history_cost (ts_code, holder_name, hist_cost, total_invest, total_shares, first_buy_date, calc_date)
-                        VALUES (:c, :h, :cost, :inv, :sh, :fd, NOW())
-                        ON CONFLICT (ts_code, holder_name) DO UPDATE 
-                        SET hist_cost = EXCLUDED.hist_cost, first_buy_date = EXCLUDED.first_buy_date, calc_date = NOW();
-                    """)
-                    with self.engine.connect() as conn:
-                        conn.execute(sql, {"c": ts_code, "h": holder_name, "cost": cost, "inv": t_invest, "sh": t_shares, "fd": f_date})
+                    with metrics.timer("db_write_seconds", table="nt_history_cost"), self.engine.connect() as conn:
+                        db.execute_prepared(conn, "history_cost_upsert", ts_code, holder_name, cost, t_invest, t_shares, f_date)
                         conn.commit()
+                    metrics.inc("rows_written_total", table="nt_history_cost")
                     fixed_count += 1
                 except: pass
         return fixed_count
 
+    @metrics.timed("stage_seconds", stage="fix")
     def run(self):
         targets = self.detect_problems()
         if not targets:
@@ -167,7 +167,9 @@ class AutoFixer:
 if __name__ == "__main__":
     start_time = datetime.datetime.now()
     try:
-        AutoFixer().run()
+        fixer = AutoFixer()
+        fixer.run()
+        metrics.finish_run(fixer.engine, "fix_stock", start_time)
         
         duration = datetime.datetime.now() - start_time
         send_pushplus("修复任务完成", f"自动化修复任务已成功执行完毕。\n耗时: {duration}")
@@ -178,5 +180,6 @@ if __name__ == "__main__":
         err_msg = traceback.format_exc()
         logger.error(err_msg)
         print(err_msg)
+        metrics.finish_run(db.get_engine("etl"), "fix_stock", start_time, "failed", str(e))
         send_pushplus("修复任务崩溃", f"脚本发生严重错误，已停止。\n\n{str(e)}")
         sys.exit(1)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+机构股东识别与分组 v1.0
+功能：
+1. [预编译] SSF_KEYWORDS 合并为一条正则 (长关键词在前)，经 Series.str.contains / str.extract 一次过滤整列，
+   替代逐行 any(k in x for k in SSF_KEYWORDS) 的 Python 循环。
+2. [分组] TAG_GROUPS 的通配符合并为一条带命名分组的正则，按机构名称 (去重后) 求所属分组。
+3. [入库打标] tag_frame() 为股东明细补充 ssf_keyword / holder_group 两列，采集时写入 nt_shareholders，
+   看板直接按 holder_group 筛选，不再逐个 fnmatch。
+
+用法：
+    python holder_match.py backfill   # 修改 TAG_GROUPS / SSF_KEYWORDS 后，为已入库的股东重新打标
+"""
+import fnmatch
+import re
+import sys
+from functools import lru_cache
+import pandas as pd
+from sqlalchemy import text
+
+# ================= 配置引用 =================
+from config import SSF_KEYWORDS, TAG_GROUPS
+
+# 长关键词优先: "全国社保基金..." 命中 "全国社保" 而不是 "社保"
+KEYWORD_RE = re.compile("|".join(re.escape(k) for k in sorted(set(SSF_KEYWORDS), key=len, reverse=True)))
+
+# 分组正则: (?P<g0>模式1|模式2)|(?P<g1>...)，命中的分组名 g<i> 对应 GROUP_NAMES[i]
+GROUP_NAMES = list(TAG_GROUPS.keys())
+GROUP_RE = re.compile("|".join(
+    f"(?P<g{i}>{'|'.join(fnmatch.translate(p) for p in patterns)})"
+    for i, patterns in enumerate(TAG_GROUPS.values()) if patterns
+))
+
+def is_target(names):
+    """名称中含任一关键词 -> True (names 为 Series)"""
+    return names.astype(str).str.contains(KEYWORD_RE, na=False)
+
+def keyword_of(names):
+    """返回每个名称命中的关键词 (未命中为 NaN)"""
+    return names.astype(str).str.extract(f"({KEYWORD_RE.pattern})", expand=False)
+
+@lru_cache(maxsize=None)
+def group_of(name):
+    """单个机构名称所属的 TAG_GROUPS 分组 (按配置顺序取第一个命中)，无则 None"""
+    if not GROUP_NAMES or not isinstance(name, str): return None
+    m = GROUP_RE.match(name)
+    return GROUP_NAMES[int(m.lastgroup[1:])] if m else None
+
+def groups_of(names):
+    """按去重后的名称求分组再映射回整列 (股东名称重复度很高)"""
+    uniq = names.dropna().unique()
+    return names.map({n: group_of(n) for n in uniq})
+
+def tag_frame(df, col="holder_name"):
+    """为含机构名称的明细补充 ssf_keyword / holder_group 列 (原地修改并返回)"""
+    df['ssf_keyword'] = keyword_of(df[col])
+    df['holder_group'] = groups_of(df[col])
+    return df
+
+def _tag_params(names):
+    tag_frame(names)
+    names = names.astype(object).where(names.notna(), None)
+    return [{"name": r.holder_name, "kw": r.ssf_keyword, "grp": r.holder_group} for r in names.itertuples(index=False)]
+
+def backfill(engine):
+    """按当前配置为 nt_shareholders 与机构维度表 nt_holders 重新打标，返回股东名称数"""
+    names = pd.read_sql(text("SELECT DISTINCT holder_name FROM nt_shareholders"), engine)
+    if names.empty: return 0
+    holders = pd.read_sql(text("SELECT holder_name FROM nt_holders"), engine)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE nt_shareholders s SET ssf_keyword = :kw, holder_group = :grp
+            WHERE s.holder_name = :name
+              AND (s.ssf_keyword IS DISTINCT FROM :kw OR s.holder_group IS DISTINCT FROM :grp)
+        """), _tag_params(names))
+        # 维度表按标准名称打标 (未命中关键词的名称同样需要清除旧标签)
+        if not holders.empty:
+            conn.execute(text("""
+                UPDATE nt_holders SET ssf_keyword = :kw, holder_group = :grp
+                WHERE holder_name = :name
+                  AND (ssf_keyword IS DISTINCT FROM :kw OR holder_group IS DISTINCT FROM :grp)
+            """), _tag_params(holders))
+        conn.execute(text("REFRESH MATERIALIZED VIEW mv_nt_latest_positions"))
+    return len(names)
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["backfill"]:
+        import db
+        n = backfill(db.get_engine())
+        print(f"✅ 已按当前配置为 {n} 个股东名称重新打标，并刷新最新持仓视图。")
+    else:
+        print(__doc__)
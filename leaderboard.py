@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+战绩排行榜聚合 v1.0
+功能：
+1. [向量化] 使用 groupby().agg 命名聚合计算机构战绩，替代逐组 apply。
+2. [预计算] 分析任务结束后写入 nt_holder_leaderboard，前端无筛选时直接读取。
+"""
+import datetime
+import numpy as np
+import pandas as pd
+
+LEADERBOARD_TABLE = "nt_holder_leaderboard"
+LEADERBOARD_COLS = ['holder_name', 'count', 'win', 'loss', 'win_loss', 'real_yield', 'avg_profit', 'total_val']
+
+def add_position_values(df):
+    """派生持仓市值/盈亏金额 (hold_amount 单位为万股)"""
+    df['profit_rate_pct'] = df['profit_rate'] * 100
+    df['position_val'] = df['hold_amount'] * 10000 * df['curr_price']
+    df['profit_val'] = (df['curr_price'] - df['est_cost']) * df['hold_amount'] * 10000
+    return df
+
+def aggregate_holder_stats(df):
+    """
+    按机构汇总持仓战绩
+    输入需包含: holder_name, ts_code, profit_rate, profit_rate_pct, position_val, profit_val
+    """
+    if df.empty: return pd.DataFrame(columns=LEADERBOARD_COLS)
+
+    work = df[['holder_name', 'ts_code', 'profit_rate_pct', 'position_val', 'profit_val']].assign(
+        win=(df['profit_rate'] > 0).astype(int),
+        loss=(df['profit_rate'] <= 0).astype(int),
+    )
+    rank = work.groupby('holder_name', observed=True, sort=False).agg(
+        count=('ts_code', 'size'),
+        win=('win', 'sum'),
+        loss=('loss', 'sum'),
+        avg_profit=('profit_rate_pct', 'mean'),
+        position_sum=('position_val', 'sum'),
+        profit_sum=('profit_val', 'sum'),
+    ).reset_index()
+
+    pos = rank['position_sum'].to_numpy(dtype=float)
+    prof = rank['profit_sum'].to_numpy(dtype=float)
+    rank['real_yield'] = np.divide(prof * 100, pos, out=np.zeros_like(pos), where=pos != 0)
+    rank['total_val'] = pos / 100000000
+    rank['win_loss'] = rank['win'].astype(str) + " / " + rank['loss'].astype(str)
+    rank['holder_name'] = rank['holder_name'].astype(str)
+    return rank[LEADERBOARD_COLS]
+
+def build_leaderboard(latest_df):
+    """由分析结果 (is_latest 行) 生成全量排行榜"""
+    df = latest_df.copy()
+    for col in ['hold_amount', 'est_cost', 'curr_price', 'profit_rate']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['hold_amount'] = df['hold_amount'].fillna(0)
+    rank = aggregate_holder_stats(add_position_values(df))
+    rank['update_time'] = datetime.datetime.now()
+    return rank
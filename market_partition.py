@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+nt_market_data 分区管理工具 v1.0
+功能：
+1. [迁移] 将单表 nt_market_data 改造为按年 RANGE 分区表 (nt_market_data_y2006 ...)，附带 BRIN(trade_date) 索引。
+2. [自动建分区] ETL 每次同步日线前调用 ensure_partitions，提前建好今年/明年的分区。
+3. [状态] 查看各分区行数与大小。
+
+用法：
+    python market_partition.py status                  # 查看分区状态
+    python market_partition.py migrate [--drop-legacy] # 单表 -> 分区表 (建议在更新任务空闲时执行)
+    python market_partition.py ensure                  # 手动补建分区
+"""
+import datetime
+import sys
+from sqlalchemy import text
+import db
+
+TABLE = "nt_market_data"
+LEGACY_TABLE = "nt_market_data_legacy"
+DEFAULT_PARTITION = f"{TABLE}_default"
+BRIN_PAGES_PER_RANGE = 32
+FIRST_YEAR = 2006  # 日线最早回溯到 2006 年
+
+def partition_name(year):
+    return f"{TABLE}_y{year}"
+
+def is_partitioned(conn):
+    sql = text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = :t
+        )
+    """)
+    return bool(conn.execute(sql, {"t": TABLE}).scalar())
+
+def existing_partitions(conn):
+    sql = text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :t
+    """)
+    return {r[0] for r in conn.execute(sql, {"t": TABLE})}
+
+def _create_year_partition(conn, year):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(year)} PARTITION OF {TABLE}
+        FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')
+    """))
+
+def ensure_partitions(engine, until_year=None):
+    """补建到 until_year (默认明年) 为止的年度分区；未分区时直接返回"""
+    until_year = until_year or datetime.date.today().year + 1
+    created = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn): return created
+        existing = existing_partitions(conn)
+        for year in range(FIRST_YEAR, until_year + 1):
+            if partition_name(year) not in existing:
+                _create_year_partition(conn, year)
+                created.append(partition_name(year))
+    if created:
+        print(f"🧱 [分区] 已新建: {', '.join(created)}")
+    return created
+
+def migrate(engine, drop_legacy=False):
+    """单表 -> 按年分区表；数据按 trade_date 顺序写入，使 BRIN 索引保持高相关性"""
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            print("✅ nt_market_data 已经是分区表，无需迁移。")
+            return
+
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+        year_range = conn.execute(text(f"SELECT EXTRACT(YEAR FROM min(trade_date))::int, EXTRACT(YEAR FROM max(trade_date))::int FROM {TABLE}")).fetchone()
+        first_year = min(year_range[0] or FIRST_YEAR, FIRST_YEAR)
+        last_year = max(year_range[1] or 0, datetime.date.today().year + 1)
+
+        print(f">>> 🧱 正在创建分区表 ({first_year} ~ {last_year})...")
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}"))
+        # 旧表上的主键/唯一约束改名，避免与新表同名冲突
+        conn.execute(text(f"ALTER TABLE {LEGACY_TABLE} RENAME CONSTRAINT nt_market_data_pkey TO nt_market_data_legacy_pkey"))
+        conn.execute(text(f"ALTER TABLE {LEGACY_TABLE} DROP CONSTRAINT IF EXISTS uniq_market_data"))
+        conn.execute(text(f"""
+            CREATE TABLE {TABLE} (
+                LIKE {LEGACY_TABLE} INCLUDING DEFAULTS,
+                CONSTRAINT nt_market_data_pkey PRIMARY KEY (ts_code, trade_date)
+            ) PARTITION BY RANGE (trade_date)
+        """))
+        for year in range(first_year, last_year + 1):
+            _create_year_partition(conn, year)
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+        print(">>> 🚚 正在搬迁数据...")
+        res = conn.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE} ORDER BY trade_date, ts_code"))
+        print(f"    已写入 {res.rowcount} 行。")
+
+        print(">>> 🗂️ 正在创建 BRIN 索引...")
+        conn.execute(text(f"CREATE INDEX idx_market_data_trade_date_brin ON {TABLE} USING brin (trade_date) WITH (pages_per_range = {BRIN_PAGES_PER_RANGE})"))
+
+        if drop_legacy:
+            conn.execute(text(f"DROP TABLE {LEGACY_TABLE}"))
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"ANALYZE {TABLE}"))
+    print("🎉 分区迁移完成！" + ("" if drop_legacy else f" 旧表保留为 {LEGACY_TABLE}，确认无误后可手动 DROP。"))
+
+def status(engine):
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            print("ℹ️ nt_market_data 尚未分区。执行 `python market_partition.py migrate` 进行迁移。")
+            return
+        sql = text("""
+            SELECT c.relname, c.reltuples::bigint, pg_size_pretty(pg_total_relation_size(c.oid))
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = :t ORDER BY c.relname
+        """)
+        for name, rows, size in conn.execute(sql, {"t": TABLE}):
+            print(f"{name:<28} {max(rows, 0):>12,} 行  {size:>10}")
+
+if __name__ == "__main__":
+    engine = db.get_engine()
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if cmd == "migrate":
+        migrate(engine, drop_legacy="--drop-legacy" in sys.argv)
+    elif cmd == "ensure":
+        ensure_partitions(engine)
+    else:
+        status(engine)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+K线预聚合模块 v1.0 (周线 / 月线)
+功能：
+1. [预聚合] 维护 nt_market_weekly / nt_market_monthly 两张 OHLCV 汇总表。
+2. [增量] ETL 每次只重算被新数据触及的周期 (按股票 + 起始日期)；汇总表为空或某只股票尚无汇总记录时自动补齐其全部历史。
+3. [查询] 根据请求的时间跨度自动选择 日/周/月 粒度，长区间读取的行数减少 20~50 倍。
+
+用法：
+    python market_rollup.py           # 全量重建
+"""
+import datetime
+import pandas as pd
+from sqlalchemy import text
+import market_store
+import db
+
+ROLLUP_TABLES = {"week": "nt_market_weekly", "month": "nt_market_monthly"}
+
+# 跨度 (天) 不超过阈值时使用对应粒度
+RESOLUTION_RULES = [(2 * 366, "day"), (6 * 366, "week")]
+
+def ensure_tables(engine):
+    with engine.begin() as conn:
+        for table in ROLLUP_TABLES.values():
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    ts_code character varying(10) NOT NULL,
+                    period_start date NOT NULL,
+                    trade_date date NOT NULL,
+                    open double precision,
+                    high double precision,
+                    low double precision,
+                    close double precision,
+                    vol double precision,
+                    amount double precision,
+                    bar_count integer,
+                    PRIMARY KEY (ts_code, period_start)
+                )
+            """))
+
+def _upsert_sql(unit, source_filter):
+    """周期内: 首日开盘, 末日收盘, 最高/最低, 成交量/额求和; trade_date 为周期内最后一个交易日"""
+    return f"""
+        INSERT INTO {ROLLUP_TABLES[unit]} (ts_code, period_start, trade_date, open, high, low, close, vol, amount, bar_count)
+        SELECT m.ts_code,
+               date_trunc('{unit}', m.trade_date)::date,
+               max(m.trade_date),
+               (array_agg(m.open ORDER BY m.trade_date ASC))[1],
+               max(m.high), min(m.low),
+               (array_agg(m.close ORDER BY m.trade_date DESC))[1],
+               sum(m.vol), sum(m.amount), count(*)
+        FROM nt_market_data m
+        {source_filter}
+        GROUP BY 1, 2
+        ON CONFLICT (ts_code, period_start) DO UPDATE SET
+            trade_date = EXCLUDED.trade_date,
+            open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+            vol = EXCLUDED.vol, amount = EXCLUDED.amount, bar_count = EXCLUDED.bar_count
+    """
+
+def refresh(engine, touched=None):
+    """
+    增量刷新汇总表
+    touched: {ts_code: 最早新写入的交易日}；为 None 时全量重建
+    """
+    ensure_tables(engine)
+    # 汇总表为空 (首次部署) 时全量重建, 否则只会生成本次新数据所在的周期
+    if touched is not None:
+        with engine.connect() as conn:
+            if any(conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {t})")).scalar() for t in ROLLUP_TABLES.values()):
+                print("ℹ️ [K线汇总] 汇总表为空，执行全量重建。")
+                touched = None
+    if touched is not None and not touched:
+        return 0
+
+    total = 0
+    with engine.begin() as conn:
+        for unit in ROLLUP_TABLES:
+            if touched is None:
+                res = conn.execute(text(_upsert_sql(unit, "")))
+            else:
+                # 从新数据所在周期的第一天开始重算, 保证周期首尾完整; 尚无汇总记录的股票补齐全部历史
+                source_filter = f"""
+                    JOIN unnest(CAST(:codes AS text[]), CAST(:sinces AS date[])) AS t(ts_code, since)
+                      ON m.ts_code = t.ts_code
+                     AND (m.trade_date >= date_trunc('{unit}', t.since)::date
+                          OR NOT EXISTS (SELECT 1 FROM {ROLLUP_TABLES[unit]} r WHERE r.ts_code = t.ts_code))
+                """
+                res = conn.execute(text(_upsert_sql(unit, source_filter)), {
+                    "codes": list(touched.keys()),
+                    "sinces": [pd.to_datetime(d).date() for d in touched.values()],
+                })
+            total += res.rowcount or 0
+    return total
+
+# ================= 查询接口 =================
+def pick_resolution(start, end):
+    """根据时间跨度选择粒度: <=2年 日线, <=6年 周线, 更长 月线"""
+    if start is None or end is None: return "month"
+    span = (pd.to_datetime(end) - pd.to_datetime(start)).days
+    for max_days, resolution in RESOLUTION_RULES:
+        if span <= max_days: return resolution
+    return "month"
+
+def get_latest_trade_date(engine, ts_code):
+    with engine.connect() as conn:
+        return db.execute_prepared(conn, "max_trade_date", ts_code).scalar()
+
+def load_bars(engine, ts_code, start=None, end=None, resolution=None):
+    """
+    读取 [start, end] 区间的K线, resolution 为 None 时按跨度自动选择
+    返回列: trade_date, open, high, low, close, vol, amount
+    """
+    if resolution is None:
+        resolution = pick_resolution(start, end or datetime.date.today())
+    table = "nt_market_data" if resolution == "day" else ROLLUP_TABLES[resolution]
+    if resolution == "day":
+        df = market_store.read_stock(ts_code, columns=["trade_date", "open", "high", "low", "close", "vol", "amount"], start=start, end=end)
+        if df is not None and not df.empty: return df
+
+    conds = ["ts_code = :code"]
+    params = {"code": ts_code}
+    if start is not None:
+        conds.append("trade_date >= :start"); params["start"] = pd.to_datetime(start).date()
+    if end is not None:
+        conds.append("trade_date <= :end"); params["end"] = pd.to_datetime(end).date()
+
+    sql = text(f"SELECT trade_date, open, high, low, close, vol, amount FROM {table} WHERE {' AND '.join(conds)} ORDER BY trade_date ASC")
+    df = pd.read_sql(sql, engine, params=params)
+    if not df.empty:
+        df['trade_date'] = pd.to_datetime(df['trade_date'])
+    return df
+
+if __name__ == "__main__":
+    engine = db.get_engine()
+    print(">>> 📦 正在全量重建周线/月线汇总表...")
+    n = refresh(engine)
+    print(f"✅ 汇总完成，写入 {n} 行。")
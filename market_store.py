@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+本地列式日线仓库 v1.0 (nt_market_data 的 Arrow IPC 镜像，可选)
+功能：
+1. [镜像] 每只股票一个未压缩的 Arrow IPC 文件 (MARKET_STORE_DIR/<ts_code>.arrow)，列与 nt_market_data 一致。
+2. [增量] ETL 写入日线后，按 (股票, 本次写入的最早交易日) 只从数据库重读变化部分，拼接后原子替换文件。
+3. [内存映射] 读取时 mmap 打开文件，批量扫描数千只股票的多年日线不再逐只查询数据库。
+4. [可选] 未安装 pyarrow 或 MARKET_STORE_DIR 为空时不启用，读取接口返回 None，调用方回退数据库查询。
+
+用法：
+    python market_store.py build     # 从数据库全量导出
+    python market_store.py status    # 查看文件数 / 大小 / 最新交易日
+"""
+import datetime
+import os
+import sys
+import pandas as pd
+from sqlalchemy import text
+import db
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+# ================= 配置引用 =================
+from config import MARKET_STORE_DIR
+
+COLUMNS = ["ts_code", "trade_date", "open", "high", "low", "close", "vol", "amount"]
+SUFFIX = ".arrow"
+BATCH_SIZE = 200  # 每次从数据库读取的股票数
+
+def enabled():
+    return HAS_ARROW and bool(MARKET_STORE_DIR)
+
+def _schema():
+    return pa.schema([("ts_code", pa.string()), ("trade_date", pa.date32())] + [(c, pa.float64()) for c in COLUMNS[2:]])
+
+def _path(ts_code):
+    return os.path.join(MARKET_STORE_DIR, f"{ts_code}{SUFFIX}")
+
+def _read_table(ts_code):
+    """内存映射读取单只股票；文件不存在返回 None"""
+    path = _path(ts_code)
+    if not os.path.exists(path): return None
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+def _write_table(ts_code, table):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    path = _path(ts_code)
+    tmp = f"{path}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+
+def _filter(table, start=None, end=None):
+    if start is not None:
+        table = table.filter(pc.greater_equal(table["trade_date"], pa.scalar(pd.to_datetime(start).date(), pa.date32())))
+    if end is not None:
+        table = table.filter(pc.less_equal(table["trade_date"], pa.scalar(pd.to_datetime(end).date(), pa.date32())))
+    return table
+
+def _to_frame(table, columns=None):
+    if columns: table = table.select(columns)
+    df = table.to_pandas(date_as_object=False)
+    if "trade_date" in df:
+        df["trade_date"] = pd.to_datetime(df["trade_date"]).astype("datetime64[ns]")  # 与 read_sql 结果一致
+    return df
+
+def read_stock(ts_code, columns=None, start=None, end=None):
+    """
+    读取单只股票 [start, end] 的日线 (按 trade_date 升序)，trade_date 为 datetime64
+    未启用或没有该股票的文件时返回 None (调用方回退数据库)
+    """
+    if not enabled(): return None
+    try:
+        table = _read_table(ts_code)
+    except Exception as e:
+        print(f"⚠️ [列式仓库] 读取 {ts_code} 失败，回退数据库: {e}")
+        return None
+    if table is None: return None
+    return _to_frame(_filter(table, start, end), columns)
+
+def scan(codes=None, columns=None, start=None, end=None):
+    """批量扫描多只股票 (codes 为 None 时扫描全部)，返回合并后的 DataFrame；未启用时返回 None"""
+    if not enabled() or not os.path.isdir(MARKET_STORE_DIR): return None
+    files = [os.path.join(MARKET_STORE_DIR, f) for f in sorted(os.listdir(MARKET_STORE_DIR)) if f.endswith(SUFFIX)]
+    if codes is not None:
+        wanted = {f"{c}{SUFFIX}" for c in codes}
+        files = [f for f in files if os.path.basename(f) in wanted]
+    if not files: return pd.DataFrame(columns=columns or COLUMNS)
+    dataset = ds.dataset(files, format="ipc", schema=_schema())
+    expr = None
+    if start is not None:
+        expr = ds.field("trade_date") >= pa.scalar(pd.to_datetime(start).date(), pa.date32())
+    if end is not None:
+        cond = ds.field("trade_date") <= pa.scalar(pd.to_datetime(end).date(), pa.date32())
+        expr = cond if expr is None else expr & cond
+    return _to_frame(dataset.to_table(columns=columns, filter=expr))
+
+def _load_since(engine, since_map):
+    """从数据库读取 {ts_code: 起始日期} 对应的日线"""
+    sql = text(f"""
+        SELECT {', '.join('m.' + c for c in COLUMNS)}
+        FROM nt_market_data m
+        JOIN unnest(CAST(:codes AS text[]), CAST(:since AS date[])) AS t(ts_code, since)
+          ON m.ts_code = t.ts_code AND m.trade_date >= t.since
+        ORDER BY m.ts_code, m.trade_date
+    """)
+    return pd.read_sql(sql, engine, params={"codes": list(since_map), "since": list(since_map.values())})
+
+def refresh(engine, touched=None):
+    """
+    增量同步: touched 为 {ts_code: 本次写入的最早交易日}，为 None 时全量重建全部股票
+    已有文件的股票只重读起始日之后的数据；没有文件的股票导出完整历史。返回写入的行数
+    """
+    if not enabled(): return 0
+    os.makedirs(MARKET_STORE_DIR, exist_ok=True)
+    if touched is None:
+        codes = pd.read_sql("SELECT DISTINCT ts_code FROM nt_market_data", engine)['ts_code'].tolist()
+        touched = dict.fromkeys(codes)
+    full_history = datetime.date(1900, 1, 1)
+    schema = _schema()
+    items = list(touched.items())
+    written = 0
+    for i in range(0, len(items), BATCH_SIZE):
+        existing, since_map = {}, {}
+        for code, since in items[i:i + BATCH_SIZE]:
+            table = _read_table(code) if since is not None else None
+            if table is None:
+                since_map[code] = full_history
+            else:
+                since = pd.to_datetime(since).date()
+                existing[code] = _filter(table, end=since - datetime.timedelta(days=1))
+                since_map[code] = since
+        df = _load_since(engine, since_map)
+        groups = dict(tuple(df.groupby("ts_code", sort=False))) if not df.empty else {}
+        for code in since_map:
+            new = pa.Table.from_pandas(groups.get(code, df.iloc[0:0])[COLUMNS], schema=schema, preserve_index=False)
+            table = pa.concat_tables([existing[code], new]) if code in existing else new
+            _write_table(code, table)
+            written += new.num_rows
+    return written
+
+def status():
+    if not enabled():
+        return {"enabled": False, "has_arrow": HAS_ARROW, "dir": MARKET_STORE_DIR}
+    files = [f for f in os.listdir(MARKET_STORE_DIR) if f.endswith(SUFFIX)] if os.path.isdir(MARKET_STORE_DIR) else []
+    latest = scan(columns=["trade_date"])
+    return {
+        "enabled": True, "dir": MARKET_STORE_DIR, "stocks": len(files),
+        "size_mb": round(sum(os.path.getsize(os.path.join(MARKET_STORE_DIR, f)) for f in files) / 1024 / 1024, 1),
+        "rows": len(latest), "latest_trade_date": str(latest['trade_date'].max().date()) if len(latest) else None,
+    }
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if not HAS_ARROW:
+        sys.exit("❌ 未安装 pyarrow：pip install pyarrow")
+    if not MARKET_STORE_DIR:
+        sys.exit("❌ 未配置 MARKET_STORE_DIR (例如 export MARKET_STORE_DIR=storage/market_store)")
+    if cmd == "build":
+        print(f">>> 📦 正在从数据库导出日线到 {MARKET_STORE_DIR} ...")
+        n = refresh(db.get_engine())
+        print(f"✅ 导出完成，共 {n} 行。")
+    else:
+        for k, v in status().items():
+            print(f"{k:<18} {v}")
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+运行指标采集 v1.1
+功能：
+1. [采集] 进程内的计数器 / 仪表 / 直方图 (计时器)，线程安全，供 ETL、考古、分析、修复脚本及看板共用。
+2. [埋点] instrument_engine 统计数据库往返次数与耗时；原生 DBAPI 游标 (execute_values / COPY / SAVEPOINT) 不经过
+   SQLAlchemy 事件，由 raw_query 记入同一组指标；instrument_session 统计 HTTP 请求、状态码与耗时。
+3. [报告] 每次运行结束写出一份 JSON 报告 (storage/run_reports/) 并记录到 nt_pipeline_runs 表。
+4. [导出] Prometheus 文本格式：运行结束写入 textfile (供 node_exporter textfile collector 采集)，
+   也可启动 HTTP 端点 (/metrics) 供 Prometheus 直接抓取。
+
+用法：
+    import metrics
+    with metrics.timer("stage_seconds", stage="market"): ...
+    metrics.inc("rows_written_total", len(rows), table="nt_market_data")
+    metrics.finish_run(engine, "etl_ingest_tushare", start_time)
+"""
+import datetime
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from sqlalchemy import event, text
+
+# ================= 配置引用 =================
+from config import METRICS_TEXTFILE_DIR
+
+METRIC_PREFIX = "nt_"
+REPORT_DIR = os.path.join("storage", "run_reports")
+RUNS_TABLE = "nt_pipeline_runs"
+# 直方图分桶 (秒)，覆盖单条 SQL 到整个阶段的耗时
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_gauges = {}      # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"count", "sum", "min", "max", "buckets"}
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"count": 0, "sum": 0.0, "min": value, "max": value, "buckets": [0] * len(BUCKETS)}
+        h["count"] += 1
+        h["sum"] += value
+        h["min"] = min(h["min"], value)
+        h["max"] = max(h["max"], value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                h["buckets"][i] += 1
+                break
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def timed(name, **labels):
+    """装饰器版本的 timer (同时支持 async 函数)"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(name, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def counted(name, **labels):
+    """装饰器: 每次调用计数 (放在 st.cache_data 外层即可统计含缓存命中在内的总调用次数)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            inc(name, **labels)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def snapshot():
+    """当前全部指标的拷贝: {"counters": [...], "gauges": [...], "histograms": [...]}"""
+    with _lock:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_counters.items())]
+        gauges = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(_gauges.items())]
+        histograms = [
+            {"name": n, "labels": dict(l), "count": h["count"], "sum": round(h["sum"], 6),
+             "min": round(h["min"], 6), "max": round(h["max"], 6), "avg": round(h["sum"] / h["count"], 6),
+             "buckets": list(h["buckets"])}
+            for (n, l), h in sorted(_histograms.items())
+        ]
+    return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+# ================= 埋点 =================
+def _statement_kind(statement):
+    return statement.lstrip().split(None, 1)[0].upper() if statement and statement.strip() else "OTHER"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("nt_query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["nt_query_start"].pop()
+    kind = _statement_kind(statement)
+    inc("db_queries_total", kind=kind)
+    observe("db_query_seconds", time.perf_counter() - started, kind=kind)
+
+def _handle_error(context):
+    starts = context.connection.info.get("nt_query_start") if context.connection is not None else None
+    if starts: starts.pop()
+    inc("db_errors_total", kind=_statement_kind(context.statement))
+
+@contextmanager
+def raw_query(kind, round_trips=1):
+    """
+    原生 DBAPI 游标上的语句计数与计时 (与 instrument_engine 记入相同的 db_queries_total / db_query_seconds)
+    round_trips: 块内实际发出的语句数 (如 execute_values 按 page_size 分成的条数)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("db_errors_total", kind=kind)
+        raise
+    inc("db_queries_total", round_trips, kind=kind)
+    observe("db_query_seconds", time.perf_counter() - started, kind=kind)
+
+def instrument_engine(engine):
+    """为 SQLAlchemy engine 注册查询计时 (同一 engine 只注册一次)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    return engine
+
+def endpoint_of(url):
+    parsed = urlparse(url)
+    return f"{parsed.netloc}{parsed.path}"
+
+def http_response_hook(response, *args, **kwargs):
+    """requests 响应钩子: 请求数 / 状态码 / 耗时"""
+    endpoint = endpoint_of(response.url)
+    inc("http_requests_total", endpoint=endpoint, status=response.status_code)
+    observe("http_request_seconds", response.elapsed.total_seconds(), endpoint=endpoint)
+    if response.status_code >= 400:
+        inc("http_errors_total", endpoint=endpoint, reason=f"http_{response.status_code}")
+
+def instrument_session(session):
+    """为 requests.Session 注册响应钩子，并统计连接异常"""
+    if getattr(session, "_nt_instrumented", False): return session
+    session.hooks["response"].append(http_response_hook)
+    original = session.request
+
+    def request(method, url, *args, **kwargs):
+        try:
+            return original(method, url, *args, **kwargs)
+        except Exception as e:
+            inc("http_errors_total", endpoint=endpoint_of(url), reason=type(e).__name__)
+            raise
+
+    session.request = request
+    session._nt_instrumented = True
+    return session
+
+# ================= 运行报告 =================
+def ensure_runs_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                id serial PRIMARY KEY,
+                script character varying(50) NOT NULL,
+                started_at timestamp without time zone,
+                finished_at timestamp without time zone,
+                duration_ms integer,
+                status character varying(20),
+                report jsonb
+            )
+        """))
+
+def build_report(script, started_at, status="success", error=None):
+    finished_at = datetime.datetime.now()
+    return {
+        "script": script,
+        "status": status,
+        "error": error,
+        "started_at": started_at.isoformat(),
+        "finished_at": finished_at.isoformat(),
+        "duration_s": round((finished_at - started_at).total_seconds(), 3),
+        **snapshot(),
+    }
+
+def finish_run(engine, script, started_at, status="success", error=None):
+    """写出 JSON 报告并记录到 nt_pipeline_runs；失败只打印警告，不影响主流程"""
+    report = build_report(script, started_at, status, error)
+    path = None
+    try:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        path = os.path.join(REPORT_DIR, f"{script}_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"⚠️ 运行报告写入失败: {e}")
+    try:
+        ensure_runs_table(engine)
+        with engine.begin() as conn:
+            conn.execute(text(f"""
+                INSERT INTO {RUNS_TABLE} (script, started_at, finished_at, duration_ms, status, report)
+                VALUES (:s, :st, :ft, :d, :status, CAST(:r AS jsonb))
+            """), {"s": script, "st": started_at, "ft": datetime.datetime.fromisoformat(report["finished_at"]),
+                   "d": int(report["duration_s"] * 1000), "status": status, "r": json.dumps(report, ensure_ascii=False)})
+    except Exception as e:
+        print(f"⚠️ 运行记录入库失败: {e}")
+    set_gauge("last_run_timestamp_seconds", time.time(), script=script)
+    set_gauge("last_run_success", 1 if status == "success" else 0, script=script)
+    set_gauge("last_run_duration_seconds", report["duration_s"], script=script)
+    write_textfile(script)
+    if path:
+        print(f"📊 运行报告: {path}")
+    return report
+
+# ================= Prometheus 导出 =================
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+def _derived_gauges(data):
+    """看板缓存命中率 = 1 - 实际查询次数 / 总调用次数"""
+    calls = {c["labels"]["loader"]: c["value"] for c in data["counters"] if c["name"] == "dashboard_loader_calls_total"}
+    misses = {h["labels"]["loader"]: h["count"] for h in data["histograms"] if h["name"] == "dashboard_query_seconds"}
+    return [
+        {"name": "dashboard_cache_hit_ratio", "labels": {"loader": loader}, "value": 1 - misses.get(loader, 0) / n}
+        for loader, n in calls.items() if n > 0
+    ]
+
+def render_prometheus():
+    """当前指标的 Prometheus 文本格式"""
+    data = snapshot()
+    lines, typed = [], set()
+
+    def type_line(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for c in data["counters"]:
+        name = METRIC_PREFIX + c["name"]
+        type_line(name, "counter")
+        lines.append(f"{name}{_fmt_labels(c['labels'])} {c['value']}")
+    for g in data["gauges"] + _derived_gauges(data):
+        name = METRIC_PREFIX + g["name"]
+        type_line(name, "gauge")
+        lines.append(f"{name}{_fmt_labels(g['labels'])} {g['value']}")
+    for h in data["histograms"]:
+        name = METRIC_PREFIX + h["name"]
+        type_line(name, "histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h["buckets"]):
+            cumulative += n
+            lines.append(f"{name}_bucket{_fmt_labels(h['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{name}_bucket{_fmt_labels(h['labels'], {'le': '+Inf'})} {h['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_textfile(script):
+    """写入 METRICS_TEXTFILE_DIR/nt_<script>.prom (先写临时文件再替换, 避免采集到半个文件)"""
+    if not METRICS_TEXTFILE_DIR: return None
+    try:
+        os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+        path = os.path.join(METRICS_TEXTFILE_DIR, f"nt_{script}.prom")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(path + ".tmp", path)
+        return path
+    except Exception as e:
+        print(f"⚠️ 指标文件写入失败: {e}")
+        return None
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_http_server(port, addr="0.0.0.0"):
+    """在后台线程中提供 /metrics；端口为 0 或被占用时返回 None"""
+    if not port: return None
+    try:
+        server = ThreadingHTTPServer((addr, int(port)), _MetricsHandler)
+    except OSError as e:
+        print(f"⚠️ 指标端口 {port} 启动失败: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    print(f"📡 指标端点已启动: http://{addr}:{port}/metrics")
+    return server
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+数据库迁移执行器 v1.0
+功能：
+1. [版本化] 按文件名顺序执行 migrations/NNNN_描述.sql，已执行的版本记录在 nt_schema_migrations。
+2. [事务] 每个迁移文件在单个事务中执行；文件中含 `-- migrate:no-transaction` 时逐条自动提交
+   (用于 CREATE INDEX CONCURRENTLY 等不能放在事务里的语句)。
+3. [校验] 已执行的迁移文件被改动时给出警告。
+
+用法：
+    python migrate.py           # 执行所有未执行的迁移
+    python migrate.py status    # 查看迁移状态
+"""
+import hashlib
+import os
+import re
+import sys
+import time
+from sqlalchemy import text
+import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_MARK = "-- migrate:no-transaction"
+FILE_PATTERN = re.compile(r"^(\d{4})_(.+)\.sql$")
+
+def ensure_history_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS nt_schema_migrations (
+                version character varying(10) PRIMARY KEY,
+                name text NOT NULL,
+                checksum character varying(64) NOT NULL,
+                duration_ms integer,
+                applied_at timestamp without time zone DEFAULT now()
+            )
+        """))
+
+def discover():
+    """返回 [(version, name, path, sql, checksum)]，按版本号排序"""
+    found = []
+    for fname in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = FILE_PATTERN.match(fname)
+        if not m: continue
+        path = os.path.join(MIGRATIONS_DIR, fname)
+        with open(path, encoding="utf-8") as f:
+            sql = f.read()
+        found.append((m.group(1), m.group(2), path, sql, hashlib.sha256(sql.encode("utf-8")).hexdigest()))
+    return found
+
+def split_statements(sql):
+    """按行尾分号切分语句 (跳过注释行, 保留 $$ 包裹的函数体)"""
+    statements, buf, in_dollar = [], [], False
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not buf and (not stripped or stripped.startswith("--")): continue
+        buf.append(line)
+        if stripped.count("$$") % 2 == 1: in_dollar = not in_dollar
+        if stripped.endswith(";") and not in_dollar:
+            statements.append("\n".join(buf)); buf = []
+    if "".join(buf).strip(): statements.append("\n".join(buf))
+    return statements
+
+def applied_versions(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT version, checksum FROM nt_schema_migrations")).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+def apply_one(engine, version, name, sql, checksum):
+    started = time.time()
+    record = text("INSERT INTO nt_schema_migrations (version, name, checksum, duration_ms) VALUES (:v, :n, :c, :d)")
+    if NO_TRANSACTION_MARK in sql:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for stmt in split_statements(sql):
+                conn.exec_driver_sql(stmt)
+            conn.execute(record, {"v": version, "n": name, "c": checksum, "d": int((time.time() - started) * 1000)})
+    else:
+        with engine.begin() as conn:
+            for stmt in split_statements(sql):
+                conn.exec_driver_sql(stmt)
+            conn.execute(record, {"v": version, "n": name, "c": checksum, "d": int((time.time() - started) * 1000)})
+    return time.time() - started
+
+def run(engine=None):
+    engine = engine or db.get_engine()
+    ensure_history_table(engine)
+    done = applied_versions(engine)
+    pending = []
+    for version, name, path, sql, checksum in discover():
+        if version in done:
+            if done[version] != checksum:
+                print(f"⚠️ 迁移 {version}_{name} 在执行后被修改过 (checksum 不一致)，请新建迁移文件而不是改动旧文件。")
+            continue
+        pending.append((version, name, sql, checksum))
+
+    if not pending:
+        print("✅ 数据库结构已是最新。")
+        return 0
+
+    for version, name, sql, checksum in pending:
+        print(f">>> 🧬 执行迁移 {version}_{name} ...")
+        cost = apply_one(engine, version, name, sql, checksum)
+        print(f"    完成，耗时 {cost:.2f}s")
+    print(f"🎉 共执行 {len(pending)} 个迁移。")
+    return len(pending)
+
+def status(engine=None):
+    engine = engine or db.get_engine()
+    ensure_history_table(engine)
+    done = applied_versions(engine)
+    for version, name, _, _, checksum in discover():
+        if version not in done: flag = "⏳ 待执行"
+        elif done[version] != checksum: flag = "⚠️ 已修改"
+        else: flag = "✅ 已执行"
+        print(f"{flag}  {version}_{name}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        status()
+    else:
+        run()
@@ -0,0 +1,38 @@
+-- 热点查询的覆盖索引 / 部分索引
+-- 对应查询见 benchmarks/query_plans.py
+
+-- nt_positions_analysis: 前端 load_data_latest (is_latest = true)
+CREATE INDEX IF NOT EXISTS idx_positions_latest
+    ON nt_positions_analysis (ts_code, holder_name) WHERE is_latest;
+
+-- nt_positions_analysis: 深度扫描的持仓历史 (ts_code, holder_name) ORDER BY period_end
+CREATE INDEX IF NOT EXISTS idx_positions_code_holder_period
+    ON nt_positions_analysis (ts_code, holder_name, period_end);
+
+-- nt_positions_analysis: 按财报期筛选
+CREATE INDEX IF NOT EXISTS idx_positions_period_end
+    ON nt_positions_analysis (period_end);
+
+-- nt_shareholders: analysis_engine 的 ann_date > '2022-01-01' 范围扫描, check_latest_report 的 max(ann_date) / ann_date = today
+CREATE INDEX IF NOT EXISTS idx_shareholders_ann_date
+    ON nt_shareholders (ann_date) INCLUDE (ts_code, holder_name, end_date);
+
+-- nt_shareholders: check_latest_report 的 max(end_date) / end_date = today (仅索引扫描)
+CREATE INDEX IF NOT EXISTS idx_shareholders_end_date
+    ON nt_shareholders (end_date) INCLUDE (ts_code);
+
+-- nt_stock_fundamentals: ETL 的 "今日已更新" 检查 update_date = today
+CREATE INDEX IF NOT EXISTS idx_fundamentals_update_date
+    ON nt_stock_fundamentals (update_date) INCLUDE (ts_code);
+
+-- nt_history_cost: fix_stock 的 hist_cost = 0 巡检
+CREATE INDEX IF NOT EXISTS idx_history_cost_missing
+    ON nt_history_cost (ts_code) WHERE hist_cost = 0 OR hist_cost IS NULL;
+
+-- nt_market_data: uniq_market_data 与主键完全重复, 只增加写入开销
+ALTER TABLE nt_market_data DROP CONSTRAINT IF EXISTS uniq_market_data;
+
+ANALYZE nt_positions_analysis;
+ANALYZE nt_shareholders;
+ANALYZE nt_stock_fundamentals;
+ANALYZE nt_history_cost;
@@ -0,0 +1,14 @@
+-- nt_market_data: numeric -> double precision
+-- numeric 为任意精度运算, sum(amount)/sum(vol) 聚合慢且行宽更大; 读取后也要在 pandas 中逐个转成 float。
+-- 价格保留两位小数、成交量/额的量级都在 float8 的精确表示范围内 (15 位有效数字)。
+-- 注意: 该迁移会重写整张表, 耗时与数据量成正比。
+
+ALTER TABLE nt_market_data
+    ALTER COLUMN open TYPE double precision,
+    ALTER COLUMN high TYPE double precision,
+    ALTER COLUMN low TYPE double precision,
+    ALTER COLUMN close TYPE double precision,
+    ALTER COLUMN vol TYPE double precision,
+    ALTER COLUMN amount TYPE double precision;
+
+ANALYZE nt_market_data;
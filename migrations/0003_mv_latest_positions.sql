@@ -0,0 +1,30 @@
+-- 最新持仓物化视图: 预先完成 nt_positions_analysis x stock_basic x nt_stock_fundamentals 的关联与派生列
+-- 由 analysis_engine 在分析结束后 REFRESH ... CONCURRENTLY, 前端读取时不会被写入阻塞, 也不会读到写了一半的数据
+
+DROP MATERIALIZED VIEW IF EXISTS mv_nt_latest_positions;
+
+CREATE MATERIALIZED VIEW mv_nt_latest_positions AS
+SELECT
+    a.ts_code, b.name, a.holder_name, a.est_cost, a.curr_price,
+    a.profit_rate, a.profit_rate * 100 AS profit_rate_pct,
+    CASE WHEN position('(' IN a.status) > 0
+         THEN replace(split_part(a.status, '(', 2), ')', '')
+         ELSE a.status END AS status,
+    a.period_end,
+    COALESCE(a.hold_amount, 0) AS hold_amount,
+    a.cost_source,
+    COALESCE(a.first_buy_date, a.period_end) AS first_buy_date,
+    a.change_analysis, a.update_time,
+    f.pe_ttm, f.pe_dyn, f.pe_static, f.pb, COALESCE(f.div_rate, 0) AS div_rate, f.total_mv, f.div_rate_static,
+    f.eps, f.roe, f.revenue_growth, f.net_profit_growth,
+    f.revenue, f.gross_margin, f.net_margin,
+    COALESCE(a.hold_amount, 0) * 10000 * a.curr_price AS position_val,
+    (a.curr_price - a.est_cost) * COALESCE(a.hold_amount, 0) * 10000 AS profit_val
+FROM nt_positions_analysis a
+LEFT JOIN stock_basic b ON a.ts_code = b.ts_code
+LEFT JOIN nt_stock_fundamentals f ON a.ts_code = f.ts_code
+WHERE a.is_latest = true
+WITH DATA;
+
+-- REFRESH CONCURRENTLY 需要唯一索引
+CREATE UNIQUE INDEX idx_mv_latest_positions_key ON mv_nt_latest_positions (ts_code, holder_name);
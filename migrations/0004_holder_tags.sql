@@ -0,0 +1,40 @@
+-- 股东打标: 采集时由 holder_match 写入命中的关键词与 TAG_GROUPS 分组, 看板按分组筛选不再逐个 fnmatch
+-- 已有数据请执行一次 python holder_match.py backfill (分组规则在 config.py, SQL 中无法计算)
+
+ALTER TABLE nt_shareholders ADD COLUMN IF NOT EXISTS ssf_keyword character varying(20);
+ALTER TABLE nt_shareholders ADD COLUMN IF NOT EXISTS holder_group character varying(50);
+
+-- 最新持仓视图增加 holder_group (同一名称以最近写入的标签为准)
+DROP MATERIALIZED VIEW IF EXISTS mv_nt_latest_positions;
+
+CREATE MATERIALIZED VIEW mv_nt_latest_positions AS
+SELECT
+    a.ts_code, b.name, a.holder_name, g.holder_group, a.est_cost, a.curr_price,
+    a.profit_rate, a.profit_rate * 100 AS profit_rate_pct,
+    CASE WHEN position('(' IN a.status) > 0
+         THEN replace(split_part(a.status, '(', 2), ')', '')
+         ELSE a.status END AS status,
+    a.period_end,
+    COALESCE(a.hold_amount, 0) AS hold_amount,
+    a.cost_source,
+    COALESCE(a.first_buy_date, a.period_end) AS first_buy_date,
+    a.change_analysis, a.update_time,
+    f.pe_ttm, f.pe_dyn, f.pe_static, f.pb, COALESCE(f.div_rate, 0) AS div_rate, f.total_mv, f.div_rate_static,
+    f.eps, f.roe, f.revenue_growth, f.net_profit_growth,
+    f.revenue, f.gross_margin, f.net_margin,
+    COALESCE(a.hold_amount, 0) * 10000 * a.curr_price AS position_val,
+    (a.curr_price - a.est_cost) * COALESCE(a.hold_amount, 0) * 10000 AS profit_val
+FROM nt_positions_analysis a
+LEFT JOIN stock_basic b ON a.ts_code = b.ts_code
+LEFT JOIN nt_stock_fundamentals f ON a.ts_code = f.ts_code
+LEFT JOIN (
+    SELECT DISTINCT ON (holder_name) holder_name, holder_group
+    FROM nt_shareholders
+    WHERE holder_group IS NOT NULL
+    ORDER BY holder_name, id DESC
+) g ON g.holder_name = a.holder_name
+WHERE a.is_latest = true
+WITH DATA;
+
+-- REFRESH CONCURRENTLY 需要唯一索引
+CREATE UNIQUE INDEX idx_mv_latest_positions_key ON mv_nt_latest_positions (ts_code, holder_name);
@@ -0,0 +1,159 @@
+-- 机构维度表 nt_holders: 每个机构一行 (标准名称 / 规范化名称 / 别名 / 关键词与分组标签)
+-- nt_shareholders / nt_history_cost / nt_positions_analysis 增加整数外键 holder_id, 关联与分组改用 holder_id
+-- 名称解析在写入时由触发器完成一次: 规范化后 (全角括号转半角, 去空格) 相同的名称视为同一机构, 不同写法记入 aliases
+
+CREATE OR REPLACE FUNCTION nt_normalize_holder(name text) RETURNS text
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT replace(replace(replace(trim(name), '（', '('), '）', ')'), ' ', '')
+$$;
+
+CREATE TABLE IF NOT EXISTS nt_holders (
+    holder_id serial PRIMARY KEY,
+    holder_name character varying(255) NOT NULL,
+    norm_name character varying(255) NOT NULL UNIQUE,
+    aliases text[] NOT NULL DEFAULT '{}',
+    ssf_keyword character varying(20),
+    holder_group character varying(50),
+    created_at timestamp without time zone DEFAULT now()
+);
+
+-- ---------- 从现有数据建立维度 (标准名称优先取股东明细中的写法) ----------
+INSERT INTO nt_holders (holder_name, norm_name)
+SELECT DISTINCT ON (nt_normalize_holder(holder_name)) holder_name, nt_normalize_holder(holder_name)
+FROM (
+    SELECT holder_name, 1 AS src FROM nt_shareholders
+    UNION ALL SELECT holder_name, 2 FROM nt_history_cost
+    UNION ALL SELECT holder_name, 3 FROM nt_positions_analysis
+) t
+WHERE holder_name IS NOT NULL
+ORDER BY nt_normalize_holder(holder_name), src, holder_name
+ON CONFLICT (norm_name) DO NOTHING;
+
+UPDATE nt_holders h SET aliases = array_remove(a.names, h.holder_name::text)
+FROM (
+    SELECT nt_normalize_holder(holder_name) AS norm, array_agg(DISTINCT holder_name::text) AS names
+    FROM (
+        SELECT holder_name FROM nt_shareholders
+        UNION SELECT holder_name FROM nt_history_cost
+        UNION SELECT holder_name FROM nt_positions_analysis
+    ) t
+    WHERE holder_name IS NOT NULL
+    GROUP BY 1
+) a
+WHERE a.norm = h.norm_name;
+
+UPDATE nt_holders h SET ssf_keyword = s.ssf_keyword, holder_group = s.holder_group
+FROM (
+    SELECT DISTINCT ON (nt_normalize_holder(holder_name)) nt_normalize_holder(holder_name) AS norm, ssf_keyword, holder_group
+    FROM nt_shareholders
+    WHERE ssf_keyword IS NOT NULL
+    ORDER BY nt_normalize_holder(holder_name), id DESC
+) s
+WHERE s.norm = h.norm_name;
+
+-- ---------- 外键列 ----------
+ALTER TABLE nt_shareholders ADD COLUMN IF NOT EXISTS holder_id integer REFERENCES nt_holders (holder_id);
+ALTER TABLE nt_history_cost ADD COLUMN IF NOT EXISTS holder_id integer REFERENCES nt_holders (holder_id);
+ALTER TABLE nt_positions_analysis ADD COLUMN IF NOT EXISTS holder_id integer REFERENCES nt_holders (holder_id);
+
+UPDATE nt_shareholders t SET holder_id = h.holder_id FROM nt_holders h WHERE h.norm_name = nt_normalize_holder(t.holder_name);
+UPDATE nt_history_cost t SET holder_id = h.holder_id FROM nt_holders h WHERE h.norm_name = nt_normalize_holder(t.holder_name);
+UPDATE nt_positions_analysis t SET holder_id = h.holder_id FROM nt_holders h WHERE h.norm_name = nt_normalize_holder(t.holder_name);
+
+CREATE INDEX IF NOT EXISTS idx_shareholders_holder_id ON nt_shareholders (holder_id, ts_code);
+CREATE INDEX IF NOT EXISTS idx_history_cost_code_holder_id ON nt_history_cost (ts_code, holder_id);
+CREATE INDEX IF NOT EXISTS idx_positions_holder_id ON nt_positions_analysis (holder_id) WHERE is_latest;
+
+-- ---------- 写入时解析 holder_id ----------
+-- 按规范化名称查找机构, 不存在则登记; 原始写法与标准名称不同时记入别名
+CREATE OR REPLACE FUNCTION nt_holder_id(name text) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    hid integer;
+BEGIN
+    IF name IS NULL THEN RETURN NULL; END IF;
+    SELECT holder_id INTO hid FROM nt_holders WHERE norm_name = nt_normalize_holder(name);
+    IF hid IS NULL THEN
+        INSERT INTO nt_holders (holder_name, norm_name) VALUES (name, nt_normalize_holder(name))
+        ON CONFLICT (norm_name) DO NOTHING
+        RETURNING holder_id INTO hid;
+        IF hid IS NULL THEN
+            SELECT holder_id INTO hid FROM nt_holders WHERE norm_name = nt_normalize_holder(name);
+        END IF;
+    END IF;
+    UPDATE nt_holders SET aliases = array_append(aliases, name)
+    WHERE holder_id = hid AND holder_name <> name AND NOT (name = ANY (aliases));
+    RETURN hid;
+END;
+$$;
+
+-- 写入方未提供 holder_id (或改了名称) 时按名称解析
+CREATE OR REPLACE FUNCTION nt_set_holder_id() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.holder_id IS NULL THEN
+        NEW.holder_id := nt_holder_id(NEW.holder_name);
+    ELSIF TG_OP = 'UPDATE' THEN
+        IF NEW.holder_name IS DISTINCT FROM OLD.holder_name THEN
+            NEW.holder_id := nt_holder_id(NEW.holder_name);
+        END IF;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+-- 采集时写入的关键词/分组标签同步到维度表
+CREATE OR REPLACE FUNCTION nt_sync_holder_tags() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.ssf_keyword IS NOT NULL THEN
+        UPDATE nt_holders SET ssf_keyword = NEW.ssf_keyword, holder_group = NEW.holder_group
+        WHERE holder_id = NEW.holder_id
+          AND (ssf_keyword IS DISTINCT FROM NEW.ssf_keyword OR holder_group IS DISTINCT FROM NEW.holder_group);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_shareholders_holder_id ON nt_shareholders;
+CREATE TRIGGER trg_shareholders_holder_id BEFORE INSERT OR UPDATE OF holder_name, holder_id ON nt_shareholders
+    FOR EACH ROW EXECUTE FUNCTION nt_set_holder_id();
+DROP TRIGGER IF EXISTS trg_history_cost_holder_id ON nt_history_cost;
+CREATE TRIGGER trg_history_cost_holder_id BEFORE INSERT OR UPDATE OF holder_name, holder_id ON nt_history_cost
+    FOR EACH ROW EXECUTE FUNCTION nt_set_holder_id();
+DROP TRIGGER IF EXISTS trg_positions_holder_id ON nt_positions_analysis;
+CREATE TRIGGER trg_positions_holder_id BEFORE INSERT OR UPDATE OF holder_name, holder_id ON nt_positions_analysis
+    FOR EACH ROW EXECUTE FUNCTION nt_set_holder_id();
+DROP TRIGGER IF EXISTS trg_shareholders_tags ON nt_shareholders;
+CREATE TRIGGER trg_shareholders_tags AFTER INSERT OR UPDATE OF ssf_keyword, holder_group ON nt_shareholders
+    FOR EACH ROW EXECUTE FUNCTION nt_sync_holder_tags();
+
+-- ---------- 最新持仓视图: 分组标签改由维度表按 holder_id 关联 ----------
+DROP MATERIALIZED VIEW IF EXISTS mv_nt_latest_positions;
+
+CREATE MATERIALIZED VIEW mv_nt_latest_positions AS
+SELECT
+    a.ts_code, b.name, a.holder_name, a.holder_id, h.holder_group, a.est_cost, a.curr_price,
+    a.profit_rate, a.profit_rate * 100 AS profit_rate_pct,
+    CASE WHEN position('(' IN a.status) > 0
+         THEN replace(split_part(a.status, '(', 2), ')', '')
+         ELSE a.status END AS status,
+    a.period_end,
+    COALESCE(a.hold_amount, 0) AS hold_amount,
+    a.cost_source,
+    COALESCE(a.first_buy_date, a.period_end) AS first_buy_date,
+    a.change_analysis, a.update_time,
+    f.pe_ttm, f.pe_dyn, f.pe_static, f.pb, COALESCE(f.div_rate, 0) AS div_rate, f.total_mv, f.div_rate_static,
+    f.eps, f.roe, f.revenue_growth, f.net_profit_growth,
+    f.revenue, f.gross_margin, f.net_margin,
+    COALESCE(a.hold_amount, 0) * 10000 * a.curr_price AS position_val,
+    (a.curr_price - a.est_cost) * COALESCE(a.hold_amount, 0) * 10000 AS profit_val
+FROM nt_positions_analysis a
+LEFT JOIN stock_basic b ON a.ts_code = b.ts_code
+LEFT JOIN nt_stock_fundamentals f ON a.ts_code = f.ts_code
+LEFT JOIN nt_holders h ON h.holder_id = a.holder_id
+WHERE a.is_latest = true
+WITH DATA;
+
+-- REFRESH CONCURRENTLY 需要唯一索引
+CREATE UNIQUE INDEX idx_mv_latest_positions_key ON mv_nt_latest_positions (ts_code, holder_name);
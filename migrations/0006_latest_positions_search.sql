@@ -0,0 +1,22 @@
+-- 看板查询服务 (query_service.py) 的筛选/排序索引, 建在最新持仓物化视图上
+-- 注意: 之后的迁移若重建 mv_nt_latest_positions, 需要一并重建这些索引
+
+-- 代码/名称模糊搜索: ts_code ILIKE '%kw%' OR name ILIKE '%kw%'
+-- 官方 postgres 镜像自带 pg_trgm; 未安装 contrib 的数据库跳过这两个索引, 搜索退回顺序扫描 (结果不变)
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_mv_latest_code_trgm ON mv_nt_latest_positions USING gin (ts_code gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS idx_mv_latest_name_trgm ON mv_nt_latest_positions USING gin (name gin_trgm_ops);
+EXCEPTION WHEN feature_not_supported OR undefined_file OR insufficient_privilege THEN
+    RAISE NOTICE USING MESSAGE = 'pg_trgm 不可用，跳过模糊搜索索引: ' || SQLERRM;
+END
+$$;
+
+-- 机构 / 状态筛选
+CREATE INDEX IF NOT EXISTS idx_mv_latest_holder ON mv_nt_latest_positions (holder_name);
+CREATE INDEX IF NOT EXISTS idx_mv_latest_status ON mv_nt_latest_positions (status);
+
+-- 默认排序 (最新财报期) 与资金分布 Top N
+CREATE INDEX IF NOT EXISTS idx_mv_latest_period_end ON mv_nt_latest_positions (period_end DESC);
+CREATE INDEX IF NOT EXISTS idx_mv_latest_position_val ON mv_nt_latest_positions (position_val DESC NULLS LAST);
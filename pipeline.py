@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+数据更新流水线 v1.0 (替代 update_data.sh 中逐个启动脚本的方式)
+功能：
+1. [依赖调度] 各阶段声明上游依赖，无依赖关系的阶段并发执行 (如 基本面 与 日线/考古 同时进行)。
+2. [单进程] 全部阶段在同一个进程内运行，共享一个数据库连接池，省去每步重新导入 pandas/tushare 的开销。
+3. [跳过] 声明了输入表的阶段，若输入指纹与上次运行一致则直接跳过 (记录在 nt_pipeline_state)；
+   声明了 pending 的阶段在仍有待办时不跳过 (如考古失败的组合每次都会重试)。
+4. [计时] 输出各阶段耗时汇总，并写出整次运行的指标报告 (metrics.finish_run)。
+
+依赖关系：
+    migrate -> shareholders -> market -> history -> (fix) -> analysis -> drilldown
+                            \\-> fundamentals ---------------/
+
+用法：
+    python pipeline.py                 # 增量更新
+    python pipeline.py --force         # 忽略输入指纹, 所有阶段都执行
+    python pipeline.py --with-fix      # 考古后追加执行 fix_stock 自动修复
+    python pipeline.py --history-full  # 考古阶段使用 full 模式
+"""
+import argparse
+import datetime
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+import db
+import migrate
+import pipeline_state
+import drilldown
+from etl_ingest_tushare import DataEngine
+from batch_history_trace import HistoryTracer
+from analysis_engine import NationalTeamAnalyzer
+from fix_stock import AutoFixer
+
+# ================= 配置引用 =================
+from config import METRICS_PORT
+
+# ================= 阶段定义 =================
+def run_migrate(ctx): migrate.run(ctx["engine"])
+def run_shareholders(ctx): ctx["data_engine"].run_shareholder_sync()
+def run_market(ctx): ctx["data_engine"].run_market_data_sync()
+def run_fundamentals(ctx): ctx["data_engine"].run_fundamentals_sync()
+def run_history(ctx): HistoryTracer(engine=ctx["engine"]).run(mode=ctx["history_mode"])
+def run_fix(ctx): AutoFixer(engine=ctx["engine"]).run()
+def run_analysis(ctx): NationalTeamAnalyzer(engine=ctx["engine"]).analyze_positions(force=ctx["force"])
+def run_drilldown(ctx): drilldown.refresh(ctx["engine"])
+
+# deps: 上游阶段；inputs: 输入表 (指纹不变时跳过)，为 None 表示每次都执行 (如外部接口采集)
+STAGES = {
+    "migrate":      {"desc": "数据库结构迁移", "deps": [], "inputs": None, "run": run_migrate},
+    "shareholders": {"desc": "股东数据采集", "deps": ["migrate"], "inputs": None, "run": run_shareholders},
+    "market":       {"desc": "日线同步", "deps": ["shareholders"], "inputs": None, "run": run_market},
+    "fundamentals": {"desc": "基本面同步", "deps": ["shareholders"], "inputs": None, "run": run_fundamentals},
+    "history":      {"desc": "历史考古", "deps": ["market"], "inputs": ["nt_shareholders", "nt_market_data"], "pending": pipeline_state.pending_traces, "run": run_history},
+    "fix":          {"desc": "自动修复", "deps": ["history"], "inputs": None, "run": run_fix},
+    # 持仓分析自带输入指纹检查 (analysis_engine.INPUT_TABLES)，单独运行脚本时同样生效
+    "analysis":     {"desc": "持仓分析", "deps": ["history", "fundamentals", "fix"], "inputs": None, "run": run_analysis},
+    "drilldown":    {"desc": "深度扫描预计算", "deps": ["analysis"], "inputs": ["nt_positions_analysis", "nt_market_data"], "run": run_drilldown},
+}
+
+def run_stage(name, stage, ctx, force=False):
+    """执行单个阶段，返回 (状态, 耗时秒)"""
+    engine = ctx["engine"]
+    fp = None
+    if stage["inputs"]:
+        # 取运行前的指纹: 运行期间其它阶段的写入会在下次运行时被识别为变化
+        fp = pipeline_state.fingerprint(engine, stage["inputs"])
+        if not force and fp == pipeline_state.last_fingerprint(engine, name):
+            todo = stage["pending"](engine) if stage.get("pending") else 0
+            if not todo:
+                print(f"⏩ [{name}] 输入数据无变化，跳过。")
+                pipeline_state.save_state(engine, name, "skipped", 0)
+                return "skipped", 0.0
+            print(f"🔁 [{name}] 输入数据无变化，但仍有 {todo} 条待处理，继续执行。")
+
+    print(f">>> ▶️ [{name}] {stage['desc']} 开始...")
+    started = time.time()
+    try:
+        stage["run"](ctx)
+    except (Exception, SystemExit) as e:
+        cost = time.time() - started
+        traceback.print_exc()
+        print(f"❌ [{name}] 执行失败: {e}")
+        pipeline_state.save_state(engine, name, "failed", int(cost * 1000))
+        return "failed", cost
+
+    cost = time.time() - started
+    metrics.observe("pipeline_stage_seconds", cost, stage=name)
+    pipeline_state.save_state(engine, name, "success", int(cost * 1000), fp)
+    print(f"✅ [{name}] 完成，耗时 {cost:.1f}s")
+    return "success", cost
+
+def run_pipeline(stages, ctx, force=False):
+    """按依赖关系调度：上游全部结束即提交；上游失败的阶段标记为 blocked"""
+    results = {}
+    pending = dict(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for name, stage in list(pending.items()):
+                    deps = [d for d in stage["deps"] if d in stages]
+                    if any(results.get(d, (None,))[0] in ("failed", "blocked") for d in deps):
+                        print(f"⛔ [{name}] 上游阶段失败，不再执行。")
+                        results[name] = ("blocked", 0.0)
+                    elif all(d in results for d in deps):
+                        running[executor.submit(run_stage, name, stage, ctx, force)] = name
+                    else:
+                        continue
+                    del pending[name]
+                    changed = True
+            if not running: break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+def print_summary(results, total):
+    icons = {"success": "✅", "skipped": "⏩", "failed": "❌", "blocked": "⛔"}
+    print("============================================")
+    for name, (status, cost) in results.items():
+        print(f"{icons[status]} {name:<14} {status:<8} {cost:>8.1f}s")
+    print(f"⏱️ 总耗时 {total:.1f}s")
+    print("============================================")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="数据更新流水线")
+    parser.add_argument("--force", action="store_true", help="忽略输入指纹, 所有阶段都执行")
+    parser.add_argument("--with-fix", action="store_true", help="考古后执行 fix_stock 自动修复")
+    parser.add_argument("--history-full", action="store_true", help="考古阶段使用 full 模式")
+    args = parser.parse_args()
+
+    stages = {k: v for k, v in STAGES.items() if args.with_fix or k != "fix"}
+    metrics.start_http_server(METRICS_PORT)
+    engine = db.get_engine("pipeline")
+    ctx = {
+        "engine": engine,
+        "data_engine": DataEngine(engine=engine),
+        "history_mode": "full" if args.history_full else "incremental",
+        "force": args.force,
+    }
+
+    started = time.time()
+    start_time = datetime.datetime.now()
+    results = run_pipeline(stages, ctx, force=args.force)
+    print_summary(results, time.time() - started)
+    for name, (status, _) in results.items():
+        metrics.inc("pipeline_stages_total", stage=name, status=status)
+    failed = any(status in ("failed", "blocked") for status, _ in results.values())
+    metrics.finish_run(engine, "pipeline", start_time, "failed" if failed else "success")
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+流水线状态记录 v1.0
+功能：
+1. [指纹] 对输入表计算 "行数 + 最大时间戳" 指纹，用于判断上游数据自上次运行以来是否有变化。
+2. [状态] nt_pipeline_state 按阶段记录上次的输入指纹、执行状态与耗时。
+3. [待办] pending_traces() 统计仍缺少考古成本的 (股票, 机构) 组合；大于 0 时考古阶段即使输入无变化也不跳过，以便重试失败的考古。
+"""
+import datetime
+import hashlib
+from sqlalchemy import text
+
+STATE_TABLE = "nt_pipeline_state"
+
+# 表名 -> 指纹 SQL (只取聚合值, 走索引即可完成)
+FINGERPRINT_SQL = {
+    "nt_shareholders": "SELECT count(*), max(id), max(ann_date) FROM nt_shareholders",
+    "nt_history_cost": "SELECT count(*), max(calc_date) FROM nt_history_cost",
+    "nt_market_data": "SELECT count(*), max(trade_date) FROM nt_market_data",
+    "nt_stock_fundamentals": "SELECT count(*), max(update_date) FROM nt_stock_fundamentals",
+    "nt_positions_analysis": "SELECT count(*), max(update_time) FROM nt_positions_analysis",
+    # 无时间戳列, 表很小, 直接对内容取 md5
+    "stock_basic": "SELECT count(*), md5(string_agg(ts_code || ':' || coalesce(name, ''), ',' ORDER BY ts_code)) FROM stock_basic",
+}
+
+# 与 batch_history_trace 增量模式的任务清单一致: 无考古记录或成本无效的组合
+PENDING_TRACE_SQL = """
+    SELECT count(*) FROM (
+        SELECT DISTINCT s.ts_code, s.holder_id
+        FROM nt_shareholders s
+        LEFT JOIN nt_history_cost h ON s.ts_code = h.ts_code AND s.holder_id = h.holder_id
+        WHERE h.hist_cost IS NULL OR h.hist_cost <= 0
+    ) t
+"""
+
+def pending_traces(engine):
+    """待考古 (或上次考古失败) 的组合数；表不存在时视为 0"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(PENDING_TRACE_SQL)).scalar() or 0
+    except Exception:
+        return 0
+
+def ensure_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+                stage character varying(50) PRIMARY KEY,
+                fingerprint character varying(32),
+                status character varying(20),
+                duration_ms integer,
+                updated_at timestamp without time zone DEFAULT now()
+            )
+        """))
+
+def fingerprint(engine, tables):
+    """返回多张表的组合指纹 (md5)；表不存在时该表记为 missing"""
+    parts = []
+    with engine.connect() as conn:
+        for table in tables:
+            try:
+                row = conn.execute(text(FINGERPRINT_SQL[table])).fetchone()
+                parts.append(f"{table}:{'|'.join(str(v) for v in row)}")
+            except Exception:
+                conn.rollback()
+                parts.append(f"{table}:missing")
+    return hashlib.md5(";".join(parts).encode("utf-8")).hexdigest()
+
+def last_fingerprint(engine, stage):
+    """上次成功运行时记录的指纹"""
+    ensure_table(engine)
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT fingerprint FROM {STATE_TABLE} WHERE stage = :s AND status IN ('success', 'skipped')"), {"s": stage}).scalar()
+
+def save_state(engine, stage, status, duration_ms=None, fp=None):
+    """记录阶段状态；fp 为 None 时保留原有指纹"""
+    ensure_table(engine)
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            INSERT INTO {STATE_TABLE} (stage, fingerprint, status, duration_ms, updated_at)
+            VALUES (:s, :fp, :st, :d, :t)
+            ON CONFLICT (stage) DO UPDATE SET
+                fingerprint = COALESCE(EXCLUDED.fingerprint, {STATE_TABLE}.fingerprint),
+                status = EXCLUDED.status, duration_ms = EXCLUDED.duration_ms, updated_at = EXCLUDED.updated_at
+        """), {"s": stage, "fp": fp, "st": status, "d": duration_ms, "t": datetime.datetime.now()})
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+看板查询服务 v1.0 (进程内)
+功能：
+1. [下推] 机构 / 盈亏状态 / 关键词筛选、排序与分页全部在 SQL 中完成，看板只取当前页，不再把全量最新持仓读进内存再筛选。
+2. [汇总] 战况总览、资金分布 Top N、机构战绩所需的聚合同样由数据库按筛选条件计算。
+3. [索引] 关键词 (代码/名称模糊搜索) 走 pg_trgm 的 GIN 索引，机构/状态筛选与排序列均有索引 (migrations/0006)。
+4. [内存] 返回的 DataFrame 统一转为紧凑类型：重复度高的字符串列 -> category，比率/价格类 -> float32，
+   金额类 (市值、浮盈、营收、持股数) 保持 float64，汇总时不损失精度。看板以 cache_resource 在各会话间共享这些结果。
+
+数据来源为最新持仓物化视图 mv_nt_latest_positions；筛选条件统一为 holders (机构名称列表)、statuses (状态列表)、
+keyword (代码或名称包含的文字)，为空表示不筛选。
+"""
+import pandas as pd
+from sqlalchemy import text
+
+SOURCE = "mv_nt_latest_positions"
+
+# 分页明细的列 (看板持仓明细表与深度扫描面板所需)
+PAGE_COLS = [
+    'ts_code', 'name', 'holder_name', 'holder_id', 'status', 'est_cost', 'curr_price', 'profit_rate', 'profit_rate_pct',
+    'period_end', 'hold_amount', 'cost_source', 'first_buy_date', 'change_analysis', 'update_time',
+    'pe_ttm', 'pe_dyn', 'pe_static', 'pb', 'div_rate', 'total_mv', 'div_rate_static',
+    'eps', 'roe', 'revenue_growth', 'net_profit_growth', 'revenue', 'gross_margin', 'net_margin',
+    'position_val', 'profit_val',
+]
+# 允许排序的列 (其余取值一律退回默认排序)
+SORT_COLS = {'period_end', 'position_val', 'profit_rate_pct', 'profit_val', 'est_cost', 'curr_price', 'ts_code', 'holder_name', 'first_buy_date'}
+DEFAULT_SORT = 'period_end'
+
+# 紧凑类型 (见 compact)
+CATEGORY_COLS = ['ts_code', 'name', 'holder_name', 'holder_group', 'status', 'cost_source', 'change_analysis']
+FLOAT32_COLS = [
+    'est_cost', 'curr_price', 'profit_rate', 'profit_rate_pct',
+    'pe_ttm', 'pe_dyn', 'pe_static', 'pb', 'div_rate', 'div_rate_static',
+    'eps', 'roe', 'revenue_growth', 'net_profit_growth', 'gross_margin', 'net_margin',
+]
+
+def compact(df):
+    """转换为紧凑类型 (原地修改并返回)"""
+    for col in CATEGORY_COLS:
+        if col in df.columns: df[col] = df[col].astype('category')
+    for col in FLOAT32_COLS:
+        if col in df.columns: df[col] = df[col].astype('float32')
+    return df
+
+def _escape_like(s):
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def build_where(holders=None, statuses=None, keyword=""):
+    """筛选条件 -> (WHERE 子句, 参数)"""
+    clauses, params = [], {}
+    if holders:
+        clauses.append("holder_name = ANY(:holders)")
+        params["holders"] = list(holders)
+    if statuses:
+        clauses.append("status = ANY(:statuses)")
+        params["statuses"] = list(statuses)
+    keyword = (keyword or "").strip()
+    if keyword:
+        clauses.append("(ts_code ILIKE :kw OR name ILIKE :kw)")
+        params["kw"] = f"%{_escape_like(keyword)}%"
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def _to_datetime(df):
+    for col in ['period_end', 'first_buy_date', 'update_time']:
+        if col in df.columns: df[col] = pd.to_datetime(df[col])
+    return df
+
+def empty_page():
+    """与 page() 列和类型一致的空表"""
+    return compact(_to_datetime(pd.DataFrame(columns=PAGE_COLS)))
+
+def filter_options(engine):
+    """侧边栏选项: 机构 (含分组)、状态列表、数据更新时间"""
+    with engine.connect() as conn:
+        holders = pd.read_sql(text(f"SELECT DISTINCT holder_name, holder_group FROM {SOURCE} ORDER BY holder_name"), conn)
+        statuses = [r[0] for r in conn.execute(text(f"SELECT DISTINCT status FROM {SOURCE} ORDER BY status"))]
+        update_time = conn.execute(text(f"SELECT max(update_time) FROM {SOURCE}")).scalar()
+    return {"holders": holders, "statuses": statuses, "update_time": update_time}
+
+def summary(engine, holders=None, statuses=None, keyword=""):
+    """筛选结果的总览指标"""
+    where, params = build_where(holders, statuses, keyword)
+    sql = text(f"""
+        SELECT count(*) AS count,
+               count(*) FILTER (WHERE profit_rate > 0) AS win,
+               count(*) FILTER (WHERE profit_rate <= 0) AS loss,
+               coalesce(sum(position_val), 0) AS position_sum,
+               coalesce(sum(profit_val), 0) AS profit_sum,
+               avg(profit_rate_pct) AS avg_profit_pct
+        FROM {SOURCE} {where}
+    """)
+    with engine.connect() as conn:
+        row = conn.execute(sql, params).mappings().one()
+    return {k: (float(v) if v is not None and k not in ("count", "win", "loss") else v) for k, v in row.items()}
+
+def top_positions(engine, n=15, holders=None, statuses=None, keyword=""):
+    """按持仓市值排名前 n 的持仓 (资金分布 / 重仓 Top)，以及其余持仓的市值合计"""
+    where, params = build_where(holders, statuses, keyword)
+    sql = text(f"""
+        SELECT ts_code, name, holder_name, position_val, sum(position_val) OVER () AS total_val
+        FROM {SOURCE} {where}
+        ORDER BY position_val DESC NULLS LAST
+        LIMIT :n
+    """)
+    df = pd.read_sql(sql, engine, params={**params, "n": n})
+    if df.empty: return df, 0.0
+    # 窗口函数在 LIMIT 之前计算, total_val 为全部筛选结果的合计
+    others = float(df['total_val'].iloc[0]) - float(df['position_val'].sum())
+    return compact(df.drop(columns='total_val')), max(others, 0.0)
+
+def page(engine, page_no=0, page_size=50, sort=DEFAULT_SORT, descending=True, holders=None, statuses=None, keyword=""):
+    """筛选结果的第 page_no 页 (从 0 开始)"""
+    where, params = build_where(holders, statuses, keyword)
+    sort = sort if sort in SORT_COLS else DEFAULT_SORT
+    direction = "DESC" if descending else "ASC"
+    sql = text(f"""
+        SELECT {', '.join(PAGE_COLS)} FROM {SOURCE} {where}
+        ORDER BY {sort} {direction} NULLS LAST, ts_code, holder_name
+        LIMIT :limit OFFSET :offset
+    """)
+    df = pd.read_sql(sql, engine, params={**params, "limit": page_size, "offset": page_no * page_size})
+    return compact(_to_datetime(df))
+
+def holder_rows(engine, holders=None, statuses=None, keyword=""):
+    """机构战绩聚合所需的精简列 (leaderboard.aggregate_holder_stats 的输入)"""
+    where, params = build_where(holders, statuses, keyword)
+    sql = text(f"SELECT holder_name, ts_code, profit_rate, profit_rate_pct, position_val, profit_val FROM {SOURCE} {where}")
+    return compact(pd.read_sql(sql, engine, params=params))
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+技术指标引擎 v1.0
+功能：
+1. [预计算] 逐日计算 MA20/MA60/RSI14/Bias20/MACD/布林带/ATR14，写入 nt_tech_indicators。
+2. [增量] ETL 之后只计算新交易日；EMA 类指标从上一交易日的状态续算，滚动类指标只回看少量历史。
+3. [选股] v_tech_indicators_latest 视图提供全市场最新指标，可直接按指标批量筛选。
+
+用法：
+    python tech_indicators.py         # 全量重算
+"""
+import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+import db
+from tqdm import tqdm
+
+TECH_TABLE = "nt_tech_indicators"
+LATEST_VIEW = "v_tech_indicators_latest"
+LOOKBACK_BARS = 80  # 滚动窗口最长 60 日, 多取一些作为余量
+FULL_SINCE = datetime.date(1900, 1, 1)  # 从头重算时的起始日
+
+INDICATOR_COLS = [
+    "close", "ma20", "ma60", "rsi14", "bias20",
+    "ema12", "ema26", "macd_dif", "macd_dea", "macd_hist",
+    "boll_mid", "boll_upper", "boll_lower", "atr14",
+]
+
+def ensure_tables(engine):
+    cols_ddl = ",\n".join(f"{c} double precision" for c in INDICATOR_COLS)
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {TECH_TABLE} (
+                ts_code character varying(10) NOT NULL,
+                trade_date date NOT NULL,
+                {cols_ddl},
+                PRIMARY KEY (ts_code, trade_date)
+            )
+        """))
+        conn.execute(text(f"""
+            CREATE OR REPLACE VIEW {LATEST_VIEW} AS
+            SELECT DISTINCT ON (ts_code) *
+            FROM {TECH_TABLE}
+            ORDER BY ts_code, trade_date DESC
+        """))
+
+def _seeded_ewm(series, span, seed=None):
+    """EMA (adjust=False)；seed 为上一交易日的 EMA 值时从该状态续算"""
+    if seed is None or pd.isna(seed):
+        return series.ewm(span=span, adjust=False).mean()
+    seeded = pd.concat([pd.Series([float(seed)]), series], ignore_index=True)
+    out = seeded.ewm(span=span, adjust=False).mean().iloc[1:]
+    out.index = series.index
+    return out
+
+def compute_indicators(bars, seed=None, since=None):
+    """
+    计算技术指标
+    bars: 升序日线 (trade_date, high, low, close)，可包含 since 之前的回看数据
+    seed: since 前一交易日的 {ema12, ema26, macd_dea}，为 None 时从头计算
+    返回 since 及之后各交易日的指标
+    """
+    bars = bars.reset_index(drop=True)
+    close = bars['close'].astype(float)
+    high = bars['high'].astype(float)
+    low = bars['low'].astype(float)
+
+    out = pd.DataFrame({'trade_date': pd.to_datetime(bars['trade_date']), 'close': close})
+    out['ma20'] = close.rolling(window=20).mean()
+    out['ma60'] = close.rolling(window=60).mean()
+    out['bias20'] = (close - out['ma20']) / out['ma20'] * 100
+
+    delta = close.diff()
+    gain = delta.where(delta > 0, 0).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    out['rsi14'] = 100 - (100 / (1 + gain / loss))
+
+    std20 = close.rolling(window=20).std(ddof=0)
+    out['boll_mid'] = out['ma20']
+    out['boll_upper'] = out['ma20'] + 2 * std20
+    out['boll_lower'] = out['ma20'] - 2 * std20
+
+    prev_close = close.shift(1)
+    tr = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+    out['atr14'] = tr.rolling(window=14).mean()
+
+    def add_macd(df, seed):
+        df['ema12'] = _seeded_ewm(df['close'], 12, seed.get('ema12'))
+        df['ema26'] = _seeded_ewm(df['close'], 26, seed.get('ema26'))
+        df['macd_dif'] = df['ema12'] - df['ema26']
+        df['macd_dea'] = _seeded_ewm(df['macd_dif'], 9, seed.get('macd_dea'))
+        df['macd_hist'] = 2 * (df['macd_dif'] - df['macd_dea'])
+
+    # 没有续算状态时 EMA 从回看数据的第一根K线开始算, 再截取 since 之后; 有状态时只对新交易日续算
+    if seed is None: add_macd(out, {})
+    if since is not None:
+        out = out[out['trade_date'] >= pd.to_datetime(since)].copy()
+    if out.empty: return out
+    if seed is not None: add_macd(out, seed)
+    return out.replace([np.inf, -np.inf], np.nan)
+
+def _load_states(engine, touched):
+    """每只股票取 since 之前最后一条指标记录作为续算状态"""
+    sql = text(f"""
+        SELECT t.ts_code, t.since, s.trade_date, s.ema12, s.ema26, s.macd_dea,
+               EXISTS (SELECT 1 FROM {TECH_TABLE} e WHERE e.ts_code = t.ts_code) AS has_rows
+        FROM unnest(CAST(:codes AS text[]), CAST(:sinces AS date[])) AS t(ts_code, since)
+        LEFT JOIN LATERAL (
+            SELECT trade_date, ema12, ema26, macd_dea FROM {TECH_TABLE} i
+            WHERE i.ts_code = t.ts_code AND i.trade_date < t.since
+            ORDER BY i.trade_date DESC LIMIT 1
+        ) s ON true
+    """)
+    return pd.read_sql(sql, engine, params={
+        "codes": list(touched.keys()),
+        "sinces": [pd.to_datetime(d).date() for d in touched.values()],
+    })
+
+def _load_bars(engine, ts_code, since):
+    sql = text(f"""
+        SELECT * FROM (
+            SELECT trade_date, high, low, close FROM nt_market_data
+            WHERE ts_code = :code AND trade_date < :since
+            ORDER BY trade_date DESC LIMIT {LOOKBACK_BARS}
+        ) lookback
+        UNION ALL
+        SELECT trade_date, high, low, close FROM nt_market_data
+        WHERE ts_code = :code AND trade_date >= :since
+        ORDER BY trade_date ASC
+    """)
+    return pd.read_sql(sql, engine, params={"code": ts_code, "since": since})
+
+def _save(engine, ts_code, ind_df):
+    cols = ["ts_code", "trade_date"] + INDICATOR_COLS
+    ind_df = ind_df.assign(ts_code=ts_code)
+    ind_df['trade_date'] = ind_df['trade_date'].dt.date
+    values = [[None if pd.isna(v) else v for v in row] for row in ind_df[cols].itertuples(index=False)]
+    update_set = ", ".join(f"{c} = EXCLUDED.{c}" for c in INDICATOR_COLS)
+    insert_sql = f"INSERT INTO {TECH_TABLE} ({', '.join(cols)}) VALUES %s ON CONFLICT (ts_code, trade_date) DO UPDATE SET {update_set}"
+    with engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        db.execute_values(cursor, insert_sql, values)
+        conn.connection.commit()
+
+def refresh(engine, touched=None):
+    """
+    增量计算技术指标
+    touched: {ts_code: 最早新写入的交易日}；为 None 时对全部股票从头重算
+    """
+    ensure_tables(engine)
+    # 指标表为空 (首次部署) 时全量重算, 否则只有本次有新K线的股票会写入指标
+    if touched is not None:
+        with engine.connect() as conn:
+            if conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {TECH_TABLE})")).scalar():
+                print("ℹ️ [指标计算] 指标表为空，执行全量重算。")
+                touched = None
+    if touched is None:
+        codes = pd.read_sql("SELECT DISTINCT ts_code FROM nt_market_data", engine)['ts_code'].tolist()
+        touched = {c: FULL_SINCE for c in codes}
+    if not touched: return 0
+
+    states = _load_states(engine, touched)
+    total = 0
+    for state in tqdm(states.itertuples(index=False), total=len(states), desc="Indicators"):
+        try:
+            seed, since = None, state.since
+            if pd.notnull(state.trade_date):
+                seed = {"ema12": state.ema12, "ema26": state.ema26, "macd_dea": state.macd_dea}
+            elif not state.has_rows:
+                since = FULL_SINCE  # 该股还没有任何指标记录: 从头计算
+            bars = _load_bars(engine, state.ts_code, since)
+            if bars.empty: continue
+            ind_df = compute_indicators(bars, seed=seed, since=since)
+            if ind_df.empty: continue
+            _save(engine, state.ts_code, ind_df)
+            total += len(ind_df)
+        except Exception as e:
+            print(f"⚠️ [指标计算] {state.ts_code}: {e}")
+    return total
+
+# ================= 查询接口 =================
+def load_latest(engine, ts_code=None):
+    """读取最新指标；不传 ts_code 时返回全市场 (用于批量选股)"""
+    if ts_code is None:
+        return pd.read_sql(f"SELECT * FROM {LATEST_VIEW}", engine)
+    sql = text(f"SELECT * FROM {TECH_TABLE} WHERE ts_code = :code ORDER BY trade_date DESC LIMIT 1")
+    return pd.read_sql(sql, engine, params={"code": ts_code})
+
+if __name__ == "__main__":
+    engine = db.get_engine()
+    print(">>> 📈 正在全量重算技术指标...")
+    n = refresh(engine)
+    print(f"✅ 指标计算完成，写入 {n} 行。")
@@ -58,30 +58,15 @@ echo "============================================"
 
 cd $PROJECT_DIR
 
-# 🟢 [核心修改] 删除了清库操作，直接开始增量采集
+# 全部步骤由 pipeline.py 在同一进程内按依赖关系调度:
+#   迁移 -> 股东采集 -> 日线同步 / 基本面同步 (并发) -> 历史考古 -> 持仓分析
+# 输入数据无变化的阶段会自动跳过；需要自动修复时追加 --with-fix
 echo "--------------------------------------------"
-echo "📥 [1/5] 正在执行增量采集 (etl_ingest_tushare.py)..."
-$PYTHON_EXEC etl_ingest_tushare.py
-
-# [步骤 2] 运行全量考古
-echo "--------------------------------------------"
-echo "⏳ [2/5] 正在进行历史考古 (batch_history_trace.py)..."
-$PYTHON_EXEC batch_history_trace.py
-
-# [步骤 3] 初步分析
-echo "--------------------------------------------"
-echo "🧮 [3/5] 生成初步分析..."
-$PYTHON_EXEC analysis_engine.py
-
-# [步骤 4] 自动修复
-#echo "--------------------------------------------"
-#echo "🔧 [4/5] 执行自动修复..."
-#$PYTHON_EXEC fix_stock.py
-
-# [步骤 5] 最终分析
-echo "--------------------------------------------"
-echo "🏁 [5/5] 刷新最终报表..."
-$PYTHON_EXEC analysis_engine.py
+echo "🧩 正在执行数据更新流水线 (pipeline.py)..."
+if ! $PYTHON_EXEC pipeline.py; then
+    send_pushplus "任务失败" "pipeline.py 存在执行失败的阶段，详情请查看日志。"
+    exit 1
+fi
 
 echo "============================================"
 echo "🎉 更新完毕！"